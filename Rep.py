@@ -1,31 +1,77 @@
 from __future__ import annotations
 
-import io
-import re
-import unicodedata
-from datetime import date, datetime
-from urllib.parse import quote
-from zoneinfo import ZoneInfo
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Callable
 
 import altair as alt
+import numpy as np
 import pandas as pd
-import requests
 import streamlit as st
 
+from procesamiento import (
+    AGREGADOS_DESPACHOS,
+    ALMACEN_DESPACHOS,
+    COLUMNAS_DESPACHOS,
+    COLUMNAS_INDICE_FILTROS,
+    HOJA_BARRILES,
+    HOJA_INVENTARIO_LATAS,
+    HOJA_MOVIMIENTOS_LATAS,
+    LITROS_POR_LATA,
+    MEDICIONES_POR_ETAPA,
+    ORIGEN_DATOS,
+    ORIGEN_GOOGLE,
+    UMBRAL_ALERTA_PREDETERMINADO,
+    actualizacion_terminada,
+    activar_perfil_memoria,
+    capacidad_nominal_por_codigo,
+    cargar_hojas_concurrentes,
+    compactar_tablas_compartidas,
+    construir_cubo_despachos,
+    construir_despachos,
+    construir_resumen_despachos,
+    construir_resumen_inventario,
+    construir_serie_inventario,
+    consultar_agregados_despachos,
+    consultar_despachos,
+    contar_barriles_sin_litros,
+    errores_actualizacion,
+    guardar_almacen_despachos,
+    histograma_latencias,
+    hoja_vigente,
+    hoy_bogota,
+    huella_tabla,
+    iniciar_actualizador,
+    instrumentar,
+    inventario_barriles_en_fecha,
+    inventario_latas_en_fecha,
+    litros_redondeados,
+    medir_etapa,
+    obtener_inventario_barriles_actual,
+    opciones_almacen_despachos,
+    opciones_filtros_despachos,
+    preparador_hoja,
+    reiniciar_mediciones,
+    resumen_rendimiento,
+    solicitar_actualizacion,
+    variaciones_inventario,
+)
+
 
 # -----------------------------------------------------------------------------
 # CONFIGURACION GENERAL
 # -----------------------------------------------------------------------------
-SHEET_ID = "1FjQ8XBDwDdrlJZsNkQ6YyaygkHLhpKmfLBv6wd3uluY"
-SHEET_BASE_URL = f"https://docs.google.com/spreadsheets/d/{SHEET_ID}"
+# La lectura y preparacion de las hojas vive en procesamiento.py, sin
+# Streamlit; aqui se agregan las caches por sesion y la interfaz.
 
-HOJA_BARRILES = "DatosM"
-HOJA_MOVIMIENTOS_LATAS = "VLatas"
-HOJA_INVENTARIO_LATAS = "InventarioLatasTR"
+# Los datos de los graficos ya llegan agregados; la especificacion se serializa una vez
+alt.data_transformers.disable_max_rows()
 
-LITROS_POR_LATA = 0.330
-ESTADOS_DESPACHO = {"despacho", "despachado"}
-ESTADO_CUARTO_FRIO = "en cuarto frio"
+# Especificaciones Vega-Lite ya serializadas, compartidas entre sesiones (LRU)
+LIMITE_CACHE_GRAFICOS = 256
+_CACHE_GRAFICOS: OrderedDict[tuple, dict | None] = OrderedDict()
+_BLOQUEO_CACHE_GRAFICOS = threading.Lock()
 
 COLOR_PRIMARIO = "#20CB80"
 COLOR_DORADO = "#F2C14E"
@@ -33,7 +79,12 @@ COLOR_BARRIL = "#8B5E3C"
 COLOR_LATA = "#20CB80"
 COLOR_ALERTA = "#E45756"
 COLOR_OK = "#2A9D8F"
-UMBRAL_ALERTA_PREDETERMINADO = 200.0
+
+# Secciones del tablero: cada una es un fragmento que se re-ejecuta por separado
+PESTANA_INVENTARIO = "\U0001F4E6 Inventario actual"
+PESTANA_DESPACHOS = "\U0001F4CA Despachos y ventas"
+PESTANA_EVOLUCION = "\U0001F4C8 Evoluci\u00f3n del inventario"
+PERIODOS_DESPACHOS = ["Mes actual", "A\u00f1o actual", "Todo el historial", "Rango personalizado"]
 
 COLORES_PRESENTACION = {
     "Barril": COLOR_BARRIL,
@@ -90,397 +141,141 @@ ORDEN_DIAS = [
 
 
 # -----------------------------------------------------------------------------
-# FUNCIONES DE LIMPIEZA Y LECTURA
+# LECTURA DE LAS HOJAS
 # -----------------------------------------------------------------------------
-def normalizar_clave(valor: object) -> str:
-    """Normaliza texto para comparaciones: minusculas, sin tildes y sin espacios dobles."""
-    if valor is None or pd.isna(valor):
-        return ""
-    texto = str(valor).strip().lower()
-    texto = " ".join(texto.split())
-    return "".join(
-        caracter
-        for caracter in unicodedata.normalize("NFD", texto)
-        if unicodedata.category(caracter) != "Mn"
-    )
-
-
-def limpiar_texto(serie: pd.Series, valor_vacio: str = "") -> pd.Series:
-    resultado = serie.astype("string").fillna("").str.strip()
-    resultado = resultado.str.replace(r"\s+", " ", regex=True)
-    resultado = resultado.mask(
-        resultado.str.lower().isin({"nan", "none", "nat", "<na>"}), ""
-    )
-    if valor_vacio:
-        resultado = resultado.mask(resultado.eq(""), valor_vacio)
-    return resultado
-
-
-def columnas_relacionadas(df: pd.DataFrame, nombre_base: str) -> list[str]:
-    """Encuentra columnas duplicadas por pandas, por ejemplo Estado, Estado.1, Estado.2."""
-    base = normalizar_clave(nombre_base)
-    encontradas: list[str] = []
-    for columna in df.columns:
-        normalizada = normalizar_clave(columna)
-        if normalizada == base or normalizada.startswith(f"{base}."):
-            encontradas.append(columna)
-    return encontradas
-
-
-def combinar_columnas(df: pd.DataFrame, nombre_base: str) -> pd.Series:
-    """Devuelve el primer valor no vacio entre columnas equivalentes."""
-    columnas = columnas_relacionadas(df, nombre_base)
-    if not columnas:
-        return pd.Series("", index=df.index, dtype="string")
-
-    resultado = pd.Series(pd.NA, index=df.index, dtype="string")
-    for columna in columnas:
-        valores = limpiar_texto(df[columna])
-        valores = valores.mask(valores.eq(""), pd.NA)
-        resultado = resultado.fillna(valores)
-
-    return resultado.fillna("").astype("string")
-
-
-def convertir_fechas(serie: pd.Series) -> pd.Series:
-    """Convierte fechas de Sheets, incluyendo seriales numericos de Google/Excel."""
-    texto = limpiar_texto(serie)
-    numeros = pd.to_numeric(texto, errors="coerce")
-
-    resultado = pd.Series(pd.NaT, index=serie.index, dtype="datetime64[ns]")
-    es_serial = numeros.between(20000, 70000, inclusive="both").fillna(False)
-
-    if es_serial.any():
-        resultado.loc[es_serial] = pd.to_datetime(
-            numeros.loc[es_serial], unit="D", origin="1899-12-30", errors="coerce"
-        )
-
-    restantes = ~es_serial
-    if restantes.any():
-        resultado.loc[restantes] = pd.to_datetime(
-            texto.loc[restantes], dayfirst=True, errors="coerce"
-        )
-
-        # Respaldo para posibles fechas con mes primero.
-        faltantes = restantes & resultado.isna() & texto.ne("")
-        if faltantes.any():
-            resultado.loc[faltantes] = pd.to_datetime(
-                texto.loc[faltantes], dayfirst=False, errors="coerce"
-            )
-
-    return resultado
-
-
-def convertir_cantidades(serie: pd.Series) -> pd.Series:
-    """Convierte cantidades enteras y reconoce 1.200 como 1200."""
-    texto = limpiar_texto(serie).str.replace(" ", "", regex=False)
-
-    # Formato colombiano/espanol de miles: 1.200, 12.500, etc.
-    miles_punto = texto.str.match(r"^-?\d{1,3}(?:\.\d{3})+$", na=False)
-    texto = texto.where(~miles_punto, texto.str.replace(".", "", regex=False))
-
-    # Si quedan comas, se interpretan como separador decimal.
-    texto = texto.str.replace(",", ".", regex=False)
-    return pd.to_numeric(texto, errors="coerce")
-
-
-def limpiar_codigo(serie: pd.Series) -> pd.Series:
-    codigo = limpiar_texto(serie)
-    codigo = codigo.str.replace(r"\.0$", "", regex=True)
-    codigo = codigo.str.replace(r"[^0-9]", "", regex=True)
-    return codigo
-
-
-def limpiar_lote(serie: pd.Series) -> pd.Series:
-    lote = limpiar_texto(serie)
-    lote = lote.str.replace(r"\.0$", "", regex=True)
-    return lote.mask(lote.str.lower().eq("nan"), "")
-
-
-def extraer_decimal(serie: pd.Series) -> pd.Series:
-    texto = limpiar_texto(serie).str.replace(",", ".", regex=False)
-    numero = texto.str.extract(r"(-?\d+(?:\.\d+)?)", expand=False)
-    return pd.to_numeric(numero, errors="coerce")
-
-
-def litros_mencionados_en_observacion(serie: pd.Series) -> pd.Series:
-    texto = limpiar_texto(serie).str.replace(",", ".", regex=False)
-    numero = texto.str.extract(
-        r"(?i)(\d+(?:\.\d+)?)\s*(?:l|lt|lts|litro|litros)\b",
-        expand=False,
-    )
-    return pd.to_numeric(numero, errors="coerce")
-
-
-def capacidad_nominal_por_codigo(codigos: pd.Series) -> pd.Series:
-    prefijos = codigos.astype("string").str[:2]
-    return prefijos.map({"20": 20.0, "30": 30.0, "58": 58.0}).fillna(0.0)
+# Las hojas vigentes viven en procesamiento y las reemplaza el hilo de
+# actualizacion del proceso; las sesiones nunca esperan una descarga salvo la
+# primera vez. Aqui solo se sigue la actualizacion que pidio la sesion.
+@st.fragment(run_every=2)
+def vigilar_actualizacion() -> None:
+    """Recarga la pagina cuando termina la actualizacion que pidio esta sesion."""
+    solicitud = st.session_state.get("actualizacion_solicitada")
+    if solicitud is None:
+        return
+    if actualizacion_terminada(solicitud):
+        del st.session_state["actualizacion_solicitada"]
+        st.rerun(scope="app")
+    st.caption("\u23F3 Actualizando datos en segundo plano...")
 
 
-def calcular_litros_barril(
-    codigos: pd.Series,
-    capacidades: pd.Series,
-    observaciones: pd.Series,
-) -> pd.Series:
+# -----------------------------------------------------------------------------
+# DATOS DERIVADOS POR VERSION
+# -----------------------------------------------------------------------------
+# Las tablas limpias y cruzadas se calculan una sola vez por version de los
+# datos (huella del snapshot) y se comparten entre todas las sesiones. Los
+# parametros con guion bajo no entran en la clave de la cache.
+# derivar_tablas_compactas devuelve las mismas tablas a todas las sesiones
+# (sin copiarlas ni serializarlas): son de solo lectura.
+@st.cache_resource(max_entries=4, show_spinner=False)
+def derivar_tablas_compactas(
+    huella_barriles: str,
+    huella_latas: str,
+    _df_barriles: pd.DataFrame,
+    _df_latas: pd.DataFrame,
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     """
-    Prioridad para calcular litros:
-    1. Litros indicados en observaciones (ej. "Barril con 14 lt").
-    2. Columna Capacidad, si contiene un valor valido.
-    3. Prefijo del codigo: 20, 30 o 58 litros.
+    Devuelve barriles, movimientos de latas, inventario de barriles y
+    despachos en forma compacta, con un diccionario de categorias comun.
+    Con el almacen de despachos la historia se guarda en SQLite (solo los
+    despachos de las filas agregadas desde la version guardada) y aqui queda
+    una tabla vacia con sus columnas.
     """
-    litros_observacion = litros_mencionados_en_observacion(observaciones)
-    litros_capacidad = extraer_decimal(capacidades)
-    litros_capacidad = litros_capacidad.where(litros_capacidad.between(1, 100))
-    litros_codigo = capacidad_nominal_por_codigo(codigos)
-
-    litros = litros_observacion.copy()
-    litros = litros.where(litros.notna(), litros_capacidad)
-    litros = litros.where(litros.notna(), litros_codigo.where(litros_codigo.ne(0)))
-    return pd.to_numeric(litros, errors="coerce").fillna(0.0)
-
-
-@st.cache_data(ttl=120, show_spinner=False)
-def leer_hoja(nombre_hoja: str) -> pd.DataFrame:
-    """Lee una pestaña publica de Google Sheets como CSV."""
-    nombre_codificado = quote(nombre_hoja, safe="")
-    url = f"{SHEET_BASE_URL}/gviz/tq?tqx=out:csv&sheet={nombre_codificado}"
-
-    respuesta = requests.get(
-        url,
-        timeout=30,
-        headers={"User-Agent": "Mozilla/5.0"},
-    )
-    respuesta.raise_for_status()
-    respuesta.encoding = "utf-8"
-
-    contenido = respuesta.text.lstrip()
-    if contenido.lower().startswith("<!doctype html") or contenido.lower().startswith("<html"):
-        raise RuntimeError(
-            f"Google Sheets no devolvio un CSV para la hoja '{nombre_hoja}'. "
-            "Verifica que el archivo sea accesible desde la aplicacion."
-        )
+    df_barriles, df_latas = compactar_tablas_compartidas(_df_barriles, _df_latas)
+    inventario_barriles = obtener_inventario_barriles_actual(df_barriles)
+    if ALMACEN_DESPACHOS:
+        guardar_almacen_despachos(df_barriles, df_latas)
+        despachos = pd.DataFrame(columns=COLUMNAS_DESPACHOS)
+    else:
+        despachos = construir_despachos(df_barriles, df_latas)
+    return df_barriles, df_latas, inventario_barriles, despachos
 
-    df = pd.read_csv(
-        io.StringIO(respuesta.text),
-        dtype=str,
-        keep_default_na=False,
-    )
-    df.columns = [str(columna).strip() for columna in df.columns]
-    return df
 
+@st.cache_data(max_entries=4, show_spinner=False)
+def cubo_despachos_por_version(version: str, _despachos: pd.DataFrame) -> pd.DataFrame:
+    return construir_cubo_despachos(_despachos)
 
-def cargar_hoja_segura(nombre_hoja: str) -> tuple[pd.DataFrame, str | None]:
-    try:
-        return leer_hoja(nombre_hoja), None
-    except Exception as exc:  # La app puede continuar mostrando las otras fuentes.
-        return pd.DataFrame(), str(exc)
 
+@st.cache_data(max_entries=4, show_spinner=False)
+def opciones_filtros_por_version(version: str, _despachos: pd.DataFrame) -> dict | None:
+    if ALMACEN_DESPACHOS:
+        return opciones_almacen_despachos()
+    return opciones_filtros_despachos(_despachos)
 
-# -----------------------------------------------------------------------------
-# PREPARACION DE DATOS
-# -----------------------------------------------------------------------------
-def preparar_barriles(df_origen: pd.DataFrame) -> pd.DataFrame:
-    columnas_salida = [
-        "Fecha",
-        "Codigo",
-        "Lote",
-        "Estilo",
-        "Estado",
-        "Estado_normalizado",
-        "Cliente",
-        "Responsable",
-        "Observaciones",
-        "Litros",
-    ]
-    if df_origen.empty:
-        return pd.DataFrame(columns=columnas_salida)
-
-    codigo = limpiar_codigo(combinar_columnas(df_origen, "Codigo"))
-    observaciones = limpiar_texto(combinar_columnas(df_origen, "Observaciones"))
-    capacidad = combinar_columnas(df_origen, "Capacidad")
-    estado = limpiar_texto(combinar_columnas(df_origen, "Estado"))
-
-    df = pd.DataFrame(
-        {
-            "Fecha": convertir_fechas(combinar_columnas(df_origen, "Marca temporal")),
-            "Codigo": codigo,
-            "Lote": limpiar_lote(combinar_columnas(df_origen, "Lote")),
-            "Estilo": limpiar_texto(
-                combinar_columnas(df_origen, "Estilo"), valor_vacio="Sin definir"
-            ),
-            "Estado": estado,
-            "Cliente": limpiar_texto(
-                combinar_columnas(df_origen, "Cliente"), valor_vacio="Sin definir"
-            ),
-            "Responsable": limpiar_texto(
-                combinar_columnas(df_origen, "Responsable"), valor_vacio="Sin definir"
-            ),
-            "Observaciones": observaciones,
-        }
-    )
 
-    df["Estado_normalizado"] = df["Estado"].map(normalizar_clave)
-    df["Litros"] = calcular_litros_barril(codigo, capacidad, observaciones)
-    df = df[df["Fecha"].notna() & df["Codigo"].ne("")].copy()
-    return df[columnas_salida]
+@st.cache_data(max_entries=32, show_spinner=False)
+def agregados_almacen_por_criterios(version: str, criterios: tuple) -> dict[str, pd.DataFrame]:
+    return consultar_agregados_despachos(criterios)
 
 
-def preparar_movimientos_latas(df_origen: pd.DataFrame) -> pd.DataFrame:
-    columnas_salida = [
-        "Fecha",
-        "Estilo",
-        "Cantidad",
-        "Lote",
-        "Cliente",
-        "Responsable",
-        "Estado",
-        "Estado_normalizado",
-        "Litros",
-    ]
-    if df_origen.empty:
-        return pd.DataFrame(columns=columnas_salida)
+@st.cache_data(max_entries=32, show_spinner=False)
+def barriles_sin_litros_por_criterios(version: str, criterios: tuple) -> int:
+    return contar_barriles_sin_litros(criterios)
 
-    estado = limpiar_texto(combinar_columnas(df_origen, "Estado"))
-    cantidad = convertir_cantidades(combinar_columnas(df_origen, "Cantidad"))
 
-    df = pd.DataFrame(
-        {
-            "Fecha": convertir_fechas(combinar_columnas(df_origen, "Marca temporal")),
-            "Estilo": limpiar_texto(
-                combinar_columnas(df_origen, "Estilo"), valor_vacio="Sin definir"
-            ),
-            "Cantidad": cantidad,
-            "Lote": limpiar_lote(combinar_columnas(df_origen, "Lote")),
-            "Cliente": limpiar_texto(
-                combinar_columnas(df_origen, "Cliente"), valor_vacio="Sin definir"
-            ),
-            "Responsable": limpiar_texto(
-                combinar_columnas(df_origen, "Responsable"), valor_vacio="Sin definir"
-            ),
-            "Estado": estado,
-        }
-    )
+@st.cache_data(max_entries=4, show_spinner=False)
+def detalle_almacen_por_criterios(version: str, criterios: tuple) -> pd.DataFrame:
+    return consultar_despachos(criterios)
 
-    df["Estado_normalizado"] = df["Estado"].map(normalizar_clave)
-    df["Litros"] = df["Cantidad"].fillna(0) * LITROS_POR_LATA
-    df = df[
-        df["Fecha"].notna()
-        & df["Cantidad"].notna()
-        & df["Cantidad"].gt(0)
-    ].copy()
-    return df[columnas_salida]
-
-
-def preparar_inventario_latas(df_origen: pd.DataFrame) -> pd.DataFrame:
-    columnas_salida = [
-        "Estilo",
-        "Lote",
-        "Ingresadas",
-        "Despachadas",
-        "Devoluciones",
-        "Bajas",
-        "Disponible",
-        "Litros",
-    ]
-    if df_origen.empty:
-        return pd.DataFrame(columns=columnas_salida)
-
-    ingresadas = convertir_cantidades(combinar_columnas(df_origen, "Ingresadas")).fillna(0)
-    despachadas = convertir_cantidades(combinar_columnas(df_origen, "Despachadas")).fillna(0)
-    devoluciones = convertir_cantidades(combinar_columnas(df_origen, "Devoluciones")).fillna(0)
-    bajas = convertir_cantidades(combinar_columnas(df_origen, "Bajas")).fillna(0)
-    disponible = convertir_cantidades(combinar_columnas(df_origen, "Disponible"))
-
-    # Respaldo en caso de que la columna Disponible no exista o este vacia.
-    disponible_calculado = ingresadas - despachadas + devoluciones - bajas
-    disponible = disponible.fillna(disponible_calculado)
-
-    df = pd.DataFrame(
-        {
-            "Estilo": limpiar_texto(
-                combinar_columnas(df_origen, "Estilo"), valor_vacio="Sin definir"
-            ),
-            "Lote": limpiar_lote(combinar_columnas(df_origen, "Lote")),
-            "Ingresadas": ingresadas,
-            "Despachadas": despachadas,
-            "Devoluciones": devoluciones,
-            "Bajas": bajas,
-            "Disponible": disponible,
-        }
-    )
-    df["Litros"] = df["Disponible"].fillna(0) * LITROS_POR_LATA
-    df = df[df["Disponible"].fillna(0).gt(0)].copy()
-    return df[columnas_salida]
 
-
-def obtener_inventario_barriles_actual(df_barriles: pd.DataFrame) -> pd.DataFrame:
-    if df_barriles.empty:
-        return df_barriles.copy()
-
-    ultimos = (
-        df_barriles.sort_values("Fecha", ascending=False)
-        .drop_duplicates(subset="Codigo", keep="first")
-        .copy()
+@st.cache_data(max_entries=4, show_spinner=False)
+def eventos_por_version(
+    version: str,
+    _df_barriles: pd.DataFrame,
+    _df_latas: pd.DataFrame,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Historia de barriles y de latas ordenada por fecha para consultas a una fecha."""
+    return (
+        _df_barriles.sort_values("Fecha", kind="stable", ignore_index=True),
+        _df_latas.sort_values("Fecha", kind="stable", ignore_index=True),
+    )
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def inventario_en_fecha_por_version(
+    version: str,
+    fecha: date,
+    _df_barriles: pd.DataFrame,
+    _df_latas: pd.DataFrame,
+    _inventario_latas: pd.DataFrame,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Inventario de barriles y latas al cierre del dia `fecha`."""
+    eventos_barriles, eventos_latas = eventos_por_version(version, _df_barriles, _df_latas)
+    corte = pd.Timestamp(fecha) + pd.Timedelta(days=1)
+    return (
+        inventario_barriles_en_fecha(eventos_barriles, corte),
+        inventario_latas_en_fecha(_inventario_latas, eventos_latas, corte),
     )
-    return ultimos[ultimos["Estado_normalizado"].eq(ESTADO_CUARTO_FRIO)].copy()
 
 
-def construir_despachos(
-    df_barriles: pd.DataFrame,
-    df_latas: pd.DataFrame,
+@st.cache_data(max_entries=4, show_spinner=False)
+def serie_inventario_por_version(
+    version: str,
+    hasta: date,
+    _df_barriles: pd.DataFrame,
+    _df_latas: pd.DataFrame,
+    _inventario_latas: pd.DataFrame,
 ) -> pd.DataFrame:
-    columnas = [
-        "Fecha",
-        "Tipo",
-        "Cliente",
-        "Estilo",
-        "Codigo",
-        "Lote",
-        "Barriles",
-        "Latas",
-        "Litros_barriles",
-        "Litros_latas",
-        "Litros_totales",
-        "Responsable",
-        "Observaciones",
-    ]
-    partes: list[pd.DataFrame] = []
+    cambios_barriles, cambios_latas = variaciones_inventario(_df_barriles, _df_latas)
+    return construir_serie_inventario(cambios_barriles, cambios_latas, _inventario_latas, hasta)
 
-    if not df_barriles.empty:
-        barriles = df_barriles[
-            df_barriles["Estado_normalizado"].isin(ESTADOS_DESPACHO)
-        ].copy()
-        if not barriles.empty:
-            barriles["Tipo"] = "Barril"
-            barriles["Barriles"] = 1
-            barriles["Latas"] = 0.0
-            barriles["Litros_barriles"] = barriles["Litros"]
-            barriles["Litros_latas"] = 0.0
-            barriles["Litros_totales"] = barriles["Litros"]
-            partes.append(barriles[columnas])
-
-    if not df_latas.empty:
-        # Estado vacio se considera despacho historico, igual que en el inventario.
-        es_despacho = (
-            df_latas["Estado_normalizado"].isin(ESTADOS_DESPACHO)
-            | df_latas["Estado_normalizado"].eq("")
-        )
-        latas = df_latas[es_despacho].copy()
-        if not latas.empty:
-            latas["Tipo"] = "Lata"
-            latas["Codigo"] = ""
-            latas["Barriles"] = 0
-            latas["Latas"] = latas["Cantidad"]
-            latas["Litros_barriles"] = 0.0
-            latas["Litros_latas"] = latas["Litros"]
-            latas["Litros_totales"] = latas["Litros"]
-            latas["Observaciones"] = ""
-            partes.append(latas[columnas])
 
-    if not partes:
-        return pd.DataFrame(columns=columnas)
+@st.cache_data(max_entries=16, show_spinner=False)
+def resumen_inventario_por_version(
+    version: str,
+    umbral_alerta: float,
+    _inventario_barriles: pd.DataFrame,
+    _inventario_latas: pd.DataFrame,
+) -> pd.DataFrame:
+    return construir_resumen_inventario(_inventario_barriles, _inventario_latas, umbral_alerta)
+
 
-    return pd.concat(partes, ignore_index=True).sort_values("Fecha")
+@st.cache_data(max_entries=8, show_spinner=False)
+def indice_filtros_por_version(
+    version: str,
+    _df: pd.DataFrame,
+    columna_fecha: str,
+) -> dict:
+    return construir_indice_filtros(_df, columna_fecha)
 
 
 # -----------------------------------------------------------------------------
@@ -639,29 +434,11 @@ def mostrar_encabezado() -> None:
     )
 
 
-def hoy_bogota() -> date:
-    try:
-        return datetime.now(ZoneInfo("America/Bogota")).date()
-    except Exception:
-        return datetime.now().date()
-
-
 def formato_numero(valor: float, decimales: int = 0) -> str:
     texto = f"{valor:,.{decimales}f}"
     return texto.replace(",", "X").replace(".", ",").replace("X", ".")
 
 
-def normalizar_tipos_resumen(df: pd.DataFrame) -> pd.DataFrame:
-    resultado = df.copy()
-    for columna in ["Barriles", "Latas", "Movimientos"]:
-        if columna in resultado.columns:
-            resultado[columna] = resultado[columna].fillna(0).round().astype(int)
-    for columna in ["Litros barriles", "Litros latas", "Litros totales", "Litros"]:
-        if columna in resultado.columns:
-            resultado[columna] = resultado[columna].fillna(0).round(2)
-    return resultado
-
-
 def escala_estilos(valores: list[str] | pd.Series) -> alt.Scale:
     estilos = list(dict.fromkeys(str(valor) for valor in list(valores) if str(valor).strip()))
     colores = [
@@ -705,11 +482,58 @@ def estilizar_grafico(grafico: alt.TopLevelMixin) -> alt.TopLevelMixin:
     )
 
 
-def mostrar_grafico(grafico: alt.TopLevelMixin | None) -> None:
-    if grafico is None:
+def especificacion_grafico(
+    version: str,
+    funcion: Callable[..., alt.TopLevelMixin | None],
+    *args,
+    **kwargs,
+) -> dict | None:
+    """
+    Devuelve la especificacion Vega-Lite estilizada de `funcion(*args, **kwargs)`.
+    Los DataFrames no forman parte de la clave: `version` debe identificar los
+    datos y filtros que los produjeron; el resto de parametros si se incluye.
+    """
+    clave = (
+        version,
+        funcion.__qualname__,
+        tuple(valor for valor in args if not isinstance(valor, pd.DataFrame)),
+        tuple(
+            sorted(
+                (nombre, valor)
+                for nombre, valor in kwargs.items()
+                if not isinstance(valor, pd.DataFrame)
+            )
+        ),
+    )
+    with _BLOQUEO_CACHE_GRAFICOS:
+        if clave in _CACHE_GRAFICOS:
+            _CACHE_GRAFICOS.move_to_end(clave)
+            return _CACHE_GRAFICOS[clave]
+
+    filas = next((len(valor) for valor in args if isinstance(valor, pd.DataFrame)), None)
+    with medir_etapa(funcion.__name__, filas):
+        grafico = funcion(*args, **kwargs)
+        especificacion = None if grafico is None else estilizar_grafico(grafico).to_dict()
+
+    with _BLOQUEO_CACHE_GRAFICOS:
+        _CACHE_GRAFICOS[clave] = especificacion
+        _CACHE_GRAFICOS.move_to_end(clave)
+        while len(_CACHE_GRAFICOS) > LIMITE_CACHE_GRAFICOS:
+            _CACHE_GRAFICOS.popitem(last=False)
+    return especificacion
+
+
+def mostrar_grafico(
+    version: str,
+    funcion: Callable[..., alt.TopLevelMixin | None],
+    *args,
+    **kwargs,
+) -> None:
+    especificacion = especificacion_grafico(version, funcion, *args, **kwargs)
+    if especificacion is None:
         st.info("No hay datos suficientes para generar este gr\u00e1fico.")
         return
-    st.altair_chart(estilizar_grafico(grafico), use_container_width=True)
+    st.vega_lite_chart(especificacion, use_container_width=True)
 
 
 def mostrar_metricas(
@@ -742,7 +566,7 @@ def crear_grafico_dona(
         return None
 
     agrupado = (
-        df.groupby(categoria, as_index=False)[valor]
+        df.groupby(categoria, as_index=False, observed=True)[valor]
         .sum()
         .sort_values(valor, ascending=False)
     )
@@ -795,11 +619,11 @@ def grafico_litros_por_categoria(
 
     datos = df.copy()
     if top_n:
-        principales = datos.groupby(categoria)["Litros_totales"].sum().nlargest(top_n).index
+        principales = datos.groupby(categoria, observed=True)["Litros_totales"].sum().nlargest(top_n).index
         datos = datos[datos[categoria].isin(principales)]
 
     agrupado = (
-        datos.groupby([categoria, "Tipo"], as_index=False)["Litros_totales"]
+        datos.groupby([categoria, "Tipo"], as_index=False, observed=True)["Litros_totales"]
         .sum()
         .rename(columns={"Litros_totales": "Litros"})
     )
@@ -827,127 +651,233 @@ def grafico_litros_por_categoria(
     )
 
 
-def aplicar_filtros_despachos(
+def construir_indice_filtros(df: pd.DataFrame, columna_fecha: str = "Fecha") -> dict:
+    """
+    Indice para filtrar despachos o el cubo sin recorrer la tabla completa:
+    las filas ordenadas por dia (un rango de fechas es un tramo contiguo) y,
+    para Cliente, Estilo y Tipo, las posiciones de las filas de cada valor.
+    """
+    fechas = df[columna_fecha].to_numpy(dtype="datetime64[ns]")
+    orden = np.argsort(fechas, kind="stable")
+    ordenada = df.iloc[orden]
+    return {
+        "orden": orden,
+        "dias": fechas[orden].astype("datetime64[D]"),
+        "posiciones": {
+            columna: {
+                str(valor): np.asarray(posiciones)
+                for valor, posiciones in ordenada.groupby(
+                    columna, observed=True, sort=False
+                ).indices.items()
+            }
+            for columna in COLUMNAS_INDICE_FILTROS
+            if columna in ordenada.columns
+        },
+    }
+
+
+def filtrar_despachos(
     df: pd.DataFrame,
-) -> tuple[pd.DataFrame, date, date, int]:
-    if df.empty:
-        hoy = hoy_bogota()
-        return df, hoy, hoy, 10
+    indice: dict,
+    fecha_inicio: date,
+    fecha_fin: date,
+    clientes: list[str],
+    estilos: list[str],
+    presentacion: str,
+) -> pd.DataFrame:
+    """Filtra despachos o el cubo de despachos con los criterios de la barra lateral."""
+    dias = indice["dias"]
+    inicio = int(np.searchsorted(dias, np.datetime64(fecha_inicio, "D"), side="left"))
+    fin = int(np.searchsorted(dias, np.datetime64(fecha_fin, "D"), side="right"))
+
+    criterios = {
+        "Cliente": clientes,
+        "Estilo": estilos,
+        "Tipo": [presentacion] if presentacion != "Todas" else [],
+    }
+    seleccion: np.ndarray | None = None
+    for columna, valores in criterios.items():
+        if not valores:
+            continue
+        por_valor = indice["posiciones"].get(columna, {})
+        posiciones = np.concatenate(
+            [por_valor.get(str(valor), np.empty(0, dtype=np.intp)) for valor in valores]
+        )
+        posiciones = posiciones[(posiciones >= inicio) & (posiciones < fin)]
+        seleccion = (
+            posiciones
+            if seleccion is None
+            else np.intersect1d(seleccion, posiciones, assume_unique=True)
+        )
+
+    if seleccion is None:
+        return df.iloc[indice["orden"][inicio:fin]]
+    return df.iloc[indice["orden"][np.sort(seleccion)]]
+
+
+def rerun_seccion(seccion: str, pestana: str) -> None:
+    """
+    Callback de los widgets laterales: re-ejecuta solo el fragmento de la
+    seccion que depende de ellos. Si la seccion no esta visible no hay nada
+    que redibujar y se deja correr el script completo.
+    """
+    if st.session_state.get("pestana_principal", PESTANA_INVENTARIO) == pestana:
+        st.rerun(seccion)
 
-    minimo = df["Fecha"].min().date()
-    maximo = df["Fecha"].max().date()
+
+def mostrar_filtros_despachos(opciones: dict | None) -> None:
+    """
+    Dibuja los filtros de despachos; sus valores se leen desde session_state.
+    `opciones` trae el rango de fechas, los clientes y los estilos disponibles.
+    """
+    if opciones is None:
+        return
+
+    minimo = opciones["minimo"]
+    maximo = opciones["maximo"]
     hoy = hoy_bogota()
+    solo_despachos = {"on_change": rerun_seccion, "args": ("despachos", PESTANA_DESPACHOS)}
 
     st.sidebar.markdown("---")
     st.sidebar.subheader("\U0001F50E Filtros de despachos")
-    periodo = st.sidebar.selectbox(
-        "Periodo",
-        ["Mes actual", "A\u00f1o actual", "Todo el historial", "Rango personalizado"],
-        key="periodo_despachos",
-    )
-
-    if periodo == "Mes actual":
-        fecha_inicio = date(hoy.year, hoy.month, 1)
-        fecha_fin = hoy
-    elif periodo == "A\u00f1o actual":
-        fecha_inicio = date(hoy.year, 1, 1)
-        fecha_fin = hoy
-    elif periodo == "Todo el historial":
-        fecha_inicio = minimo
-        fecha_fin = maximo
-    else:
-        fecha_inicio = st.sidebar.date_input(
+    # El periodo cambia los widgets visibles, por eso re-ejecuta todo el script.
+    periodo = st.sidebar.selectbox("Periodo", PERIODOS_DESPACHOS, key="periodo_despachos")
+    if periodo == "Rango personalizado":
+        st.sidebar.date_input(
             "Fecha inicial",
             value=max(minimo, date(hoy.year, hoy.month, 1)),
             min_value=minimo,
             max_value=maximo,
             key="fecha_inicio_despachos",
+            **solo_despachos,
         )
-        fecha_fin = st.sidebar.date_input(
+        st.sidebar.date_input(
             "Fecha final",
             value=min(hoy, maximo),
             min_value=minimo,
             max_value=maximo,
             key="fecha_fin_despachos",
+            **solo_despachos,
         )
 
-    if fecha_inicio > fecha_fin:
-        fecha_inicio, fecha_fin = fecha_fin, fecha_inicio
-
-    clientes = sorted(df["Cliente"].dropna().astype(str).unique().tolist())
-    estilos = sorted(df["Estilo"].dropna().astype(str).unique().tolist())
-
-    clientes_seleccionados = st.sidebar.multiselect(
+    st.sidebar.multiselect(
         "Clientes (vac\u00edo = todos)",
-        clientes,
+        opciones["clientes"],
         key="clientes_despachos",
+        **solo_despachos,
     )
-    estilos_seleccionados = st.sidebar.multiselect(
+    st.sidebar.multiselect(
         "Estilos (vac\u00edo = todos)",
-        estilos,
+        opciones["estilos"],
         key="estilos_despachos",
+        **solo_despachos,
     )
-    presentacion = st.sidebar.selectbox(
+    st.sidebar.selectbox(
         "Presentaci\u00f3n",
         ["Todas", "Barril", "Lata"],
         key="presentacion_despachos",
+        **solo_despachos,
     )
-    top_n = st.sidebar.slider(
+    st.sidebar.slider(
         "Elementos en rankings",
         min_value=5,
         max_value=25,
         value=10,
         step=1,
         key="top_n_despachos",
+        **solo_despachos,
     )
 
-    filtrado = df[df["Fecha"].dt.date.between(fecha_inicio, fecha_fin, inclusive="both")].copy()
-    if clientes_seleccionados:
-        filtrado = filtrado[filtrado["Cliente"].isin(clientes_seleccionados)]
-    if estilos_seleccionados:
-        filtrado = filtrado[filtrado["Estilo"].isin(estilos_seleccionados)]
-    if presentacion != "Todas":
-        filtrado = filtrado[filtrado["Tipo"].eq(presentacion)]
-
-    return filtrado, fecha_inicio, fecha_fin, top_n
 
+def leer_criterios_despachos(minimo: date, maximo: date) -> tuple[tuple, int]:
+    """
+    Criterios de la barra lateral (fecha inicial, fecha final, clientes,
+    estilos y presentacion) y tamano de los rankings.
+    """
+    hoy = hoy_bogota()
+    estado = st.session_state
+    periodo = estado.get("periodo_despachos", PERIODOS_DESPACHOS[0])
 
-# -----------------------------------------------------------------------------
-# GRAFICOS Y VISTA DE INVENTARIO
-# -----------------------------------------------------------------------------
-def construir_resumen_inventario(
-    inventario_barriles: pd.DataFrame,
-    inventario_latas: pd.DataFrame,
-    umbral_alerta: float,
-) -> pd.DataFrame:
-    if inventario_barriles.empty:
-        resumen_barriles = pd.DataFrame(columns=["Estilo", "Barriles", "Litros barriles"])
+    if periodo == "Mes actual":
+        fecha_inicio = date(hoy.year, hoy.month, 1)
+        fecha_fin = hoy
+    elif periodo == "A\u00f1o actual":
+        fecha_inicio = date(hoy.year, 1, 1)
+        fecha_fin = hoy
+    elif periodo == "Todo el historial":
+        fecha_inicio = minimo
+        fecha_fin = maximo
     else:
-        resumen_barriles = (
-            inventario_barriles.groupby("Estilo", as_index=False)
-            .agg(Barriles=("Codigo", "count"), **{"Litros barriles": ("Litros", "sum")})
-        )
+        fecha_inicio = estado.get("fecha_inicio_despachos", max(minimo, date(hoy.year, hoy.month, 1)))
+        fecha_fin = estado.get("fecha_fin_despachos", min(hoy, maximo))
 
-    if inventario_latas.empty:
-        resumen_latas = pd.DataFrame(columns=["Estilo", "Latas", "Litros latas"])
-    else:
-        resumen_latas = (
-            inventario_latas.groupby("Estilo", as_index=False)
-            .agg(Latas=("Disponible", "sum"), **{"Litros latas": ("Litros", "sum")})
-        )
+    if fecha_inicio > fecha_fin:
+        fecha_inicio, fecha_fin = fecha_fin, fecha_inicio
 
-    resumen = pd.merge(resumen_barriles, resumen_latas, on="Estilo", how="outer").fillna(0)
-    if resumen.empty:
-        return resumen
+    clientes_seleccionados = estado.get("clientes_despachos", [])
+    estilos_seleccionados = estado.get("estilos_despachos", [])
+    presentacion = estado.get("presentacion_despachos", "Todas")
+    top_n = int(estado.get("top_n_despachos", 10))
 
-    resumen["Litros totales"] = resumen["Litros barriles"] + resumen["Litros latas"]
-    resumen["Estado inventario"] = resumen["Litros totales"].apply(
-        lambda valor: "\u26A0\uFE0F Bajo" if valor < umbral_alerta else "\u2705 Adecuado"
+    criterios = (
+        fecha_inicio,
+        fecha_fin,
+        clientes_seleccionados,
+        estilos_seleccionados,
+        presentacion,
     )
-    resumen = normalizar_tipos_resumen(resumen)
-    return resumen.sort_values("Litros totales", ascending=False)
+    return criterios, top_n
 
 
+@instrumentar
+def aplicar_filtros_despachos(
+    df: pd.DataFrame,
+    cubo: pd.DataFrame,
+    version: str,
+) -> tuple[pd.DataFrame, pd.DataFrame, date, date, int, str]:
+    """
+    Devuelve los despachos y el cubo filtrados, el periodo, el tamano de los
+    rankings y la clave que identifica esa seleccion para cachear graficos.
+    """
+    hoy = hoy_bogota()
+    if df.empty:
+        return df, cubo, hoy, hoy, 10, f"{version}|vacio"
+
+    criterios, top_n = leer_criterios_despachos(df["Fecha"].min().date(), df["Fecha"].max().date())
+    fecha_inicio, fecha_fin = criterios[:2]
+    filtrado = filtrar_despachos(
+        df, indice_filtros_por_version(f"{version}|despachos", df, "Fecha"), *criterios
+    )
+    cubo_filtrado = filtrar_despachos(
+        cubo, indice_filtros_por_version(f"{version}|cubo", cubo, "Dia"), *criterios
+    )
+    return filtrado, cubo_filtrado, fecha_inicio, fecha_fin, top_n, f"{version}|{criterios!r}"
+
+
+@instrumentar
+def aplicar_filtros_almacen(
+    opciones: dict | None,
+    version: str,
+) -> tuple[tuple | None, dict[str, pd.DataFrame], date, date, int, str]:
+    """
+    Igual que aplicar_filtros_despachos, pero con el almacen de despachos:
+    devuelve los criterios y los agregados que calcula SQL en lugar de tablas
+    filtradas en memoria.
+    """
+    if opciones is None:
+        hoy = hoy_bogota()
+        vacio = construir_cubo_despachos(pd.DataFrame())
+        return None, dict.fromkeys(AGREGADOS_DESPACHOS, vacio), hoy, hoy, 10, f"{version}|vacio"
+
+    criterios, top_n = leer_criterios_despachos(opciones["minimo"], opciones["maximo"])
+    agregados = agregados_almacen_por_criterios(version, criterios)
+    fecha_inicio, fecha_fin = criterios[:2]
+    return criterios, agregados, fecha_inicio, fecha_fin, top_n, f"{version}|{criterios!r}"
+
+
+# -----------------------------------------------------------------------------
+# GRAFICOS Y VISTA DE INVENTARIO
+# -----------------------------------------------------------------------------
 def grafico_inventario_apilado(resumen: pd.DataFrame) -> alt.TopLevelMixin | None:
     if resumen.empty:
         return None
@@ -1077,7 +1007,7 @@ def grafico_capacidad_barriles(
         lambda valor: f"{int(valor)} L" if valor > 0 else "Otra"
     )
     agrupado = (
-        datos.groupby(["Estilo", "Capacidad"], as_index=False)
+        datos.groupby(["Estilo", "Capacidad"], as_index=False, observed=True)
         .agg(Barriles=("Codigo", "count"))
     )
     return (
@@ -1093,12 +1023,46 @@ def grafico_capacidad_barriles(
     )
 
 
+@st.fragment(key="inventario")
+def mostrar_seccion_inventario(
+    df_barriles: pd.DataFrame,
+    df_movimientos_latas: pd.DataFrame,
+    inventario_barriles: pd.DataFrame,
+    inventario_latas: pd.DataFrame,
+    version: str,
+) -> None:
+    """Muestra el inventario actual o, si se eligio una fecha pasada, el de ese dia."""
+    fecha = st.session_state.get("fecha_inventario") or hoy_bogota()
+    if fecha >= hoy_bogota():
+        mostrar_inventario_actual(inventario_barriles, inventario_latas, version)
+        return
+
+    barriles_en_fecha, latas_en_fecha = inventario_en_fecha_por_version(
+        version, fecha, df_barriles, df_movimientos_latas, inventario_latas
+    )
+    mostrar_inventario_actual(
+        barriles_en_fecha, latas_en_fecha, f"{version}|{fecha}", fecha_corte=fecha
+    )
+
+
 def mostrar_inventario_actual(
     inventario_barriles: pd.DataFrame,
     inventario_latas: pd.DataFrame,
-    umbral_alerta: float,
+    version: str,
+    fecha_corte: date | None = None,
 ) -> None:
-    st.subheader("\U0001F4E6 Inventario actual en cuarto fr\u00edo")
+    umbral_alerta = float(st.session_state.get("umbral_alerta", UMBRAL_ALERTA_PREDETERMINADO))
+    clave_graficos = f"{version}|{umbral_alerta}"
+    if fecha_corte is None:
+        st.subheader("\U0001F4E6 Inventario actual en cuarto fr\u00edo")
+    else:
+        st.subheader(
+            f"\U0001F4E6 Inventario en cuarto fr\u00edo al {fecha_corte.strftime('%d/%m/%Y')}"
+        )
+        st.caption(
+            "Reconstruido desde el historial de DatosM y VLatas: \u00faltimo estado de cada "
+            "barril y saldo de latas al cierre del d\u00eda."
+        )
     st.markdown(
         f"""
         <div class="section-note">
@@ -1117,7 +1081,9 @@ def mostrar_inventario_actual(
     litros_latas = float(inventario_latas["Litros"].sum()) if not inventario_latas.empty else 0.0
     mostrar_metricas(total_barriles, total_latas, litros_barriles, litros_latas)
 
-    resumen = construir_resumen_inventario(inventario_barriles, inventario_latas, umbral_alerta)
+    resumen = resumen_inventario_por_version(
+        version, umbral_alerta, inventario_barriles, inventario_latas
+    )
     if resumen.empty:
         st.warning("No se encontraron existencias actuales.")
         return
@@ -1132,120 +1098,214 @@ def mostrar_inventario_actual(
     )
 
     tab_resumen, tab_visual, tab_alertas, tab_detalle = st.tabs(
-        ["Resumen", "An\u00e1lisis visual", "Alertas y lotes", "Detalle"]
+        ["Resumen", "An\u00e1lisis visual", "Alertas y lotes", "Detalle"],
+        key="tabs_inventario",
+        on_change="rerun",
     )
 
-    with tab_resumen:
-        st.dataframe(resumen, use_container_width=True, hide_index=True)
-        mostrar_grafico(grafico_inventario_apilado(resumen))
+    if tab_resumen.open:
+        with tab_resumen:
+            st.dataframe(resumen, use_container_width=True, hide_index=True)
+            mostrar_grafico(clave_graficos, grafico_inventario_apilado, resumen)
 
-        presentaciones = pd.DataFrame(
-            {
-                "Tipo": ["Barril", "Lata"],
-                "Litros": [litros_barriles, litros_latas],
-            }
-        )
-        col_1, col_2 = st.columns(2)
-        with col_1:
-            mostrar_grafico(
-                crear_grafico_dona(
+            presentaciones = pd.DataFrame(
+                {
+                    "Tipo": ["Barril", "Lata"],
+                    "Litros": [litros_barriles, litros_latas],
+                }
+            )
+            col_1, col_2 = st.columns(2)
+            with col_1:
+                mostrar_grafico(
+                    clave_graficos,
+                    crear_grafico_dona,
                     resumen,
                     categoria="Estilo",
                     valor="Litros totales",
                     titulo="Distribuci\u00f3n del inventario por estilo",
                 )
-            )
-        with col_2:
-            mostrar_grafico(
-                crear_grafico_dona(
+            with col_2:
+                mostrar_grafico(
+                    clave_graficos,
+                    crear_grafico_dona,
                     presentaciones,
                     categoria="Tipo",
                     valor="Litros",
                     titulo="Inventario por presentaci\u00f3n",
                     modo_color="presentacion",
                 )
-            )
 
-    with tab_visual:
-        col_1, col_2 = st.columns(2)
-        with col_1:
-            mostrar_grafico(grafico_mezcla_inventario(resumen))
-        with col_2:
-            mostrar_grafico(grafico_capacidad_barriles(inventario_barriles))
-
-    with tab_alertas:
-        bajos = resumen[resumen["Estado inventario"].str.contains("Bajo")].copy()
-        if bajos.empty:
-            st.success("Todos los estilos se encuentran por encima del umbral configurado.")
-        else:
-            st.warning(
-                "Estilos con inventario bajo: "
-                + ", ".join(bajos["Estilo"].astype(str).tolist())
-            )
-            st.dataframe(
-                bajos[["Estilo", "Barriles", "Latas", "Litros totales", "Estado inventario"]],
-                use_container_width=True,
-                hide_index=True,
-            )
-        mostrar_grafico(grafico_estado_inventario(resumen, umbral_alerta))
-        mostrar_grafico(grafico_lotes_latas(inventario_latas))
-
-    with tab_detalle:
-        columna_barriles, columna_latas = st.columns(2)
-        with columna_barriles:
-            st.markdown("#### Barriles en cuarto fr\u00edo")
-            if inventario_barriles.empty:
-                st.info("No hay barriles registrados en cuarto fr\u00edo.")
+    if tab_visual.open:
+        with tab_visual:
+            col_1, col_2 = st.columns(2)
+            with col_1:
+                mostrar_grafico(clave_graficos, grafico_mezcla_inventario, resumen)
+            with col_2:
+                mostrar_grafico(clave_graficos, grafico_capacidad_barriles, inventario_barriles)
+
+    if tab_alertas.open:
+        with tab_alertas:
+            bajos = resumen[resumen["Estado inventario"].str.contains("Bajo")].copy()
+            if bajos.empty:
+                st.success("Todos los estilos se encuentran por encima del umbral configurado.")
             else:
-                detalle = inventario_barriles[
-                    ["Codigo", "Estilo", "Lote", "Litros", "Fecha", "Observaciones"]
-                ].copy()
-                detalle["Fecha"] = detalle["Fecha"].dt.strftime("%d/%m/%Y %H:%M")
-                detalle["Litros"] = detalle["Litros"].round(2)
-                st.dataframe(
-                    detalle.sort_values(["Estilo", "Codigo"]),
-                    use_container_width=True,
-                    hide_index=True,
+                st.warning(
+                    "Estilos con inventario bajo: "
+                    + ", ".join(bajos["Estilo"].astype(str).tolist())
                 )
-
-        with columna_latas:
-            st.markdown("#### Latas disponibles")
-            if inventario_latas.empty:
-                st.info("No hay latas disponibles.")
-            else:
-                detalle = inventario_latas[
-                    [
-                        "Estilo",
-                        "Lote",
-                        "Ingresadas",
-                        "Despachadas",
-                        "Devoluciones",
-                        "Bajas",
-                        "Disponible",
-                        "Litros",
-                    ]
-                ].copy()
-                for columna in ["Ingresadas", "Despachadas", "Devoluciones", "Bajas", "Disponible"]:
-                    detalle[columna] = detalle[columna].round().astype(int)
-                detalle["Litros"] = detalle["Litros"].round(2)
                 st.dataframe(
-                    detalle.sort_values(["Estilo", "Lote"]),
+                    bajos[["Estilo", "Barriles", "Latas", "Litros totales", "Estado inventario"]],
                     use_container_width=True,
                     hide_index=True,
                 )
+            mostrar_grafico(clave_graficos, grafico_estado_inventario, resumen, umbral_alerta)
+            mostrar_grafico(clave_graficos, grafico_lotes_latas, inventario_latas)
+
+    if tab_detalle.open:
+        with tab_detalle:
+            columna_barriles, columna_latas = st.columns(2)
+            with columna_barriles:
+                st.markdown("#### Barriles en cuarto fr\u00edo")
+                if inventario_barriles.empty:
+                    st.info("No hay barriles registrados en cuarto fr\u00edo.")
+                else:
+                    detalle = inventario_barriles[
+                        ["Codigo", "Estilo", "Lote", "Litros", "Fecha", "Observaciones"]
+                    ].copy()
+                    detalle["Fecha"] = detalle["Fecha"].dt.strftime("%d/%m/%Y %H:%M")
+                    detalle["Litros"] = litros_redondeados(detalle["Litros"])
+                    st.dataframe(
+                        detalle.sort_values(["Estilo", "Codigo"]),
+                        use_container_width=True,
+                        hide_index=True,
+                    )
+
+            with columna_latas:
+                st.markdown("#### Latas disponibles")
+                if inventario_latas.empty:
+                    st.info("No hay latas disponibles.")
+                else:
+                    detalle = inventario_latas[
+                        [
+                            "Estilo",
+                            "Lote",
+                            "Ingresadas",
+                            "Despachadas",
+                            "Devoluciones",
+                            "Bajas",
+                            "Disponible",
+                            "Litros",
+                        ]
+                    ].copy()
+                    for columna in ["Ingresadas", "Despachadas", "Devoluciones", "Bajas", "Disponible"]:
+                        detalle[columna] = detalle[columna].round().astype(int)
+                    detalle["Litros"] = litros_redondeados(detalle["Litros"])
+                    st.dataframe(
+                        detalle.sort_values(["Estilo", "Lote"]),
+                        use_container_width=True,
+                        hide_index=True,
+                    )
+
+
+def grafico_evolucion_inventario(serie: pd.DataFrame) -> alt.TopLevelMixin | None:
+    datos = serie[serie["Litros_totales"].gt(0)]
+    if datos.empty:
+        return None
+    datos = datos[["Dia", "Estilo", "Litros_totales"]].rename(columns={"Litros_totales": "Litros"})
+    return (
+        alt.Chart(datos)
+        .mark_area(opacity=.78, interpolate="step-after")
+        .encode(
+            x=alt.X("Dia:T", title="Fecha"),
+            y=alt.Y("Litros:Q", stack="zero", title="Litros en cuarto fr\u00edo"),
+            color=alt.Color("Estilo:N", scale=escala_estilos(datos["Estilo"].tolist()), title="Estilo"),
+            tooltip=[
+                alt.Tooltip("Dia:T", format="%d/%m/%Y", title="Fecha"),
+                "Estilo",
+                alt.Tooltip("Litros:Q", format=",.2f"),
+            ],
+        )
+        .properties(title="Litros en cuarto fr\u00edo por estilo", height=400)
+    )
+
+
+def grafico_evolucion_presentacion(serie: pd.DataFrame) -> alt.TopLevelMixin | None:
+    if serie.empty:
+        return None
+    datos = (
+        serie.groupby("Dia", as_index=False)[["Litros_barriles", "Litros_latas"]]
+        .sum()
+        .rename(columns={"Litros_barriles": "Barril", "Litros_latas": "Lata"})
+        .melt(id_vars="Dia", var_name="Tipo", value_name="Litros")
+    )
+    return (
+        alt.Chart(datos)
+        .mark_line(strokeWidth=3, interpolate="step-after")
+        .encode(
+            x=alt.X("Dia:T", title="Fecha"),
+            y=alt.Y("Litros:Q", title="Litros en cuarto fr\u00edo"),
+            color=alt.Color("Tipo:N", scale=escala_presentacion(), title="Presentaci\u00f3n"),
+            tooltip=[
+                alt.Tooltip("Dia:T", format="%d/%m/%Y", title="Fecha"),
+                "Tipo",
+                alt.Tooltip("Litros:Q", format=",.2f"),
+            ],
+        )
+        .properties(title="Litros en cuarto fr\u00edo por presentaci\u00f3n", height=360)
+    )
+
+
+@st.fragment(key="evolucion")
+def mostrar_evolucion_inventario(
+    df_barriles: pd.DataFrame,
+    df_movimientos_latas: pd.DataFrame,
+    inventario_latas: pd.DataFrame,
+    version: str,
+) -> None:
+    st.subheader("\U0001F4C8 Evoluci\u00f3n del inventario en cuarto fr\u00edo")
+    st.markdown(
+        """
+        <div class="section-note">
+        Litros en cuarto fr\u00edo al cierre de cada d\u00eda. Los barriles suman al entrar en
+        <b>en cuarto fr\u00edo</b> y restan al cambiar de estado; las latas siguen los movimientos
+        de <b>VLatas</b> y terminan en el saldo actual de <b>InventarioLatasTR</b>.
+        </div>
+        """,
+        unsafe_allow_html=True,
+    )
+    hoy = hoy_bogota()
+    serie = serie_inventario_por_version(
+        version, hoy, df_barriles, df_movimientos_latas, inventario_latas
+    )
+    if serie.empty:
+        st.warning("No hay movimientos suficientes para reconstruir el inventario.")
+        return
+
+    clave_graficos = f"{version}|{hoy}"
+    mostrar_grafico(clave_graficos, grafico_evolucion_inventario, serie)
+    mostrar_grafico(clave_graficos, grafico_evolucion_presentacion, serie)
+
+    detalle = serie[serie["Litros_totales"].gt(0)].copy()
+    detalle["Dia"] = detalle["Dia"].dt.strftime("%Y-%m-%d")
+    st.download_button(
+        "Descargar evoluci\u00f3n CSV",
+        data=detalle.round(2).to_csv(index=False).encode("utf-8-sig"),
+        file_name=f"evolucion_inventario_{hoy}.csv",
+        mime="text/csv",
+    )
 
 
 # -----------------------------------------------------------------------------
 # GRAFICOS Y VISTA DE DESPACHOS
 # -----------------------------------------------------------------------------
 def grafico_pareto_clientes(
-    df: pd.DataFrame,
+    cubo: pd.DataFrame,
     top_n: int,
 ) -> alt.TopLevelMixin | None:
-    if df.empty:
+    if cubo.empty:
         return None
     datos = (
-        df.groupby("Cliente", as_index=False)["Litros_totales"]
+        cubo.groupby("Cliente", as_index=False, observed=True)["Litros_totales"]
         .sum()
         .rename(columns={"Litros_totales": "Litros"})
         .nlargest(top_n, "Litros")
@@ -1286,16 +1346,16 @@ def grafico_pareto_clientes(
 
 
 def grafico_mapa_cliente_estilo(
-    df: pd.DataFrame,
+    cubo: pd.DataFrame,
     top_n: int,
 ) -> alt.TopLevelMixin | None:
-    if df.empty:
+    if cubo.empty:
         return None
-    clientes = df.groupby("Cliente")["Litros_totales"].sum().nlargest(top_n).index.tolist()
-    estilos = df.groupby("Estilo")["Litros_totales"].sum().nlargest(min(top_n, 10)).index.tolist()
+    clientes = cubo.groupby("Cliente", observed=True)["Litros_totales"].sum().nlargest(top_n).index.tolist()
+    estilos = cubo.groupby("Estilo", observed=True)["Litros_totales"].sum().nlargest(min(top_n, 10)).index.tolist()
     datos = (
-        df[df["Cliente"].isin(clientes) & df["Estilo"].isin(estilos)]
-        .groupby(["Cliente", "Estilo"], as_index=False)["Litros_totales"]
+        cubo[cubo["Cliente"].isin(clientes) & cubo["Estilo"].isin(estilos)]
+        .groupby(["Cliente", "Estilo"], as_index=False, observed=True)["Litros_totales"]
         .sum()
         .rename(columns={"Litros_totales": "Litros"})
     )
@@ -1314,13 +1374,13 @@ def grafico_mapa_cliente_estilo(
     )
 
 
-def grafico_mensual_presentacion(df: pd.DataFrame) -> alt.TopLevelMixin | None:
-    if df.empty:
+def grafico_mensual_presentacion(cubo: pd.DataFrame) -> alt.TopLevelMixin | None:
+    if cubo.empty:
         return None
-    datos = df.copy()
-    datos["Mes"] = datos["Fecha"].dt.to_period("M").dt.to_timestamp()
+    datos = cubo.copy()
+    datos["Mes"] = datos["Dia"].dt.to_period("M").dt.to_timestamp()
     datos = (
-        datos.groupby(["Mes", "Tipo"], as_index=False)["Litros_totales"]
+        datos.groupby(["Mes", "Tipo"], as_index=False, observed=True)["Litros_totales"]
         .sum()
         .rename(columns={"Litros_totales": "Litros"})
     )
@@ -1342,16 +1402,15 @@ def grafico_mensual_presentacion(df: pd.DataFrame) -> alt.TopLevelMixin | None:
 
 
 def grafico_area_estilos(
-    df: pd.DataFrame,
+    cubo: pd.DataFrame,
     top_n: int,
 ) -> alt.TopLevelMixin | None:
-    if df.empty:
+    if cubo.empty:
         return None
-    principales = df.groupby("Estilo")["Litros_totales"].sum().nlargest(top_n).index
-    datos = df[df["Estilo"].isin(principales)].copy()
-    datos["Dia"] = datos["Fecha"].dt.floor("D")
+    principales = cubo.groupby("Estilo", observed=True)["Litros_totales"].sum().nlargest(top_n).index
+    datos = cubo[cubo["Estilo"].isin(principales)]
     datos = (
-        datos.groupby(["Dia", "Estilo"], as_index=False)["Litros_totales"]
+        datos.groupby(["Dia", "Estilo"], as_index=False, observed=True)["Litros_totales"]
         .sum()
         .rename(columns={"Litros_totales": "Litros"})
     )
@@ -1372,13 +1431,11 @@ def grafico_area_estilos(
     )
 
 
-def grafico_tendencia_presentacion(df: pd.DataFrame) -> alt.TopLevelMixin | None:
-    if df.empty:
+def grafico_tendencia_presentacion(cubo: pd.DataFrame) -> alt.TopLevelMixin | None:
+    if cubo.empty:
         return None
-    datos = df.copy()
-    datos["Dia"] = datos["Fecha"].dt.floor("D")
     datos = (
-        datos.groupby(["Dia", "Tipo"], as_index=False)["Litros_totales"]
+        cubo.groupby(["Dia", "Tipo"], as_index=False, observed=True)["Litros_totales"]
         .sum()
         .rename(columns={"Litros_totales": "Litros"})
     )
@@ -1399,13 +1456,11 @@ def grafico_tendencia_presentacion(df: pd.DataFrame) -> alt.TopLevelMixin | None
     )
 
 
-def grafico_media_movil(df: pd.DataFrame) -> alt.TopLevelMixin | None:
-    if df.empty:
+def grafico_media_movil(cubo: pd.DataFrame) -> alt.TopLevelMixin | None:
+    if cubo.empty:
         return None
-    datos = df.copy()
-    datos["Dia"] = datos["Fecha"].dt.floor("D")
     diario = (
-        datos.groupby("Dia", as_index=False)["Litros_totales"]
+        cubo.groupby("Dia", as_index=False, observed=True)["Litros_totales"]
         .sum()
         .sort_values("Dia")
         .rename(columns={"Litros_totales": "Litros diarios"})
@@ -1441,14 +1496,14 @@ def grafico_media_movil(df: pd.DataFrame) -> alt.TopLevelMixin | None:
     )
 
 
-def grafico_dia_semana(df: pd.DataFrame) -> alt.TopLevelMixin | None:
-    if df.empty:
+def grafico_dia_semana(cubo: pd.DataFrame) -> alt.TopLevelMixin | None:
+    if cubo.empty:
         return None
-    datos = df.copy()
-    datos["Orden"] = datos["Fecha"].dt.dayofweek
+    datos = cubo.copy()
+    datos["Orden"] = datos["Dia"].dt.dayofweek
     datos["Dia semana"] = datos["Orden"].map(dict(enumerate(ORDEN_DIAS)))
     datos = (
-        datos.groupby(["Orden", "Dia semana"], as_index=False)["Litros_totales"]
+        datos.groupby(["Orden", "Dia semana"], as_index=False, observed=True)["Litros_totales"]
         .sum()
         .sort_values("Orden")
         .rename(columns={"Litros_totales": "Litros"})
@@ -1465,15 +1520,14 @@ def grafico_dia_semana(df: pd.DataFrame) -> alt.TopLevelMixin | None:
     )
 
 
-def grafico_mapa_horario(df: pd.DataFrame) -> alt.TopLevelMixin | None:
-    if df.empty:
+def grafico_mapa_horario(cubo: pd.DataFrame) -> alt.TopLevelMixin | None:
+    if cubo.empty:
         return None
-    datos = df.copy()
-    datos["Orden"] = datos["Fecha"].dt.dayofweek
+    datos = cubo.copy()
+    datos["Orden"] = datos["Dia"].dt.dayofweek
     datos["Dia semana"] = datos["Orden"].map(dict(enumerate(ORDEN_DIAS)))
-    datos["Hora"] = datos["Fecha"].dt.hour
     datos = (
-        datos.groupby(["Orden", "Dia semana", "Hora"], as_index=False)["Litros_totales"]
+        datos.groupby(["Orden", "Dia semana", "Hora"], as_index=False, observed=True)["Litros_totales"]
         .sum()
         .rename(columns={"Litros_totales": "Litros"})
     )
@@ -1490,57 +1544,48 @@ def grafico_mapa_horario(df: pd.DataFrame) -> alt.TopLevelMixin | None:
     )
 
 
-def graficos_unidades_por_estilo(
-    df: pd.DataFrame,
+def grafico_unidades_por_estilo(
+    cubo: pd.DataFrame,
     top_n: int,
-) -> tuple[alt.TopLevelMixin | None, alt.TopLevelMixin | None]:
-    barriles = (
-        df.groupby("Estilo", as_index=False)["Barriles"]
-        .sum()
-        .sort_values("Barriles", ascending=False)
-        .head(top_n)
-    )
-    barriles = barriles[barriles["Barriles"].gt(0)]
-    latas = (
-        df.groupby("Estilo", as_index=False)["Latas"]
+    unidad: str,
+) -> alt.TopLevelMixin | None:
+    """Ranking de barriles o latas despachados por estilo; `unidad` es la columna del cubo."""
+    datos = (
+        cubo.groupby("Estilo", as_index=False, observed=True)[unidad]
         .sum()
-        .sort_values("Latas", ascending=False)
+        .sort_values(unidad, ascending=False)
         .head(top_n)
     )
-    latas = latas[latas["Latas"].gt(0)]
-
-    grafico_barriles = None
-    if not barriles.empty:
-        grafico_barriles = (
-            alt.Chart(barriles)
-            .mark_bar(cornerRadiusEnd=5)
-            .encode(
-                y=alt.Y("Estilo:N", sort="-x", title=None),
-                x=alt.X("Barriles:Q", title="Barriles despachados"),
-                color=alt.Color("Estilo:N", scale=escala_estilos(barriles["Estilo"].tolist()), legend=None),
-                tooltip=["Estilo", alt.Tooltip("Barriles:Q", format=",.0f")],
-            )
-            .properties(title="Barriles despachados por estilo", height=max(330, len(barriles) * 28))
-        )
+    datos = datos[datos[unidad].gt(0)]
+    if datos.empty:
+        return None
 
-    grafico_latas = None
-    if not latas.empty:
-        grafico_latas = (
-            alt.Chart(latas)
-            .mark_bar(cornerRadiusEnd=5)
-            .encode(
-                y=alt.Y("Estilo:N", sort="-x", title=None),
-                x=alt.X("Latas:Q", title="Latas despachadas"),
-                color=alt.Color("Estilo:N", scale=escala_estilos(latas["Estilo"].tolist()), legend=None),
-                tooltip=["Estilo", alt.Tooltip("Latas:Q", format=",.0f")],
-            )
-            .properties(title="Latas despachadas por estilo", height=max(330, len(latas) * 28))
+    titulo = f"{unidad} despachados por estilo" if unidad == "Barriles" else f"{unidad} despachadas por estilo"
+    return (
+        alt.Chart(datos)
+        .mark_bar(cornerRadiusEnd=5)
+        .encode(
+            y=alt.Y("Estilo:N", sort="-x", title=None),
+            x=alt.X(f"{unidad}:Q", title=titulo.replace(" por estilo", "")),
+            color=alt.Color("Estilo:N", scale=escala_estilos(datos["Estilo"].tolist()), legend=None),
+            tooltip=["Estilo", alt.Tooltip(f"{unidad}:Q", format=",.0f")],
         )
-
-    return grafico_barriles, grafico_latas
+        .properties(title=titulo, height=max(330, len(datos) * 28))
+    )
 
 
-def mostrar_despachos(df_despachos: pd.DataFrame) -> None:
+@st.fragment(key="despachos")
+def mostrar_despachos(
+    df_despachos: pd.DataFrame,
+    cubo: pd.DataFrame | None,
+    version: str,
+    opciones: dict | None,
+) -> None:
+    """
+    Sin almacen de despachos todos los graficos usan el cubo filtrado en
+    memoria; con almacen, SQL devuelve un agregado por grupo de graficos
+    (cliente y estilo, dia, hora) con las mismas columnas del cubo.
+    """
     st.subheader("\U0001F69A Reporte de despachos de barriles y latas")
     st.markdown(
         """
@@ -1552,188 +1597,256 @@ def mostrar_despachos(df_despachos: pd.DataFrame) -> None:
         unsafe_allow_html=True,
     )
 
-    filtrado, fecha_inicio, fecha_fin, top_n = aplicar_filtros_despachos(df_despachos)
+    if ALMACEN_DESPACHOS:
+        criterios, agregados, fecha_inicio, fecha_fin, top_n, clave_graficos = (
+            aplicar_filtros_almacen(opciones, version)
+        )
+        sin_litros = barriles_sin_litros_por_criterios(version, criterios) if criterios else 0
+
+        def leer_detalle() -> pd.DataFrame:
+            return detalle_almacen_por_criterios(version, criterios)
+    else:
+        filtrado, cubo_filtrado, fecha_inicio, fecha_fin, top_n, clave_graficos = (
+            aplicar_filtros_despachos(df_despachos, cubo, version)
+        )
+        agregados = dict.fromkeys(AGREGADOS_DESPACHOS, cubo_filtrado)
+        sin_litros = int((filtrado["Tipo"].eq("Barril") & filtrado["Litros_totales"].le(0)).sum())
+
+        def leer_detalle() -> pd.DataFrame:
+            return filtrado
+
     st.caption(
         f"Periodo mostrado: {fecha_inicio.strftime('%d/%m/%Y')} a "
         f"{fecha_fin.strftime('%d/%m/%Y')}"
     )
 
-    if filtrado.empty:
+    por_cliente = agregados["cliente_estilo"]
+    por_dia = agregados["dia"]
+    por_hora = agregados["hora"]
+    if por_cliente.empty:
         st.warning("No hay despachos para los filtros seleccionados.")
         return
 
-    total_barriles = float(filtrado["Barriles"].sum())
-    total_latas = float(filtrado["Latas"].sum())
-    litros_barriles = float(filtrado["Litros_barriles"].sum())
-    litros_latas = float(filtrado["Litros_latas"].sum())
+    total_barriles = float(por_cliente["Barriles"].sum())
+    total_latas = float(por_cliente["Latas"].sum())
+    litros_barriles = float(por_cliente["Litros_barriles"].sum())
+    litros_latas = float(por_cliente["Litros_latas"].sum())
     total_litros = litros_barriles + litros_latas
-    movimientos = float(len(filtrado))
+    movimientos = float(por_cliente["Movimientos"].sum())
     mostrar_metricas(total_barriles, total_latas, litros_barriles, litros_latas, movimientos)
 
     dias_periodo = max((fecha_fin - fecha_inicio).days + 1, 1)
     promedio_diario = total_litros / dias_periodo
     promedio_movimiento = total_litros / movimientos if movimientos else 0
     col_1, col_2, col_3, col_4 = st.columns(4)
-    col_1.metric("\U0001F465 Clientes atendidos", formato_numero(filtrado["Cliente"].nunique(), 0))
-    col_2.metric("\U0001F3A8 Estilos despachados", formato_numero(filtrado["Estilo"].nunique(), 0))
+    col_1.metric("\U0001F465 Clientes atendidos", formato_numero(por_cliente["Cliente"].nunique(), 0))
+    col_2.metric("\U0001F3A8 Estilos despachados", formato_numero(por_cliente["Estilo"].nunique(), 0))
     col_3.metric("\U0001F4C5 Promedio diario", f"{formato_numero(promedio_diario, 2)} L")
     col_4.metric("\U0001F9FE Promedio por movimiento", f"{formato_numero(promedio_movimiento, 2)} L")
 
-    desconocidos = filtrado[
-        filtrado["Tipo"].eq("Barril") & filtrado["Litros_totales"].le(0)
-    ]
-    if not desconocidos.empty:
+    if sin_litros:
         st.warning(
-            f"Hay {len(desconocidos)} despacho(s) de barril cuya capacidad no pudo determinarse. "
+            f"Hay {sin_litros} despacho(s) de barril cuya capacidad no pudo determinarse. "
             "Revisa que el c\u00f3digo comience por 20, 30 o 58, o registra los litros en Capacidad/Observaciones."
         )
 
-    resumen = (
-        filtrado.groupby(["Cliente", "Estilo"], as_index=False)
-        .agg(
-            Barriles=("Barriles", "sum"),
-            Latas=("Latas", "sum"),
-            Movimientos=("Tipo", "size"),
-            **{
-                "Litros barriles": ("Litros_barriles", "sum"),
-                "Litros latas": ("Litros_latas", "sum"),
-                "Litros totales": ("Litros_totales", "sum"),
-            },
-        )
-        .sort_values("Litros totales", ascending=False)
-    )
-    resumen = normalizar_tipos_resumen(resumen)
+    resumen = construir_resumen_despachos(por_cliente)
 
     tab_panorama, tab_clientes, tab_estilos, tab_tendencias, tab_detalle = st.tabs(
-        ["Panorama", "Clientes", "Estilos", "Tendencias", "Detalle"]
-    )
-
-    with tab_panorama:
-        st.markdown("#### Resumen por cliente y estilo")
-        st.dataframe(resumen, use_container_width=True, hide_index=True)
-        st.download_button(
-            "Descargar resumen CSV",
-            data=resumen.to_csv(index=False).encode("utf-8-sig"),
-            file_name=f"resumen_despachos_{fecha_inicio}_{fecha_fin}.csv",
-            mime="text/csv",
-        )
+        ["Panorama", "Clientes", "Estilos", "Tendencias", "Detalle"],
+        key="tabs_despachos",
+        on_change="rerun",
+    )
+
+    if tab_panorama.open:
+        with tab_panorama:
+            st.markdown("#### Resumen por cliente y estilo")
+            st.dataframe(resumen, use_container_width=True, hide_index=True)
+            st.download_button(
+                "Descargar resumen CSV",
+                data=resumen.to_csv(index=False).encode("utf-8-sig"),
+                file_name=f"resumen_despachos_{fecha_inicio}_{fecha_fin}.csv",
+                mime="text/csv",
+            )
 
-        datos_presentacion = (
-            filtrado.groupby("Tipo", as_index=False)["Litros_totales"]
-            .sum()
-            .rename(columns={"Litros_totales": "Litros"})
-        )
-        datos_estilo = (
-            filtrado.groupby("Estilo", as_index=False)["Litros_totales"]
-            .sum()
-            .rename(columns={"Litros_totales": "Litros"})
-        )
-        izquierda, derecha = st.columns(2)
-        with izquierda:
-            mostrar_grafico(
-                crear_grafico_dona(
+            datos_presentacion = (
+                por_cliente.groupby("Tipo", as_index=False, observed=True)["Litros_totales"]
+                .sum()
+                .rename(columns={"Litros_totales": "Litros"})
+            )
+            datos_estilo = (
+                por_cliente.groupby("Estilo", as_index=False, observed=True)["Litros_totales"]
+                .sum()
+                .rename(columns={"Litros_totales": "Litros"})
+            )
+            izquierda, derecha = st.columns(2)
+            with izquierda:
+                mostrar_grafico(
+                    clave_graficos,
+                    crear_grafico_dona,
                     datos_presentacion,
                     categoria="Tipo",
                     valor="Litros",
                     titulo="Distribuci\u00f3n por presentaci\u00f3n",
                     modo_color="presentacion",
                 )
-            )
-        with derecha:
-            mostrar_grafico(
-                crear_grafico_dona(
+            with derecha:
+                mostrar_grafico(
+                    clave_graficos,
+                    crear_grafico_dona,
                     datos_estilo,
                     categoria="Estilo",
                     valor="Litros",
                     titulo="Distribuci\u00f3n por estilo",
                 )
-            )
-        mostrar_grafico(grafico_mensual_presentacion(filtrado))
+            mostrar_grafico(clave_graficos, grafico_mensual_presentacion, por_dia)
 
-    with tab_clientes:
-        mostrar_grafico(
-            grafico_litros_por_categoria(
-                filtrado,
+    if tab_clientes.open:
+        with tab_clientes:
+            mostrar_grafico(
+                clave_graficos,
+                grafico_litros_por_categoria,
+                por_cliente,
                 categoria="Cliente",
                 titulo=f"Litros despachados por cliente · Top {top_n}",
                 top_n=top_n,
             )
-        )
-        izquierda, derecha = st.columns([1.05, 1])
-        with izquierda:
-            mostrar_grafico(grafico_pareto_clientes(filtrado, top_n))
-        with derecha:
-            mostrar_grafico(grafico_mapa_cliente_estilo(filtrado, min(top_n, 12)))
-
-    with tab_estilos:
-        mostrar_grafico(
-            grafico_litros_por_categoria(
-                filtrado,
+            izquierda, derecha = st.columns([1.05, 1])
+            with izquierda:
+                mostrar_grafico(clave_graficos, grafico_pareto_clientes, por_cliente, top_n)
+            with derecha:
+                mostrar_grafico(
+                    clave_graficos, grafico_mapa_cliente_estilo, por_cliente, min(top_n, 12)
+                )
+
+    if tab_estilos.open:
+        with tab_estilos:
+            mostrar_grafico(
+                clave_graficos,
+                grafico_litros_por_categoria,
+                por_cliente,
                 categoria="Estilo",
                 titulo=f"Litros despachados por estilo · Top {top_n}",
                 top_n=top_n,
             )
+            col_barriles, col_latas = st.columns(2)
+            with col_barriles:
+                mostrar_grafico(
+                    clave_graficos, grafico_unidades_por_estilo, por_cliente, top_n, "Barriles"
+                )
+            with col_latas:
+                mostrar_grafico(
+                    clave_graficos, grafico_unidades_por_estilo, por_cliente, top_n, "Latas"
+                )
+            mostrar_grafico(clave_graficos, grafico_area_estilos, por_dia, top_n)
+
+    if tab_tendencias.open:
+        with tab_tendencias:
+            izquierda, derecha = st.columns(2)
+            with izquierda:
+                mostrar_grafico(clave_graficos, grafico_tendencia_presentacion, por_dia)
+            with derecha:
+                mostrar_grafico(clave_graficos, grafico_media_movil, por_dia)
+            izquierda, derecha = st.columns(2)
+            with izquierda:
+                mostrar_grafico(clave_graficos, grafico_dia_semana, por_dia)
+            with derecha:
+                mostrar_grafico(clave_graficos, grafico_mapa_horario, por_hora)
+
+    if tab_detalle.open:
+        with tab_detalle:
+            detalle = leer_detalle()[
+                [
+                    "Fecha",
+                    "Tipo",
+                    "Cliente",
+                    "Estilo",
+                    "Codigo",
+                    "Lote",
+                    "Barriles",
+                    "Latas",
+                    "Litros_barriles",
+                    "Litros_latas",
+                    "Litros_totales",
+                    "Responsable",
+                    "Observaciones",
+                ]
+            ].copy()
+            detalle = detalle.sort_values("Fecha", ascending=False)
+            detalle["Fecha"] = detalle["Fecha"].dt.strftime("%d/%m/%Y %H:%M")
+            detalle = detalle.rename(
+                columns={
+                    "Codigo": "C\u00f3digo barril",
+                    "Litros_barriles": "Litros barriles",
+                    "Litros_latas": "Litros latas",
+                    "Litros_totales": "Litros totales",
+                }
+            )
+            detalle["Barriles"] = detalle["Barriles"].round().astype(int)
+            detalle["Latas"] = detalle["Latas"].round().astype(int)
+            for columna in ["Litros barriles", "Litros latas", "Litros totales"]:
+                detalle[columna] = litros_redondeados(detalle[columna])
+
+            st.dataframe(detalle, use_container_width=True, hide_index=True)
+            st.download_button(
+                "Descargar detalle CSV",
+                data=detalle.to_csv(index=False).encode("utf-8-sig"),
+                file_name=f"detalle_despachos_{fecha_inicio}_{fecha_fin}.csv",
+                mime="text/csv",
+            )
+
+
+# -----------------------------------------------------------------------------
+# PANEL DE RENDIMIENTO
+# -----------------------------------------------------------------------------
+def mostrar_panel_rendimiento() -> None:
+    """Panel opcional con la duracion de cada etapa en las ultimas ejecuciones del proceso."""
+    st.sidebar.markdown("---")
+    if not st.sidebar.toggle("\u23F1\uFE0F Rendimiento", key="panel_rendimiento"):
+        return
+
+    activar_perfil_memoria(
+        st.sidebar.checkbox(
+            "Medir memoria",
+            key="perfil_memoria",
+            help="Activa tracemalloc en todo el proceso; hace m\u00e1s lenta la aplicaci\u00f3n.",
         )
-        grafico_barriles, grafico_latas = graficos_unidades_por_estilo(filtrado, top_n)
-        col_barriles, col_latas = st.columns(2)
-        with col_barriles:
-            mostrar_grafico(grafico_barriles)
-        with col_latas:
-            mostrar_grafico(grafico_latas)
-        mostrar_grafico(grafico_area_estilos(filtrado, top_n))
-
-    with tab_tendencias:
-        izquierda, derecha = st.columns(2)
-        with izquierda:
-            mostrar_grafico(grafico_tendencia_presentacion(filtrado))
-        with derecha:
-            mostrar_grafico(grafico_media_movil(filtrado))
-        izquierda, derecha = st.columns(2)
-        with izquierda:
-            mostrar_grafico(grafico_dia_semana(filtrado))
-        with derecha:
-            mostrar_grafico(grafico_mapa_horario(filtrado))
-
-    with tab_detalle:
-        detalle = filtrado[
-            [
-                "Fecha",
-                "Tipo",
-                "Cliente",
-                "Estilo",
-                "Codigo",
-                "Lote",
-                "Barriles",
-                "Latas",
-                "Litros_barriles",
-                "Litros_latas",
-                "Litros_totales",
-                "Responsable",
-                "Observaciones",
-            ]
-        ].copy()
-        detalle = detalle.sort_values("Fecha", ascending=False)
-        detalle["Fecha"] = detalle["Fecha"].dt.strftime("%d/%m/%Y %H:%M")
-        detalle = detalle.rename(
+    )
+    resumen = resumen_rendimiento()
+    if resumen.empty:
+        st.sidebar.caption("Todav\u00eda no hay mediciones.")
+        return
+
+    st.sidebar.caption(
+        f"Segundos por etapa; percentiles de las \u00faltimas {MEDICIONES_POR_ETAPA} "
+        "mediciones de cada una, en todas las sesiones."
+    )
+    st.sidebar.dataframe(
+        resumen.round(3).rename(
             columns={
-                "Codigo": "C\u00f3digo barril",
-                "Litros_barriles": "Litros barriles",
-                "Litros_latas": "Litros latas",
-                "Litros_totales": "Litros totales",
+                "Ultima_s": "\u00daltima",
+                "p50_s": "p50",
+                "p90_s": "p90",
+                "p99_s": "p99",
+                "Filas_entrada": "Filas entrada",
+                "Filas_salida": "Filas salida",
+                "Memoria_pico_mb": "Memoria (MB)",
             }
+        ),
+        use_container_width=True,
+        hide_index=True,
+    )
+    latencias = histograma_latencias()
+    if not latencias.empty:
+        st.sidebar.caption("Descargas de Google Sheets por rango de latencia.")
+        st.sidebar.dataframe(
+            latencias.round(3).rename(columns={"Promedio_s": "Promedio (s)"}),
+            use_container_width=True,
+            hide_index=True,
         )
-        detalle["Barriles"] = detalle["Barriles"].round().astype(int)
-        detalle["Latas"] = detalle["Latas"].round().astype(int)
-        for columna in ["Litros barriles", "Litros latas", "Litros totales"]:
-            detalle[columna] = detalle[columna].round(2)
-
-        st.dataframe(detalle, use_container_width=True, hide_index=True)
-        st.download_button(
-            "Descargar detalle CSV",
-            data=detalle.to_csv(index=False).encode("utf-8-sig"),
-            file_name=f"detalle_despachos_{fecha_inicio}_{fecha_fin}.csv",
-            mime="text/csv",
-        )
+    if st.sidebar.button("Reiniciar mediciones", use_container_width=True):
+        reiniciar_mediciones()
+        st.rerun()
 
 
 # -----------------------------------------------------------------------------
@@ -1751,44 +1864,73 @@ def main() -> None:
     st.sidebar.markdown("## \U0001F37A CASTIZA")
     st.sidebar.caption("Panel de reportes e inventario")
     st.sidebar.subheader("Configuraci\u00f3n")
-    umbral_alerta = st.sidebar.number_input(
+    st.sidebar.number_input(
         "Alerta de inventario por estilo (L)",
         min_value=0.0,
         value=UMBRAL_ALERTA_PREDETERMINADO,
         step=25.0,
         help="Un estilo aparece en alerta cuando sus litros combinados quedan por debajo de este valor.",
-    )
-
+        key="umbral_alerta",
+        on_change=rerun_seccion,
+        args=("inventario", PESTANA_INVENTARIO),
+    )
+    st.sidebar.date_input(
+        "Inventario al",
+        value=hoy_bogota(),
+        max_value=hoy_bogota(),
+        help="Elige una fecha pasada para ver el inventario al cierre de ese d\u00eda.",
+        key="fecha_inventario",
+        on_change=rerun_seccion,
+        args=("inventario", PESTANA_INVENTARIO),
+    )
+
+    nombres_hojas = [HOJA_BARRILES, HOJA_MOVIMIENTOS_LATAS, HOJA_INVENTARIO_LATAS]
+    iniciar_actualizador(nombres_hojas)
     if st.sidebar.button("Actualizar datos desde Google Sheets", use_container_width=True):
-        leer_hoja.clear()
-        try:
-            st.rerun()
-        except AttributeError:
-            st.experimental_rerun()
-
-    with st.spinner("Consultando Google Sheets..."):
-        bruto_barriles, error_barriles = cargar_hoja_segura(HOJA_BARRILES)
-        bruto_latas, error_latas = cargar_hoja_segura(HOJA_MOVIMIENTOS_LATAS)
-        bruto_inventario_latas, error_inventario_latas = cargar_hoja_segura(
-            HOJA_INVENTARIO_LATAS
-        )
-
-    errores = []
-    if error_barriles:
-        errores.append(f"{HOJA_BARRILES}: {error_barriles}")
-    if error_latas:
-        errores.append(f"{HOJA_MOVIMIENTOS_LATAS}: {error_latas}")
-    if error_inventario_latas:
-        errores.append(f"{HOJA_INVENTARIO_LATAS}: {error_inventario_latas}")
-    for error in errores:
-        st.warning(f"No se pudo cargar {error}")
+        st.session_state["actualizacion_solicitada"] = solicitar_actualizacion(nombres_hojas)
+    if "actualizacion_solicitada" in st.session_state:
+        with st.sidebar:
+            vigilar_actualizacion()
+
+    aviso_carga = (
+        "Consultando Google Sheets..."
+        if ORIGEN_DATOS == ORIGEN_GOOGLE
+        else "Leyendo el espejo local..."
+    )
+    with st.spinner(aviso_carga):
+        hojas = cargar_hojas_concurrentes(nombres_hojas, lector=hoja_vigente)
+
+    preparadas: dict[str, pd.DataFrame] = {}
+    for nombre_hoja in nombres_hojas:
+        df, error = hojas[nombre_hoja]
+        if error:
+            st.warning(f"No se pudo cargar {nombre_hoja}: {error}")
+            df = preparador_hoja(nombre_hoja)(pd.DataFrame())
+        preparadas[nombre_hoja] = df
+    for nombre_hoja, error in errores_actualizacion().items():
+        if nombre_hoja in preparadas and not hojas[nombre_hoja][1]:
+            st.sidebar.caption(
+                f"\u26A0\uFE0F No se pudo actualizar {nombre_hoja}; "
+                "se muestra la \u00faltima versi\u00f3n le\u00edda."
+            )
 
-    df_barriles = preparar_barriles(bruto_barriles)
-    df_movimientos_latas = preparar_movimientos_latas(bruto_latas)
-    df_inventario_latas = preparar_inventario_latas(bruto_inventario_latas)
+    df_barriles = preparadas[HOJA_BARRILES]
+    df_movimientos_latas = preparadas[HOJA_MOVIMIENTOS_LATAS]
+    df_inventario_latas = preparadas[HOJA_INVENTARIO_LATAS]
 
-    inventario_barriles = obtener_inventario_barriles_actual(df_barriles)
-    despachos = construir_despachos(df_barriles, df_movimientos_latas)
+    huella_barriles = huella_tabla(df_barriles)
+    huella_latas = huella_tabla(df_movimientos_latas)
+    (
+        df_barriles,
+        df_movimientos_latas,
+        inventario_barriles,
+        despachos,
+    ) = derivar_tablas_compactas(
+        huella_barriles,
+        huella_latas,
+        df_barriles,
+        df_movimientos_latas,
+    )
 
     fechas_disponibles = []
     if not df_barriles.empty:
@@ -1802,25 +1944,51 @@ def main() -> None:
                 "\u00daltimo movimiento: " + ultima_fecha.strftime("%d/%m/%Y %H:%M")
             )
 
-    pestana_inventario, pestana_despachos = st.tabs(
-        ["\U0001F4E6 Inventario actual", "\U0001F4CA Despachos y ventas"]
+    version_despachos = f"{huella_barriles}|{huella_latas}"
+    opciones_despachos = opciones_filtros_por_version(version_despachos, despachos)
+    mostrar_filtros_despachos(opciones_despachos)
+
+    version_inventario = f"{huella_barriles}|{huella_latas}|{huella_tabla(df_inventario_latas)}"
+
+    # Solo se ejecuta la pestana abierta; cada seccion es un fragmento aparte.
+    pestana_inventario, pestana_evolucion, pestana_despachos = st.tabs(
+        [PESTANA_INVENTARIO, PESTANA_EVOLUCION, PESTANA_DESPACHOS],
+        key="pestana_principal",
+        on_change="rerun",
     )
 
-    with pestana_inventario:
-        mostrar_inventario_actual(
-            inventario_barriles,
-            df_inventario_latas,
-            umbral_alerta,
-        )
+    if pestana_inventario.open:
+        with pestana_inventario:
+            mostrar_seccion_inventario(
+                df_barriles,
+                df_movimientos_latas,
+                inventario_barriles,
+                df_inventario_latas,
+                version_inventario,
+            )
 
-    with pestana_despachos:
-        mostrar_despachos(despachos)
+    if pestana_evolucion.open:
+        with pestana_evolucion:
+            mostrar_evolucion_inventario(
+                df_barriles,
+                df_movimientos_latas,
+                df_inventario_latas,
+                version_inventario,
+            )
+
+    if pestana_despachos.open:
+        with pestana_despachos:
+            cubo = (
+                None if ALMACEN_DESPACHOS else cubo_despachos_por_version(version_despachos, despachos)
+            )
+            mostrar_despachos(despachos, cubo, version_despachos, opciones_despachos)
 
     st.markdown("---")
     st.caption(
         "Fuentes: DatosM, VLatas e InventarioLatasTR. "
         f"Conversi\u00f3n usada: 1 lata = {LITROS_POR_LATA:.3f} L."
     )
+    mostrar_panel_rendimiento()
 
 
 if __name__ == "__main__":
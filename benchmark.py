@@ -0,0 +1,624 @@
+"""
+Benchmark por etapas de la preparacion de datos, sobre hojas sinteticas.
+
+Genera CSV de DatosM, VLatas e InventarioLatasTR con las rarezas de las hojas
+reales (columnas duplicadas, fechas en varios formatos, miles con punto,
+litros escritos en Observaciones), mide tiempo y memoria de cada etapa y
+escribe un informe JSON que se puede comparar con uno anterior:
+
+    python benchmark.py --tamanos 10k,100k --informe base.json
+    python benchmark.py --tamanos 10k,100k --comparar base.json
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+import procesamiento
+from procesamiento import (
+    DIRECTORIO_SNAPSHOTS,
+    ESCRITORES_ESPEJO,
+    HOJA_BARRILES,
+    HOJA_INVENTARIO_LATAS,
+    HOJA_MOVIMIENTOS_LATAS,
+    UMBRAL_ALERTA_PREDETERMINADO,
+    activar_perfil_memoria,
+    combinar_columnas,
+    con_huella,
+    construir_cubo_despachos,
+    construir_despachos,
+    construir_resumen_inventario,
+    convertir_fechas,
+    filas_resultado,
+    guardar_preparada_compartida,
+    huella_contenido,
+    huella_espejo,
+    leer_preparada_compartida,
+    lector_origen,
+    medir_etapa,
+    obtener_inventario_barriles_actual,
+    parsear_csv_hoja,
+    preparar_barriles,
+    preparar_inventario_latas,
+    preparar_movimientos_latas,
+)
+
+LOGGER = logging.getLogger("benchmark")
+DIRECTORIO_DATOS = DIRECTORIO_SNAPSHOTS / "benchmark"
+SEMILLA = 20240601
+UMBRAL_REGRESION = 0.10
+# Diferencias menores a esto son ruido de medicion, no regresiones.
+PISO_RUIDO_SEGUNDOS = 0.005
+
+
+# -----------------------------------------------------------------------------
+# DATOS SINTETICOS
+# -----------------------------------------------------------------------------
+ESTILOS = [
+    "Golden", "IPA", "Session IPA", "Trigo", "Vienna Lager", "Stout", "Amber",
+    "Maracuyá", "Brown Ale Café", "Catharina Sour", "Gose", "NEIPA", "Imperial Stout",
+]
+RESPONSABLES = ["Andrea", "Camilo", "Diana", "Julián", "Marcela", "Sergio"]
+INICIO_DATOS = np.datetime64("2022-01-01T06:00:00")
+SEGUNDOS_HISTORIA = 3 * 365 * 86400
+
+# Formato de cada marca temporal y su probabilidad; "serial" es el numero de
+# dias de Google/Excel que aparece cuando una celda pierde el formato.
+FORMATOS_SINTETICOS = {
+    "%d/%m/%Y %H:%M:%S": 0.82,
+    "%d/%m/%Y": 0.06,
+    "%Y-%m-%d %H:%M:%S": 0.06,
+    "serial": 0.06,
+}
+
+ENCABEZADOS_BARRILES = [
+    "Marca temporal", "Código", "Estado", "Estilo", "Lote", "Cliente",
+    "Responsable", "Capacidad", "Observaciones", "Código", "Estado", "Cliente",
+]
+ENCABEZADOS_MOVIMIENTOS_LATAS = [
+    "Marca temporal", "Estilo", "Cantidad", "Lote", "Cliente", "Responsable",
+    "Estado", "Cantidad",
+]
+ENCABEZADOS_INVENTARIO_LATAS = [
+    "Estilo", "Lote", "Ingresadas", "Despachadas", "Devoluciones", "Bajas", "Disponible",
+]
+
+
+def texto(valores: np.ndarray | pd.Series) -> pd.Series:
+    return pd.Series(valores).astype(str).astype(object)
+
+
+def elegir(rng: np.random.Generator, opciones: list, filas: int, pesos=None) -> np.ndarray:
+    opciones = np.asarray(opciones, dtype=object)
+    if pesos is not None:
+        pesos = np.asarray(pesos, dtype=float)
+        pesos = pesos / pesos.sum()
+    return opciones[rng.choice(len(opciones), size=filas, p=pesos)]
+
+
+def marcas_temporales(rng: np.random.Generator, filas: int) -> pd.Series:
+    """
+    Fechas crecientes (las hojas solo reciben filas al final) agrupadas de a
+    tres, como un formulario que registra varios barriles en un envio, y
+    escritas en los formatos de FORMATOS_SINTETICOS.
+    """
+    segundos = np.sort(rng.integers(0, SEGUNDOS_HISTORIA, size=filas))
+    segundos = segundos[(np.arange(filas) // 3) * 3]
+    fechas = INICIO_DATOS + segundos.astype("timedelta64[s]")
+
+    serie = pd.Series(fechas)
+    formatos = elegir(rng, list(FORMATOS_SINTETICOS), filas, list(FORMATOS_SINTETICOS.values()))
+    resultado = pd.Series("", index=serie.index, dtype=object)
+    for formato in FORMATOS_SINTETICOS:
+        filas_formato = formatos == formato
+        if formato == "serial":
+            dias = (serie[filas_formato] - pd.Timestamp("1899-12-30")) / pd.Timedelta(days=1)
+            resultado[filas_formato] = texto(dias.round(6).to_numpy()).to_numpy()
+        else:
+            resultado[filas_formato] = serie[filas_formato].dt.strftime(formato).to_numpy()
+    return resultado
+
+
+def con_miles(cantidades: np.ndarray, rng: np.random.Generator, proporcion: float) -> pd.Series:
+    """Escribe cantidades como en Sheets: parte de las mayores a 999 con punto de miles."""
+    resultado = texto(cantidades)
+    miles = (cantidades >= 1000) & (rng.random(len(cantidades)) < proporcion)
+    resultado[miles] = (
+        texto(cantidades[miles] // 1000)
+        + "."
+        + texto(cantidades[miles] % 1000).str.zfill(3)
+    ).to_numpy()
+    return resultado
+
+
+def repartir_en_duplicadas(
+    valores: pd.Series,
+    en_segunda: np.ndarray,
+) -> tuple[pd.Series, pd.Series]:
+    """Cada fila llena solo una de las dos columnas duplicadas del formulario."""
+    return valores.where(~en_segunda, ""), valores.where(en_segunda, "")
+
+
+def generar_barriles(filas: int, rng: np.random.Generator) -> pd.DataFrame:
+    flota = max(60, filas // 40)
+    numero = rng.integers(0, flota, size=filas)
+    capacidad = np.array(["20", "30", "58"])[numero % 3]
+    codigo = texto(capacidad) + texto(numero).str.zfill(4)
+    sufijo = rng.random(filas)
+    codigo = codigo.where(sufijo >= 0.03, codigo + ".0")
+    codigo = codigo.where((sufijo < 0.03) | (sufijo >= 0.05), " " + codigo)
+
+    # Ciclo de cada barril: lavado, cuarto frio y despacho, en ese orden.
+    ciclo = pd.Series(numero).groupby(numero).cumcount().to_numpy() % 3
+    estado = texto(np.array(["Lavado", "En cuarto frío", "Despachado"])[ciclo])
+    variante = rng.random(filas) < 0.1
+    estado = estado.where(~(variante & (ciclo == 1)), "EN CUARTO FRIO ")
+    estado = estado.where(~(variante & (ciclo == 2)), "Despacho")
+    despachado = ciclo == 2
+
+    clientes = texto(elegir(rng, [f"Cliente {k:03d}" for k in range(1, 81)], filas,
+                            1 / np.arange(1, 81)))
+    clientes = clientes.where(rng.random(filas) >= 0.05, clientes.str.upper() + " ")
+    clientes = clientes.where(despachado, "")
+
+    lote = texto(rng.integers(100, 100 + max(20, filas // 200), size=filas))
+    lote = lote.where(rng.random(filas) >= 0.1, lote + ".0")
+
+    capacidad_escrita = texto(capacidad) + texto(elegir(rng, ["", " L", " litros"], filas))
+    capacidad_escrita = capacidad_escrita.where(rng.random(filas) < 0.3, "")
+
+    litros = texto(rng.integers(5, 58, size=filas))
+    observaciones = texto(
+        elegir(rng, ["", "Barril con {} lt", "{},5 litros", "ok, revisar válvula"], filas,
+               [0.9, 0.05, 0.03, 0.02])
+    )
+    con_litros = observaciones.str.contains("{}", regex=False)
+    observaciones[con_litros] = [
+        patron.format(valor) for patron, valor in zip(observaciones[con_litros], litros[con_litros])
+    ]
+
+    fechas = marcas_temporales(rng, filas)
+    segunda = rng.random(filas) < 0.3
+    codigo_1, codigo_2 = repartir_en_duplicadas(codigo, segunda)
+    estado_1, estado_2 = repartir_en_duplicadas(estado, segunda)
+    cliente_1, cliente_2 = repartir_en_duplicadas(clientes, segunda)
+
+    columnas = [
+        fechas, codigo_1, estado_1,
+        texto(elegir(rng, ESTILOS, filas)), lote, cliente_1,
+        texto(elegir(rng, RESPONSABLES, filas)), capacidad_escrita, observaciones,
+        codigo_2, estado_2, cliente_2,
+    ]
+    df = pd.concat([columna.reset_index(drop=True) for columna in columnas], axis=1)
+    df.columns = ENCABEZADOS_BARRILES
+    return df
+
+
+def generar_latas(filas: int, rng: np.random.Generator) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Devuelve VLatas y un InventarioLatasTR coherente con sus movimientos."""
+    estados = np.array(["", "Despacho", "Ingreso", "Devolución", "Baja"])
+    clase = rng.choice(len(estados), size=filas, p=[0.3, 0.45, 0.15, 0.05, 0.05])
+    cantidad = elegir(rng, [6, 12, 24, 48, 96], filas).astype(np.int64)
+    ingreso = clase == 2
+    cantidad[ingreso] = rng.integers(5, 50, size=int(ingreso.sum())) * 100
+
+    estilo = elegir(rng, ESTILOS, filas)
+    lote = rng.integers(100, 100 + max(20, filas // 50), size=filas)
+
+    cantidad_escrita = con_miles(cantidad, rng, proporcion=0.5)
+    decimal = (rng.random(filas) < 0.03) & (cantidad < 1000)
+    cantidad_escrita[decimal] = cantidad_escrita[decimal] + ",0"
+    segunda = rng.random(filas) < 0.5
+    cantidad_1, cantidad_2 = repartir_en_duplicadas(cantidad_escrita, segunda)
+
+    es_despacho = clase <= 1
+    clientes = texto(elegir(rng, [f"Cliente {k:03d}" for k in range(1, 81)], filas,
+                            1 / np.arange(1, 81)))
+    fechas = marcas_temporales(rng, filas)
+
+    columnas = [
+        fechas, texto(estilo), cantidad_1, texto(lote), clientes.where(es_despacho, ""),
+        texto(elegir(rng, RESPONSABLES, filas)), texto(estados[clase]), cantidad_2,
+    ]
+    movimientos = pd.concat([columna.reset_index(drop=True) for columna in columnas], axis=1)
+    movimientos.columns = ENCABEZADOS_MOVIMIENTOS_LATAS
+
+    totales = (
+        pd.DataFrame({"Estilo": estilo, "Lote": lote, "Clase": clase, "Cantidad": cantidad})
+        .pivot_table(index=["Estilo", "Lote"], columns="Clase", values="Cantidad",
+                     aggfunc="sum", fill_value=0)
+        .reindex(columns=range(len(estados)), fill_value=0)
+    )
+    despachadas = totales[0] + totales[1]
+    disponible = totales[2] - despachadas + totales[3] - totales[4]
+    # La planta no despacha latas que no tiene: el faltante entra como ingreso.
+    ingresadas = totales[2] + (-disponible).clip(lower=0)
+    disponible = disponible.clip(lower=0)
+    inventario = pd.DataFrame(
+        {
+            "Estilo": totales.index.get_level_values("Estilo").astype(str),
+            "Lote": totales.index.get_level_values("Lote").astype(str),
+            "Ingresadas": con_miles(ingresadas.to_numpy(), rng, 1.0).to_numpy(),
+            "Despachadas": con_miles(despachadas.to_numpy(), rng, 1.0).to_numpy(),
+            "Devoluciones": texto(totales[3].to_numpy()).to_numpy(),
+            "Bajas": texto(totales[4].to_numpy()).to_numpy(),
+            "Disponible": con_miles(disponible.to_numpy(), rng, 1.0).to_numpy(),
+        }
+    )
+    inventario.columns = ENCABEZADOS_INVENTARIO_LATAS
+    return movimientos, inventario
+
+
+def generar_hojas(filas: int, directorio: Path, semilla: int = SEMILLA) -> dict[str, Path]:
+    """Escribe los tres CSV de un tamano; si ya existen para esa semilla, los reutiliza."""
+    destino = directorio / f"{filas}_{semilla}"
+    rutas = {
+        nombre: destino / f"{nombre}.csv"
+        for nombre in (HOJA_BARRILES, HOJA_MOVIMIENTOS_LATAS, HOJA_INVENTARIO_LATAS)
+    }
+    if all(ruta.exists() for ruta in rutas.values()):
+        return rutas
+
+    LOGGER.info("Generando hojas sinteticas de %d filas en %s", filas, destino)
+    rng = np.random.default_rng(semilla + filas)
+    barriles = generar_barriles(filas, rng)
+    movimientos, inventario = generar_latas(filas, rng)
+
+    destino.mkdir(parents=True, exist_ok=True)
+    for nombre, df in (
+        (HOJA_BARRILES, barriles),
+        (HOJA_MOVIMIENTOS_LATAS, movimientos),
+        (HOJA_INVENTARIO_LATAS, inventario),
+    ):
+        temporal = rutas[nombre].with_name(f".{rutas[nombre].name}.{os.getpid()}.tmp")
+        df.to_csv(temporal, index=False)
+        os.replace(temporal, rutas[nombre])
+    return rutas
+
+
+# -----------------------------------------------------------------------------
+# MEDICION POR ETAPAS
+# -----------------------------------------------------------------------------
+def reiniciar_memos() -> None:
+    """Vacia los memos del proceso para medir cada repeticion en frio."""
+    with procesamiento._BLOQUEO_MEMO_LIMPIEZA:
+        procesamiento._MEMO_LIMPIEZA.clear()
+    procesamiento.resolver_esquema.cache_clear()
+    with procesamiento._BLOQUEO_INDICE_BARRILES:
+        procesamiento._INDICE_ESTADO_BARRILES.clear()
+    with procesamiento._BLOQUEO_VARIACIONES:
+        procesamiento._VARIACIONES_INVENTARIO.clear()
+    with procesamiento._BLOQUEO_MEMO_ESPEJO:
+        procesamiento._MEMO_ESPEJO.clear()
+
+
+def cronometrar_etapa(
+    nombre: str,
+    funcion: Callable[[], object],
+    filas_entrada: int,
+    repeticiones: int,
+    reiniciar: Callable[[], None] = reiniciar_memos,
+) -> dict:
+    """
+    Mide `funcion` en frio: mediana y minimo de `repeticiones` ejecuciones y,
+    en una ejecucion aparte (tracemalloc la hace mas lenta), el pico de memoria.
+    """
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        reiniciar()
+        gc.collect()
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+
+    # Se mide con medir_etapa: las etapas instrumentadas por dentro reinician
+    # el pico de tracemalloc y medir_etapa lo acumula entre etapas anidadas.
+    reiniciar()
+    gc.collect()
+    activar_perfil_memoria(True)
+    try:
+        with medir_etapa(f"benchmark {nombre}") as medicion:
+            funcion()
+    finally:
+        activar_perfil_memoria(False)
+
+    return {
+        "etapa": nombre,
+        "filas": filas_entrada,
+        "filas_salida": filas_resultado(resultado),
+        "segundos_mediana": statistics.median(tiempos),
+        "segundos_minimo": min(tiempos),
+        "memoria_pico_mb": medicion["memoria_pico_mb"],
+    }
+
+
+def etapas_graficos(
+    cubo: pd.DataFrame,
+    resumen: pd.DataFrame,
+    inventario_barriles: pd.DataFrame,
+    inventario_latas: pd.DataFrame,
+):
+    """
+    Constructores de graficos del tablero con los argumentos que usa la vista.
+    Se importa Rep aqui para que el resto del benchmark no dependa de Streamlit.
+    """
+    import Rep
+
+    top_n = 10
+    datos_estilo = (
+        cubo.groupby("Estilo", as_index=False, observed=True)["Litros_totales"].sum()
+        .rename(columns={"Litros_totales": "Litros"})
+    )
+    llamadas = {
+        "grafico_inventario_apilado": (Rep.grafico_inventario_apilado, (resumen,), {}),
+        "grafico_estado_inventario": (
+            Rep.grafico_estado_inventario, (resumen, UMBRAL_ALERTA_PREDETERMINADO), {}
+        ),
+        "grafico_mezcla_inventario": (Rep.grafico_mezcla_inventario, (resumen,), {}),
+        "grafico_lotes_latas": (Rep.grafico_lotes_latas, (inventario_latas,), {}),
+        "grafico_capacidad_barriles": (
+            Rep.grafico_capacidad_barriles, (inventario_barriles,), {}
+        ),
+        "crear_grafico_dona": (
+            Rep.crear_grafico_dona, (datos_estilo,),
+            {"categoria": "Estilo", "valor": "Litros", "titulo": "Distribucion por estilo"},
+        ),
+        "grafico_litros_por_categoria": (
+            Rep.grafico_litros_por_categoria, (cubo,),
+            {"categoria": "Cliente", "titulo": "Litros por cliente", "top_n": top_n},
+        ),
+        "grafico_mensual_presentacion": (Rep.grafico_mensual_presentacion, (cubo,), {}),
+        "grafico_pareto_clientes": (Rep.grafico_pareto_clientes, (cubo, top_n), {}),
+        "grafico_mapa_cliente_estilo": (Rep.grafico_mapa_cliente_estilo, (cubo, top_n), {}),
+        "grafico_unidades_por_estilo": (
+            Rep.grafico_unidades_por_estilo, (cubo, top_n, "Barriles"), {}
+        ),
+        "grafico_area_estilos": (Rep.grafico_area_estilos, (cubo, top_n), {}),
+        "grafico_tendencia_presentacion": (Rep.grafico_tendencia_presentacion, (cubo,), {}),
+        "grafico_media_movil": (Rep.grafico_media_movil, (cubo,), {}),
+        "grafico_dia_semana": (Rep.grafico_dia_semana, (cubo,), {}),
+        "grafico_mapa_horario": (Rep.grafico_mapa_horario, (cubo,), {}),
+    }
+    for nombre, (funcion, args, kwargs) in llamadas.items():
+        # Igual que especificacion_grafico, sin su cache: construir y serializar.
+        def construir(funcion=funcion, args=args, kwargs=kwargs):
+            grafico = funcion(*args, **kwargs)
+            return None if grafico is None else Rep.estilizar_grafico(grafico).to_dict()
+
+        yield nombre, construir
+
+
+def etapa_filtros(despachos: pd.DataFrame, cubo: pd.DataFrame) -> tuple[Callable, Callable]:
+    """
+    aplicar_filtros_despachos lee la barra lateral desde session_state; aqui
+    se fija una seleccion tipica (todo el historial, tres clientes, barriles).
+    """
+    import Rep
+    import streamlit as st
+
+    clientes = (
+        despachos.groupby("Cliente", observed=True)["Litros_totales"].sum().nlargest(3).index
+    )
+    st.session_state["periodo_despachos"] = "Todo el historial"
+    st.session_state["clientes_despachos"] = [str(cliente) for cliente in clientes]
+    st.session_state["estilos_despachos"] = []
+    st.session_state["presentacion_despachos"] = "Barril"
+    st.session_state["top_n_despachos"] = 10
+
+    def reiniciar() -> None:
+        # El indice de filtros se cachea por version: se mide construirlo.
+        Rep.indice_filtros_por_version.clear()
+
+    return (lambda: Rep.aplicar_filtros_despachos(despachos, cubo, "benchmark")), reiniciar
+
+
+def medir_tamano(filas: int, rutas: dict[str, Path], repeticiones: int, graficos: bool) -> list[dict]:
+    resultados = []
+
+    def medir(nombre, funcion, filas_entrada, reiniciar=reiniciar_memos):
+        resultado = cronometrar_etapa(nombre, funcion, filas_entrada, repeticiones, reiniciar)
+        LOGGER.info(
+            "%-32s %9d filas  %8.3f s  %8.1f MB",
+            nombre, filas_entrada, resultado["segundos_mediana"], resultado["memoria_pico_mb"],
+        )
+        resultados.append(resultado)
+
+    contenidos = {nombre: ruta.read_bytes() for nombre, ruta in rutas.items()}
+    crudos = {nombre: parsear_csv_hoja(contenido) for nombre, contenido in contenidos.items()}
+    bruto_barriles = crudos[HOJA_BARRILES]
+    bruto_latas = crudos[HOJA_MOVIMIENTOS_LATAS]
+    bruto_inventario = crudos[HOJA_INVENTARIO_LATAS]
+
+    medir("parsear_csv_hoja", lambda: parsear_csv_hoja(contenidos[HOJA_BARRILES]), filas)
+    espejo = rutas[HOJA_BARRILES].parent / "espejo"
+    huella = huella_contenido(contenidos[HOJA_BARRILES])
+    for origen, escribir in ESCRITORES_ESPEJO.items():
+        if huella_espejo(HOJA_BARRILES, origen, espejo) != huella:
+            escribir(HOJA_BARRILES, con_huella(bruto_barriles.copy(), huella), espejo)
+        leer = lector_origen(origen)
+        medir(f"leer_espejo_{origen}", lambda leer=leer: leer(HOJA_BARRILES, espejo), filas)
+    marcas = combinar_columnas(bruto_barriles, "Marca temporal")
+    medir("convertir_fechas", lambda: convertir_fechas(marcas), filas)
+    medir("combinar_columnas", lambda: combinar_columnas(bruto_barriles, "Codigo"), filas)
+    medir("preparar_barriles", lambda: preparar_barriles(bruto_barriles), filas)
+    medir("preparar_movimientos_latas", lambda: preparar_movimientos_latas(bruto_latas), filas)
+    medir(
+        "preparar_inventario_latas",
+        lambda: preparar_inventario_latas(bruto_inventario),
+        len(bruto_inventario),
+    )
+
+    barriles = preparar_barriles(bruto_barriles)
+    latas = preparar_movimientos_latas(bruto_latas)
+    inventario_latas = preparar_inventario_latas(bruto_inventario)
+    compartida = rutas[HOJA_BARRILES].parent / "preparadas"
+    guardar_preparada_compartida(HOJA_BARRILES, con_huella(barriles, huella), compartida)
+    medir(
+        "leer_preparada_compartida",
+        lambda: leer_preparada_compartida(HOJA_BARRILES, huella, compartida),
+        filas,
+    )
+    medir("construir_despachos", lambda: construir_despachos(barriles, latas), filas)
+    despachos = construir_despachos(barriles, latas)
+    medir("construir_cubo_despachos", lambda: construir_cubo_despachos(despachos), len(despachos))
+    cubo = construir_cubo_despachos(despachos)
+
+    if not graficos:
+        return resultados
+
+    filtrar, reiniciar_filtros = etapa_filtros(despachos, cubo)
+    medir("aplicar_filtros_despachos", filtrar, len(despachos), reiniciar_filtros)
+
+    inventario_barriles = obtener_inventario_barriles_actual(barriles)
+    resumen = construir_resumen_inventario(
+        inventario_barriles, inventario_latas, UMBRAL_ALERTA_PREDETERMINADO
+    )
+    for nombre, construir in etapas_graficos(
+        cubo, resumen, inventario_barriles, inventario_latas
+    ):
+        medir(nombre, construir, len(cubo), lambda: None)
+    return resultados
+
+
+# -----------------------------------------------------------------------------
+# INFORME Y COMPARACION
+# -----------------------------------------------------------------------------
+def describir_entorno() -> dict:
+    import pyarrow
+
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "pyarrow": pyarrow.__version__,
+        "plataforma": platform.platform(),
+        "procesador": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def comparar_informes(actual: dict, base: dict, umbral: float) -> list[dict]:
+    """Cruza las etapas por (etapa, filas) y marca las que empeoran mas de `umbral`."""
+    anteriores = {(r["etapa"], r["filas"]): r for r in base["resultados"]}
+    filas = []
+    for resultado in actual["resultados"]:
+        anterior = anteriores.get((resultado["etapa"], resultado["filas"]))
+        if anterior is None:
+            continue
+        antes = anterior["segundos_mediana"]
+        ahora = resultado["segundos_mediana"]
+        razon = ahora / antes if antes > 0 else float("inf")
+        filas.append(
+            {
+                "etapa": resultado["etapa"],
+                "filas": resultado["filas"],
+                "antes": antes,
+                "ahora": ahora,
+                "razon": razon,
+                "memoria_antes_mb": anterior["memoria_pico_mb"],
+                "memoria_ahora_mb": resultado["memoria_pico_mb"],
+                "regresion": razon > 1 + umbral and ahora - antes > PISO_RUIDO_SEGUNDOS,
+            }
+        )
+    return filas
+
+
+def imprimir_comparacion(filas: list[dict]) -> None:
+    print(f"{'etapa':32} {'filas':>9} {'antes s':>9} {'ahora s':>9} {'razon':>7} {'MB':>15}")
+    for fila in filas:
+        marca = "  REGRESION" if fila["regresion"] else ""
+        memoria = f"{fila['memoria_antes_mb']:.0f}->{fila['memoria_ahora_mb']:.0f}"
+        print(
+            f"{fila['etapa']:32} {fila['filas']:>9} {fila['antes']:>9.3f} "
+            f"{fila['ahora']:>9.3f} {fila['razon']:>6.2f}x {memoria:>15}{marca}"
+        )
+
+
+def leer_tamano(valor: str) -> int:
+    valor = valor.strip().lower()
+    multiplicador = {"k": 1_000, "m": 1_000_000}.get(valor[-1:], 1)
+    numero = valor[:-1] if multiplicador > 1 else valor
+    return int(float(numero) * multiplicador)
+
+
+def leer_argumentos(argumentos: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--tamanos",
+        default="10k,100k",
+        help="Filas por hoja, separadas por comas (10k, 100k, 1m, 10m).",
+    )
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=SEMILLA)
+    parser.add_argument("--datos", type=Path, default=DIRECTORIO_DATOS)
+    parser.add_argument("--informe", type=Path, default=DIRECTORIO_DATOS / "informe.json")
+    parser.add_argument("--comparar", type=Path, help="Informe anterior para detectar regresiones.")
+    parser.add_argument("--umbral-regresion", type=float, default=UMBRAL_REGRESION)
+    parser.add_argument(
+        "--sin-graficos",
+        action="store_true",
+        help="Omite filtros y graficos (no importa Rep ni Streamlit).",
+    )
+    opciones = parser.parse_args(argumentos)
+    try:
+        opciones.tamanos = [leer_tamano(tamano) for tamano in opciones.tamanos.split(",") if tamano.strip()]
+    except ValueError:
+        parser.error(f"Tamanos no validos: {opciones.tamanos}")
+    if opciones.repeticiones < 1:
+        parser.error("--repeticiones debe ser al menos 1")
+    return opciones
+
+
+def main(argumentos: list[str] | None = None) -> int:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    # Cada etapa ya queda en el informe; las lineas por etapa serian ruido.
+    logging.getLogger("procesamiento.rendimiento").setLevel(logging.WARNING)
+    opciones = leer_argumentos(argumentos)
+
+    resultados = []
+    for filas in opciones.tamanos:
+        rutas = generar_hojas(filas, opciones.datos, opciones.semilla)
+        resultados.extend(
+            medir_tamano(filas, rutas, opciones.repeticiones, not opciones.sin_graficos)
+        )
+
+    informe = {
+        "generado": datetime.now().isoformat(timespec="seconds"),
+        "semilla": opciones.semilla,
+        "repeticiones": opciones.repeticiones,
+        "entorno": describir_entorno(),
+        "resultados": resultados,
+    }
+    opciones.informe.parent.mkdir(parents=True, exist_ok=True)
+    opciones.informe.write_text(json.dumps(informe, indent=1), encoding="utf-8")
+    LOGGER.info("Informe escrito en %s", opciones.informe)
+
+    if opciones.comparar is None:
+        return 0
+    base = json.loads(opciones.comparar.read_text(encoding="utf-8"))
+    comparacion = comparar_informes(informe, base, opciones.umbral_regresion)
+    imprimir_comparacion(comparacion)
+    regresiones = [fila for fila in comparacion if fila["regresion"]]
+    if regresiones:
+        LOGGER.warning("%d etapas empeoraron mas de %.0f%%", len(regresiones),
+                       opciones.umbral_regresion * 100)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,3043 @@
+"""
+Procesamiento de las hojas de Castiza sin Streamlit.
+
+Lectura de Google Sheets con snapshots en disco o de un espejo local (Parquet
+o SQLite), limpieza, ingesta incremental y construccion de inventario y
+despachos. Lo usan el tablero (Rep.py), que agrega las caches de Streamlit, y
+los reportes programados (reporte_batch.py).
+"""
+from __future__ import annotations
+
+import contextlib
+import csv
+import functools
+import hashlib
+import io
+import itertools
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import tracemalloc
+import unicodedata
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from pathlib import Path
+from typing import Callable
+from urllib.parse import quote, unquote
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import requests
+
+try:  # Bloqueos entre procesos; sin fcntl (Windows) solo se bloquea entre hilos.
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# -----------------------------------------------------------------------------
+# CONFIGURACION GENERAL
+# -----------------------------------------------------------------------------
+SHEET_ID = "1FjQ8XBDwDdrlJZsNkQ6YyaygkHLhpKmfLBv6wd3uluY"
+# Se puede apuntar a otro servidor (por ejemplo uno local de pruebas).
+SHEET_BASE_URL = os.environ.get(
+    "REPORTES_SHEETS_URL", f"https://docs.google.com/spreadsheets/d/{SHEET_ID}"
+).rstrip("/")
+
+HOJA_BARRILES = "DatosM"
+HOJA_MOVIMIENTOS_LATAS = "VLatas"
+HOJA_INVENTARIO_LATAS = "InventarioLatasTR"
+
+# Snapshots en disco de cada hoja: sobreviven reinicios y se comparten entre procesos.
+DIRECTORIO_SNAPSHOTS = Path(os.environ.get("REPORTES_CACHE_DIR", ".cache_reportes"))
+TTL_SNAPSHOT_SEGUNDOS = 120
+
+# DatosM y VLatas solo crecen: se descargan las filas nuevas y se agregan a la
+# tabla preparada local. Cada cierto tiempo se reingiere la hoja completa.
+INGESTA_INCREMENTAL = os.environ.get("REPORTES_INGESTA_INCREMENTAL", "1") != "0"
+HOJAS_INCREMENTALES = {HOJA_BARRILES, HOJA_MOVIMIENTOS_LATAS}
+DIRECTORIO_INGESTA = DIRECTORIO_SNAPSHOTS / "ingesta"
+REINGESTA_COMPLETA_SEGUNDOS = 6 * 60 * 60
+# Versiones previas que una tabla ingerida recuerda haber extendido solo con
+# filas al final; los indices del proceso se extienden en lugar de rehacerse.
+LIMITE_LINAJE = 64
+# Las filas agregadas se guardan en partes aparte; la tabla se compacta en un
+# solo archivo en cada reingesta completa o al pasar de este numero de partes.
+LIMITE_PARTES_INGESTA = 32
+
+# Las hojas se descargan por fragmentos; una pagina de error de Google se
+# reconoce en los primeros bytes. El texto queda en columnas respaldadas por Arrow.
+TAMANO_FRAGMENTO_DESCARGA = 1 << 20
+BYTES_DETECCION_HTML = 512
+TIPO_TEXTO = pd.StringDtype("pyarrow")
+
+# Conexiones HTTP reutilizadas entre descargas y reintentos ante fallas
+# transitorias, con espera exponencial y jitter.
+CONEXIONES_HTTP = 8
+TIMEOUT_DESCARGA = (5, 30)  # conexion, lectura
+REINTENTOS_DESCARGA = 3
+ESPERA_BASE_REINTENTO = 0.5
+ESPERA_MAXIMA_REINTENTO = 8.0
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+LIMITES_LATENCIA = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Columnas de cada hoja que lee la preparacion. Con la consulta reducida solo
+# esas columnas se piden a Google; el encabezado se guarda en DIRECTORIO_ESQUEMAS.
+CONSULTA_REDUCIDA = os.environ.get("REPORTES_CONSULTA_REDUCIDA", "1") != "0"
+DIRECTORIO_ESQUEMAS = DIRECTORIO_SNAPSHOTS / "esquemas"
+COLUMNA_MARCA_TEMPORAL = "Marca temporal"
+COLUMNAS_ORIGEN = {
+    HOJA_BARRILES: (
+        COLUMNA_MARCA_TEMPORAL,
+        "Codigo",
+        "Lote",
+        "Estilo",
+        "Estado",
+        "Cliente",
+        "Responsable",
+        "Observaciones",
+        "Capacidad",
+    ),
+    HOJA_MOVIMIENTOS_LATAS: (
+        COLUMNA_MARCA_TEMPORAL,
+        "Estilo",
+        "Cantidad",
+        "Lote",
+        "Cliente",
+        "Responsable",
+        "Estado",
+    ),
+    HOJA_INVENTARIO_LATAS: (
+        "Estilo",
+        "Lote",
+        "Ingresadas",
+        "Despachadas",
+        "Devoluciones",
+        "Bajas",
+        "Disponible",
+    ),
+}
+
+# Origen de las hojas: Google Sheets en vivo o un espejo local (Parquet o
+# SQLite) que mantiene al dia sincronizar_espejo.py.
+ORIGEN_GOOGLE = "google"
+ORIGEN_PARQUET = "parquet"
+ORIGEN_SQLITE = "sqlite"
+ORIGEN_DATOS = os.environ.get("REPORTES_ORIGEN", ORIGEN_GOOGLE).strip().lower()
+DIRECTORIO_ESPEJO = Path(os.environ.get("REPORTES_ESPEJO_DIR", "espejo"))
+ARCHIVO_ESPEJO_SQLITE = "hojas.sqlite"
+TABLA_ESTADO_ESPEJO = "espejo_hojas"
+
+# Historia de despachos en SQLite con indices por Fecha, Cliente y Estilo: los
+# filtros y agregados de la seccion de despachos se resuelven con SQL.
+ALMACEN_DESPACHOS = os.environ.get("REPORTES_ALMACEN_DESPACHOS", "0") != "0"
+RUTA_ALMACEN_DESPACHOS = DIRECTORIO_SNAPSHOTS / "despachos.sqlite"
+
+# Varias replicas del tablero sobre el mismo directorio de cache: un bloqueo de
+# archivo por hoja hace que solo una descargue o prepare cada version, y las
+# tablas preparadas se publican en Arrow IPC para que las demas las mapeen.
+CACHE_COMPARTIDA = os.environ.get("REPORTES_CACHE_COMPARTIDA", "1") != "0"
+DIRECTORIO_COMPARTIDO = DIRECTORIO_SNAPSHOTS / "preparadas"
+DIRECTORIO_BLOQUEOS = DIRECTORIO_SNAPSHOTS / "bloqueos"
+
+# Un hilo por proceso relee las hojas cada tanto y reemplaza las vigentes: las
+# sesiones reciben siempre la ultima version buena sin esperar a Google. Las
+# hojas revalidadas hace menos de TTL_SNAPSHOT_SEGUNDOS no se vuelven a pedir.
+# Con 0 no hay hilo y las hojas vencidas se releen al pedirlas.
+INTERVALO_ACTUALIZACION_SEGUNDOS = float(
+    os.environ.get("REPORTES_INTERVALO_ACTUALIZACION", TTL_SNAPSHOT_SEGUNDOS)
+)
+
+LOGGER = logging.getLogger(__name__)
+_BLOQUEO_SNAPSHOTS = threading.Lock()
+_BLOQUEOS_POR_HOJA: dict[str, threading.Lock] = {}
+_REVALIDACIONES_EN_CURSO: set[str] = set()
+_HOJAS_LEIDAS_EN_PROCESO: set[str] = set()
+
+LITROS_POR_LATA = 0.330
+ESTADOS_DESPACHO = {"despacho", "despachado"}
+ESTADO_CUARTO_FRIO = "en cuarto frio"
+
+# Columna de InventarioLatasTR que mueve cada estado de VLatas. El estado vacio
+# es despacho historico; los estados desconocidos no alteran el inventario.
+CLASES_MOVIMIENTO_LATAS = {
+    "": "Despachadas",
+    **{estado: "Despachadas" for estado in ESTADOS_DESPACHO},
+    "ingreso": "Ingresadas",
+    "ingresado": "Ingresadas",
+    "entrada": "Ingresadas",
+    "devolucion": "Devoluciones",
+    "devuelto": "Devoluciones",
+    "baja": "Bajas",
+    "dado de baja": "Bajas",
+}
+SIGNO_MOVIMIENTO_LATAS = {"Ingresadas": 1, "Despachadas": -1, "Devoluciones": 1, "Bajas": -1}
+
+# Representacion compacta de las tablas preparadas: textos repetidos como
+# categorias con un diccionario comun y numeros de 32 bits.
+COLUMNAS_CATEGORICAS = (
+    "Cliente",
+    "Estilo",
+    "Estado",
+    "Estado_normalizado",
+    "Responsable",
+    "Lote",
+)
+COLUMNAS_CONTEO = ("Barriles", "Cantidad", "Latas")
+COLUMNAS_LITROS = ("Litros", "Litros_barriles", "Litros_latas", "Litros_totales")
+TIPO_PRESENTACION = pd.CategoricalDtype(["Barril", "Lata"])
+COLUMNAS_CUBO = ["Dia", "Hora", "Cliente", "Estilo", "Tipo"]
+COLUMNAS_INDICE_FILTROS = ("Cliente", "Estilo", "Tipo")
+
+UMBRAL_ALERTA_PREDETERMINADO = 200.0
+
+# Formatos en los que Google Forms/Sheets entrega las marcas temporales.
+FORMATOS_FECHA = (
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M",
+    "%d/%m/%Y",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d",
+)
+TAMANO_MUESTRA_FECHAS = 200
+
+
+# -----------------------------------------------------------------------------
+# INSTRUMENTACION
+# -----------------------------------------------------------------------------
+# Las etapas costosas registran tiempo, filas de entrada/salida y, con el perfil
+# de memoria activo, el pico de memoria. Cada etapa guarda sus ultimas
+# mediciones (compartidas por todas las sesiones del proceso) y escribe una
+# linea de log clave=valor en el logger "procesamiento.rendimiento".
+MEDICIONES_POR_ETAPA = 200
+LOGGER_RENDIMIENTO = logging.getLogger(f"{__name__}.rendimiento")
+_MEDICIONES: dict[str, deque] = {}
+_BLOQUEO_MEDICIONES = threading.Lock()
+_ETAPAS_EN_CURSO = threading.local()
+
+
+def activar_perfil_memoria(activo: bool) -> None:
+    """tracemalloc hace mas lento todo el proceso, por eso se activa a pedido."""
+    if activo and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not activo and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def filas_resultado(valor: object) -> int | None:
+    if isinstance(valor, tuple) and valor:
+        valor = valor[0]
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        return len(valor)
+    return None
+
+
+def formato_medicion(medicion: dict) -> str:
+    partes = []
+    for clave, valor in medicion.items():
+        if valor is None:
+            continue
+        if isinstance(valor, float):
+            valor = f"{valor:.4f}"
+        elif isinstance(valor, str):
+            valor = json.dumps(valor, ensure_ascii=False)
+        partes.append(f"{clave}={valor}")
+    return " ".join(partes)
+
+
+def registrar_medicion(medicion: dict) -> None:
+    with _BLOQUEO_MEDICIONES:
+        ventana = _MEDICIONES.get(medicion["etapa"])
+        if ventana is None:
+            ventana = _MEDICIONES[medicion["etapa"]] = deque(maxlen=MEDICIONES_POR_ETAPA)
+        ventana.append(medicion)
+    LOGGER_RENDIMIENTO.info(formato_medicion(medicion))
+
+
+@contextlib.contextmanager
+def medir_etapa(etapa: str, filas_entrada: int | None = None):
+    """
+    Mide el bloque como `etapa`. El bloque puede anotar `filas_salida` u otros
+    datos en la medicion que recibe. El pico de memoria incluye el de las
+    etapas anidadas; con varios hilos a la vez es aproximado, porque
+    tracemalloc mide todo el proceso.
+    """
+    medicion = {"etapa": etapa, "filas_entrada": filas_entrada, "filas_salida": None}
+    pila = _ETAPAS_EN_CURSO.__dict__.setdefault("pila", [])
+    marco = {"inicio": 0, "pico": 0}
+    con_memoria = tracemalloc.is_tracing()
+    if con_memoria:
+        actual, pico = tracemalloc.get_traced_memory()
+        if pila:
+            pila[-1]["pico"] = max(pila[-1]["pico"], pico)
+        tracemalloc.reset_peak()
+        marco["inicio"] = actual
+    pila.append(marco)
+
+    inicio = time.perf_counter()
+    try:
+        yield medicion
+    except BaseException:
+        medicion["error"] = True
+        raise
+    finally:
+        medicion["segundos"] = time.perf_counter() - inicio
+        medicion["memoria_pico_mb"] = None
+        pila.pop()
+        if con_memoria and tracemalloc.is_tracing():
+            pico = max(marco["pico"], tracemalloc.get_traced_memory()[1])
+            medicion["memoria_pico_mb"] = (pico - marco["inicio"]) / 2**20
+            if pila:
+                pila[-1]["pico"] = max(pila[-1]["pico"], pico)
+        registrar_medicion(medicion)
+
+
+def instrumentar(funcion: Callable) -> Callable:
+    """Mide `funcion` con su nombre; las filas salen del primer DataFrame y del resultado."""
+
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        filas_entrada = next(
+            (len(valor) for valor in args if isinstance(valor, pd.DataFrame)), None
+        )
+        with medir_etapa(funcion.__name__, filas_entrada) as medicion:
+            resultado = funcion(*args, **kwargs)
+            medicion["filas_salida"] = filas_resultado(resultado)
+        return resultado
+
+    return envoltura
+
+
+def resumen_rendimiento() -> pd.DataFrame:
+    """Ultima medicion y percentiles moviles de cada etapa, de la mas lenta a la mas rapida."""
+    with _BLOQUEO_MEDICIONES:
+        ventanas = {etapa: list(ventana) for etapa, ventana in _MEDICIONES.items()}
+
+    filas = []
+    for etapa, mediciones in ventanas.items():
+        segundos = np.array([medicion["segundos"] for medicion in mediciones])
+        memoria = [
+            medicion["memoria_pico_mb"]
+            for medicion in mediciones
+            if medicion["memoria_pico_mb"] is not None
+        ]
+        ultima = mediciones[-1]
+        p50, p90, p99 = np.percentile(segundos, [50, 90, 99])
+        filas.append(
+            {
+                "Etapa": etapa,
+                "Mediciones": len(mediciones),
+                "Ultima_s": ultima["segundos"],
+                "p50_s": p50,
+                "p90_s": p90,
+                "p99_s": p99,
+                "Filas_entrada": ultima["filas_entrada"],
+                "Filas_salida": ultima["filas_salida"],
+                "Memoria_pico_mb": max(memoria) if memoria else np.nan,
+                "Errores": sum(bool(medicion.get("error")) for medicion in mediciones),
+            }
+        )
+    if not filas:
+        return pd.DataFrame(
+            columns=[
+                "Etapa", "Mediciones", "Ultima_s", "p50_s", "p90_s", "p99_s",
+                "Filas_entrada", "Filas_salida", "Memoria_pico_mb", "Errores",
+            ]
+        )
+    resumen = pd.DataFrame(filas).astype({"Filas_entrada": "Int64", "Filas_salida": "Int64"})
+    return resumen.sort_values("p50_s", ascending=False, ignore_index=True)
+
+
+def reiniciar_mediciones() -> None:
+    with _BLOQUEO_MEDICIONES:
+        _MEDICIONES.clear()
+    with _BLOQUEO_LATENCIAS:
+        _LATENCIAS.clear()
+
+
+# -----------------------------------------------------------------------------
+# LIMPIEZA POR VALORES UNICOS
+# -----------------------------------------------------------------------------
+# Las columnas de las hojas repiten pocos valores (estados, clientes, estilos).
+# Cada limpiador se aplica solo a los valores distintos y el resultado se
+# reparte a las filas por sus codigos. Los valores ya limpiados quedan en un
+# memo del proceso, de modo que una actualizacion solo limpia valores nuevos.
+# Las columnas casi sin repetidos (marcas temporales, observaciones) no pasan
+# por el memo: no se reutilizarian y desplazarian a los valores que si. Cada
+# limpiador guarda a lo sumo LIMITE_MEMO_LIMPIEZA valores y al llenarse
+# descarta los mas antiguos.
+LIMITE_MEMO_LIMPIEZA = 250_000
+PROPORCION_UNICOS_SIN_MEMO = 0.5
+UNICOS_MINIMOS_SIN_MEMO = 1_000
+_MEMO_LIMPIEZA: dict[tuple, dict[object, object]] = {}
+_BLOQUEO_MEMO_LIMPIEZA = threading.Lock()
+
+# Estados calculados por version de los datos (huella): el ultimo evento de
+# cada barril y las variaciones diarias. Se extienden solo cuando la tabla
+# nueva agrega filas a una version conocida, segun su linaje.
+VERSIONES_POR_ESTADO = 4
+
+# Ultimo evento de cada barril (DatosM), por huella de la tabla
+_INDICE_ESTADO_BARRILES: dict[str, dict] = {}
+_BLOQUEO_INDICE_BARRILES = threading.Lock()
+
+# Variaciones diarias de litros en cuarto frio, por hoja y huella de la tabla
+_VARIACIONES_INVENTARIO: dict[str, dict[str, dict]] = {}
+_BLOQUEO_VARIACIONES = threading.Lock()
+
+
+def aplicar_a_valores_unicos(
+    serie: pd.Series,
+    funcion: Callable[[pd.Series], pd.Series],
+    clave_memo: tuple,
+) -> pd.Series:
+    """Aplica `funcion` (Series -> Series) a los valores distintos de `serie`."""
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=True)
+    valores = unicos.tolist()
+
+    # El resultado para valores vacios tambien fija el tipo de la salida. Los
+    # resultados numericos se unifican como Float64 para no depender de que
+    # valores se limpiaron juntos.
+    muestra_nula = funcion(pd.Series([None], dtype=serie.dtype))
+    tipo_salida = (
+        "Float64" if pd.api.types.is_numeric_dtype(muestra_nula.dtype) else muestra_nula.dtype
+    )
+
+    if len(valores) >= max(UNICOS_MINIMOS_SIN_MEMO, PROPORCION_UNICOS_SIN_MEMO * len(serie)):
+        resultados = funcion(pd.Series(valores, dtype=serie.dtype)).tolist()
+    else:
+        with _BLOQUEO_MEMO_LIMPIEZA:
+            memo = _MEMO_LIMPIEZA.setdefault(clave_memo, {})
+            conocidos = {valor: memo[valor] for valor in valores if valor in memo}
+        faltantes = [valor for valor in valores if valor not in conocidos]
+        if faltantes:
+            calculados = dict(
+                zip(faltantes, funcion(pd.Series(faltantes, dtype=serie.dtype)).tolist())
+            )
+            conocidos.update(calculados)
+            with _BLOQUEO_MEMO_LIMPIEZA:
+                exceso = len(memo) + len(calculados) - LIMITE_MEMO_LIMPIEZA
+                for antiguo in list(itertools.islice(memo, max(exceso, 0))):
+                    del memo[antiguo]
+                memo.update(calculados)
+        resultados = [conocidos[valor] for valor in valores]
+
+    tabla = pd.array(resultados + muestra_nula.tolist(), dtype=tipo_salida)
+    posiciones = np.where(codigos < 0, len(resultados), codigos)
+    return pd.Series(tabla.take(posiciones), index=serie.index, name=serie.name)
+
+
+def por_valores_unicos(funcion: Callable[..., pd.Series]) -> Callable[..., pd.Series]:
+    """Decora un limpiador de Series para que trabaje sobre valores unicos."""
+
+    @functools.wraps(funcion)
+    def envoltura(serie: pd.Series, *args: object, **kwargs: object) -> pd.Series:
+        clave = (funcion.__name__, args, tuple(sorted(kwargs.items())))
+        return aplicar_a_valores_unicos(
+            serie,
+            lambda unicos: funcion(unicos, *args, **kwargs),
+            clave,
+        )
+
+    return envoltura
+
+
+# -----------------------------------------------------------------------------
+# FUNCIONES DE LIMPIEZA Y LECTURA
+# -----------------------------------------------------------------------------
+def normalizar_clave(valor: object) -> str:
+    """Normaliza texto para comparaciones: minusculas, sin tildes y sin espacios dobles."""
+    if valor is None or pd.isna(valor):
+        return ""
+    texto = str(valor).strip().lower()
+    texto = " ".join(texto.split())
+    return "".join(
+        caracter
+        for caracter in unicodedata.normalize("NFD", texto)
+        if unicodedata.category(caracter) != "Mn"
+    )
+
+
+@por_valores_unicos
+def normalizar_claves(serie: pd.Series) -> pd.Series:
+    return serie.map(normalizar_clave)
+
+
+@por_valores_unicos
+def limpiar_texto(serie: pd.Series, valor_vacio: str = "") -> pd.Series:
+    resultado = serie.astype("string").fillna("").str.strip()
+    resultado = resultado.str.replace(r"\s+", " ", regex=True)
+    resultado = resultado.mask(
+        resultado.str.lower().isin({"nan", "none", "nat", "<na>"}), ""
+    )
+    if valor_vacio:
+        resultado = resultado.mask(resultado.eq(""), valor_vacio)
+    return resultado
+
+
+@functools.lru_cache(maxsize=32)
+def resolver_esquema(
+    columnas: tuple[str, ...],
+    nombres_base: tuple[str, ...],
+) -> dict[str, tuple[str, ...]]:
+    """
+    Agrupa los encabezados de una hoja por nombre base, incluyendo los
+    duplicados de pandas (Estado, Estado.1, Estado.2). Se calcula una vez por
+    combinacion de encabezados, es decir, una vez por version del formulario.
+    """
+    normalizadas = [normalizar_clave(columna) for columna in columnas]
+    esquema: dict[str, tuple[str, ...]] = {}
+    for nombre_base in nombres_base:
+        base = normalizar_clave(nombre_base)
+        esquema[nombre_base] = tuple(
+            columna
+            for columna, normalizada in zip(columnas, normalizadas)
+            if normalizada == base or normalizada.startswith(f"{base}.")
+        )
+    return esquema
+
+
+def columnas_relacionadas(df: pd.DataFrame, nombre_base: str) -> list[str]:
+    """Encuentra columnas duplicadas por pandas, por ejemplo Estado, Estado.1, Estado.2."""
+    return list(resolver_esquema(tuple(df.columns), (nombre_base,))[nombre_base])
+
+
+def combinar_grupos(df: pd.DataFrame, nombres_base: list[str]) -> dict[str, pd.Series]:
+    """
+    Combina varios grupos de columnas equivalentes en una sola pasada: todas
+    las columnas se limpian juntas y en cada fila se toma el primer valor no
+    vacio de su grupo.
+    """
+    esquema = resolver_esquema(tuple(df.columns), tuple(nombres_base))
+    columnas = [columna for nombre in nombres_base for columna in esquema[nombre]]
+
+    filas = len(df)
+    if columnas:
+        bloque = df[columnas].to_numpy(dtype=object).ravel(order="F")
+        limpio = limpiar_texto(pd.Series(bloque, dtype=object)).to_numpy(dtype=object)
+        limpio = limpio.reshape((filas, len(columnas)), order="F")
+
+    resultado: dict[str, pd.Series] = {}
+    inicio = 0
+    for nombre in nombres_base:
+        cantidad = len(esquema[nombre])
+        if cantidad == 0:
+            resultado[nombre] = pd.Series("", index=df.index, dtype="string")
+            continue
+
+        grupo = limpio[:, inicio : inicio + cantidad]
+        inicio += cantidad
+        primera_con_valor = (grupo != "").argmax(axis=1)
+        valores = grupo[np.arange(filas), primera_con_valor]
+        resultado[nombre] = pd.Series(valores, index=df.index, dtype="string")
+    return resultado
+
+
+def combinar_columnas(df: pd.DataFrame, nombre_base: str) -> pd.Series:
+    """Devuelve el primer valor no vacio entre columnas equivalentes."""
+    return combinar_grupos(df, [nombre_base])[nombre_base]
+
+
+def detectar_formato_fecha(texto: pd.Series) -> str | None:
+    """Elige, sobre una muestra, el formato de FORMATOS_FECHA que mas fechas reconoce."""
+    muestra = texto[texto.ne("")].head(TAMANO_MUESTRA_FECHAS)
+    if muestra.empty:
+        return None
+
+    mejor_formato, mejor_conteo = None, 0
+    for formato in FORMATOS_FECHA:
+        conteo = int(pd.to_datetime(muestra, format=formato, errors="coerce").notna().sum())
+        if conteo > mejor_conteo:
+            mejor_formato, mejor_conteo = formato, conteo
+    return mejor_formato
+
+
+@por_valores_unicos
+def convertir_fechas(serie: pd.Series) -> pd.Series:
+    """
+    Convierte fechas de Sheets, incluyendo seriales numericos de Google/Excel.
+
+    Se trabaja sobre valores unicos (muchas filas comparten la marca temporal).
+    El formato dominante se detecta en una muestra y se aplica en una sola
+    pasada; lo que no coincide prueba los demas FORMATOS_FECHA y solo el resto
+    pasa por la inferencia lenta de pandas, valor por valor.
+    """
+    texto = limpiar_texto(serie)
+    numeros = pd.to_numeric(texto, errors="coerce")
+
+    resultado = pd.Series(pd.NaT, index=serie.index, dtype="datetime64[ns]")
+    es_serial = numeros.between(20000, 70000, inclusive="both").fillna(False)
+
+    if es_serial.any():
+        resultado.loc[es_serial] = pd.to_datetime(
+            numeros.loc[es_serial], unit="D", origin="1899-12-30", errors="coerce"
+        )
+
+    restantes = ~es_serial & texto.ne("")
+    dominante = detectar_formato_fecha(texto.loc[restantes])
+    # Cada valor queda con el primer formato conocido que lo reconoce, asi el
+    # resultado no depende de que otros valores se convierten con el.
+    for formato in sorted(FORMATOS_FECHA, key=lambda formato: formato != dominante):
+        if not restantes.any():
+            break
+        resultado.loc[restantes] = pd.to_datetime(
+            texto.loc[restantes], format=formato, errors="coerce"
+        )
+        restantes = restantes & resultado.isna()
+
+    if restantes.any():
+        # "mixed" interpreta cada valor por separado en lugar de inferir un
+        # unico formato a partir del primero.
+        resultado.loc[restantes] = pd.to_datetime(
+            texto.loc[restantes], format="mixed", dayfirst=True, errors="coerce"
+        )
+
+        # Respaldo para posibles fechas con mes primero.
+        faltantes = restantes & resultado.isna()
+        if faltantes.any():
+            resultado.loc[faltantes] = pd.to_datetime(
+                texto.loc[faltantes], format="mixed", dayfirst=False, errors="coerce"
+            )
+
+    return resultado
+
+
+@por_valores_unicos
+def convertir_cantidades(serie: pd.Series) -> pd.Series:
+    """Convierte cantidades enteras y reconoce 1.200 como 1200."""
+    texto = limpiar_texto(serie).str.replace(" ", "", regex=False)
+
+    # Formato colombiano/espanol de miles: 1.200, 12.500, etc.
+    miles_punto = texto.str.match(r"^-?\d{1,3}(?:\.\d{3})+$", na=False)
+    texto = texto.where(~miles_punto, texto.str.replace(".", "", regex=False))
+
+    # Si quedan comas, se interpretan como separador decimal.
+    texto = texto.str.replace(",", ".", regex=False)
+    return pd.to_numeric(texto, errors="coerce")
+
+
+@por_valores_unicos
+def limpiar_codigo(serie: pd.Series) -> pd.Series:
+    codigo = limpiar_texto(serie)
+    codigo = codigo.str.replace(r"\.0$", "", regex=True)
+    codigo = codigo.str.replace(r"[^0-9]", "", regex=True)
+    return codigo
+
+
+@por_valores_unicos
+def limpiar_lote(serie: pd.Series) -> pd.Series:
+    lote = limpiar_texto(serie)
+    lote = lote.str.replace(r"\.0$", "", regex=True)
+    return lote.mask(lote.str.lower().eq("nan"), "")
+
+
+@por_valores_unicos
+def extraer_decimal(serie: pd.Series) -> pd.Series:
+    texto = limpiar_texto(serie).str.replace(",", ".", regex=False)
+    numero = texto.str.extract(r"(-?\d+(?:\.\d+)?)", expand=False)
+    return pd.to_numeric(numero, errors="coerce")
+
+
+@por_valores_unicos
+def litros_mencionados_en_observacion(serie: pd.Series) -> pd.Series:
+    texto = limpiar_texto(serie).str.replace(",", ".", regex=False)
+    numero = texto.str.extract(
+        r"(?i)(\d+(?:\.\d+)?)\s*(?:l|lt|lts|litro|litros)\b",
+        expand=False,
+    )
+    return pd.to_numeric(numero, errors="coerce")
+
+
+def capacidad_nominal_por_codigo(codigos: pd.Series) -> pd.Series:
+    prefijos = codigos.astype("string").str[:2]
+    return prefijos.map({"20": 20.0, "30": 30.0, "58": 58.0}).fillna(0.0)
+
+
+def calcular_litros_barril(
+    codigos: pd.Series,
+    capacidades: pd.Series,
+    observaciones: pd.Series,
+) -> pd.Series:
+    """
+    Prioridad para calcular litros:
+    1. Litros indicados en observaciones (ej. "Barril con 14 lt").
+    2. Columna Capacidad, si contiene un valor valido.
+    3. Prefijo del codigo: 20, 30 o 58 litros.
+    """
+    litros_observacion = litros_mencionados_en_observacion(observaciones)
+    litros_capacidad = extraer_decimal(capacidades)
+    litros_capacidad = litros_capacidad.where(litros_capacidad.between(1, 100))
+    litros_codigo = capacidad_nominal_por_codigo(codigos)
+
+    litros = litros_observacion.copy()
+    litros = litros.where(litros.notna(), litros_capacidad)
+    litros = litros.where(litros.notna(), litros_codigo.where(litros_codigo.ne(0)))
+    return pd.to_numeric(litros, errors="coerce").fillna(0.0)
+
+
+# -----------------------------------------------------------------------------
+# DESCARGA DE HOJAS
+# -----------------------------------------------------------------------------
+_SESION_HTTP: dict[str, requests.Session] = {}
+_BLOQUEO_SESION_HTTP = threading.Lock()
+
+# Histograma de latencias por endpoint: conteos por limite de LIMITES_LATENCIA
+_LATENCIAS: dict[str, dict] = {}
+_BLOQUEO_LATENCIAS = threading.Lock()
+
+
+class ErrorTransitorio(Exception):
+    """Falla de una descarga que puede resolverse reintentando."""
+
+    def __init__(self, mensaje: str, espera_minima: float = 0.0):
+        super().__init__(mensaje)
+        self.espera_minima = espera_minima
+
+
+def sesion_http() -> requests.Session:
+    """
+    Sesion compartida por todos los hilos. Reutiliza conexiones (keep-alive)
+    y negocia gzip; los reintentos los maneja descargar_hoja.
+    """
+    with _BLOQUEO_SESION_HTTP:
+        sesion = _SESION_HTTP.get("sesion")
+        if sesion is None:
+            sesion = requests.Session()
+            adaptador = requests.adapters.HTTPAdapter(
+                pool_connections=2, pool_maxsize=CONEXIONES_HTTP, max_retries=0
+            )
+            sesion.mount("https://", adaptador)
+            sesion.mount("http://", adaptador)
+            sesion.headers.update(
+                {"User-Agent": "Mozilla/5.0", "Accept-Encoding": "gzip, deflate"}
+            )
+            _SESION_HTTP["sesion"] = sesion
+        return sesion
+
+
+def registrar_latencia(endpoint: str, segundos: float, error: bool) -> None:
+    with _BLOQUEO_LATENCIAS:
+        registro = _LATENCIAS.get(endpoint)
+        if registro is None:
+            registro = _LATENCIAS[endpoint] = {
+                "conteos": [0] * (len(LIMITES_LATENCIA) + 1),
+                "total": 0,
+                "errores": 0,
+                "segundos": 0.0,
+            }
+        posicion = next(
+            (i for i, limite in enumerate(LIMITES_LATENCIA) if segundos <= limite),
+            len(LIMITES_LATENCIA),
+        )
+        registro["conteos"][posicion] += 1
+        registro["total"] += 1
+        registro["errores"] += int(error)
+        registro["segundos"] += segundos
+
+
+def histograma_latencias() -> pd.DataFrame:
+    """Solicitudes por endpoint y rango de latencia (columnas "<= 0.5 s", ..., "> 30 s")."""
+    rangos = [f"<= {limite:g} s" for limite in LIMITES_LATENCIA] + [
+        f"> {LIMITES_LATENCIA[-1]:g} s"
+    ]
+    with _BLOQUEO_LATENCIAS:
+        filas = [
+            {
+                "Endpoint": endpoint,
+                "Solicitudes": registro["total"],
+                "Errores": registro["errores"],
+                "Promedio_s": registro["segundos"] / registro["total"],
+                **dict(zip(rangos, registro["conteos"])),
+            }
+            for endpoint, registro in _LATENCIAS.items()
+        ]
+    return pd.DataFrame(
+        filas, columns=["Endpoint", "Solicitudes", "Errores", "Promedio_s", *rangos]
+    )
+
+
+def espera_reintento(intento: int, espera_minima: float = 0.0) -> float:
+    """Espera exponencial con jitter completo, respetando Retry-After si llego."""
+    tope = min(ESPERA_MAXIMA_REINTENTO, ESPERA_BASE_REINTENTO * 2**intento)
+    return max(random.uniform(0, tope), min(espera_minima, ESPERA_MAXIMA_REINTENTO))
+
+
+def segundos_retry_after(respuesta: requests.Response) -> float:
+    try:
+        return float(respuesta.headers.get("Retry-After", 0))
+    except ValueError:
+        return 0.0
+
+
+def es_pagina_html(inicio: bytes) -> bool:
+    inicio = inicio.lstrip().lower()
+    return inicio.startswith(b"<!doctype html") or inicio.startswith(b"<html")
+
+
+def leer_cuerpo(url: str, nombre_hoja: str) -> tuple[bytearray, str]:
+    """Un intento de descarga: el cuerpo por fragmentos y su huella."""
+    contenido = bytearray()
+    resumen = hashlib.sha256()
+    revisado = False
+    try:
+        with sesion_http().get(url, timeout=TIMEOUT_DESCARGA, stream=True) as respuesta:
+            if respuesta.status_code in ESTADOS_REINTENTABLES:
+                raise ErrorTransitorio(
+                    f"HTTP {respuesta.status_code}", segundos_retry_after(respuesta)
+                )
+            respuesta.raise_for_status()
+            for fragmento in respuesta.iter_content(TAMANO_FRAGMENTO_DESCARGA):
+                contenido += fragmento
+                resumen.update(fragmento)
+                if not revisado and len(contenido) >= BYTES_DETECCION_HTML:
+                    revisado = True
+                    if es_pagina_html(contenido[:BYTES_DETECCION_HTML]):
+                        break
+    except (
+        requests.ConnectionError,
+        requests.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+    ) as exc:
+        raise ErrorTransitorio(f"{type(exc).__name__}: {exc}") from exc
+
+    if es_pagina_html(contenido[:BYTES_DETECCION_HTML]):
+        raise RuntimeError(
+            f"Google Sheets no devolvio un CSV para la hoja '{nombre_hoja}'. "
+            "Verifica que el archivo sea accesible desde la aplicacion."
+        )
+    return contenido, resumen.hexdigest()[:20]
+
+
+def descargar_hoja(nombre_hoja: str, consulta: str | None = None) -> tuple[bytearray, str]:
+    """
+    Descarga una pestaña publica de Google Sheets como CSV y devuelve el
+    contenido y su huella. El cuerpo se lee por fragmentos en un solo buffer y
+    la huella se calcula mientras llega; la deteccion de paginas de error solo
+    mira los primeros bytes. Las fallas transitorias (conexion, 429, 5xx) se
+    reintentan. `consulta` es una consulta opcional del lenguaje gviz (parametro tq).
+    """
+    nombre_codificado = quote(nombre_hoja, safe="")
+    url = f"{SHEET_BASE_URL}/gviz/tq?tqx=out:csv&sheet={nombre_codificado}"
+    if consulta:
+        url += f"&tq={quote(consulta, safe='')}"
+    endpoint = f"{nombre_hoja} (consulta)" if consulta else nombre_hoja
+
+    with medir_etapa(f"descargar {nombre_hoja}") as medicion:
+        for intento in range(REINTENTOS_DESCARGA + 1):
+            inicio = time.perf_counter()
+            try:
+                contenido, huella = leer_cuerpo(url, nombre_hoja)
+            except ErrorTransitorio as exc:
+                registrar_latencia(endpoint, time.perf_counter() - inicio, error=True)
+                if intento == REINTENTOS_DESCARGA:
+                    raise RuntimeError(
+                        f"No se pudo descargar la hoja '{nombre_hoja}' tras "
+                        f"{intento + 1} intentos: {exc}"
+                    ) from exc
+                espera = espera_reintento(intento, exc.espera_minima)
+                LOGGER.warning(
+                    "Descarga de %s fallo (%s); reintento en %.1f s", nombre_hoja, exc, espera
+                )
+                time.sleep(espera)
+                continue
+            except Exception:
+                registrar_latencia(endpoint, time.perf_counter() - inicio, error=True)
+                raise
+            registrar_latencia(endpoint, time.perf_counter() - inicio, error=False)
+            medicion["intentos"] = intento + 1
+            medicion["bytes"] = len(contenido)
+            return contenido, huella
+
+
+def nombres_unicos(encabezados: list[str]) -> list[str]:
+    """
+    Renombra encabezados repetidos igual que pd.read_csv (Estado, Estado.1,
+    Estado.2), evitando nombres que ya existen en el encabezado original.
+    """
+    existentes = set(encabezados)
+    conteos: dict[str, int] = {}
+    nombres = []
+    for original in encabezados:
+        nombre = original
+        repeticion = conteos.get(original, 0)
+        while repeticion > 0:
+            conteos[original] = repeticion + 1
+            nombre = f"{original}.{repeticion}"
+            if nombre in existentes:
+                repeticion += 1
+            else:
+                repeticion = conteos.get(nombre, 0)
+        nombres.append(nombre)
+        conteos[nombre] = repeticion + 1
+    return nombres
+
+
+def leer_csv_arrow(contenido: bytes | bytearray, encabezados: list[str]) -> pa.Table:
+    # Todas las columnas como texto y las celdas vacias como "", igual que
+    # pd.read_csv(dtype=str, keep_default_na=False).
+    return pacsv.read_csv(
+        pa.py_buffer(contenido),
+        read_options=pacsv.ReadOptions(use_threads=True),
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(
+            column_types={nombre: pa.string() for nombre in encabezados},
+            null_values=[],
+            strings_can_be_null=False,
+            quoted_strings_can_be_null=False,
+        ),
+    )
+
+
+def parsear_csv_hoja(contenido: bytes | bytearray, nombre_hoja: str = "") -> pd.DataFrame:
+    """
+    Convierte el CSV en un DataFrame de columnas string[pyarrow] con el lector
+    multihilo de Arrow, sin decodificar el contenido a texto de Python.
+    """
+    with medir_etapa(f"parsear {nombre_hoja}".strip()) as medicion:
+        medicion["bytes"] = len(contenido)
+        inicio = bytes(contenido[:TAMANO_FRAGMENTO_DESCARGA]).decode("utf-8", errors="replace")
+        encabezados = next(csv.reader(io.StringIO(inicio)), [])
+        if not encabezados:
+            medicion["filas_salida"] = 0
+            return pd.DataFrame()
+
+        try:
+            tabla = leer_csv_arrow(contenido, encabezados)
+        except pa.ArrowInvalid:
+            # Bytes que no son UTF-8 valido: se reemplazan, como hacia pandas.
+            contenido = bytes(contenido).decode("utf-8", errors="replace").encode("utf-8")
+            tabla = leer_csv_arrow(contenido, encabezados)
+
+        columnas = [
+            columna.strip() for columna in nombres_unicos(list(tabla.column_names))
+        ]
+        df = tabla.rename_columns(columnas).to_pandas(types_mapper={pa.string(): TIPO_TEXTO}.get)
+        medicion["filas_salida"] = len(df)
+    return df
+
+
+# -----------------------------------------------------------------------------
+# CONSULTAS REDUCIDAS
+# -----------------------------------------------------------------------------
+# Con el ultimo encabezado guardado de la hoja se arma una consulta gviz que
+# pide, por letra de columna, solo las columnas de COLUMNAS_ORIGEN y, si se
+# indica, solo las filas desde una fecha. Si la respuesta no trae las columnas
+# esperadas se relee el encabezado una vez; si aun asi no coinciden o la
+# consulta falla, se descarga la hoja completa.
+def letra_columna(posicion: int) -> str:
+    """0 -> A, 25 -> Z, 26 -> AA, como las columnas de Sheets."""
+    letras = ""
+    posicion += 1
+    while posicion:
+        posicion, resto = divmod(posicion - 1, 26)
+        letras = chr(ord("A") + resto) + letras
+    return letras
+
+
+def ruta_esquema_hoja(nombre_hoja: str) -> Path:
+    return DIRECTORIO_ESQUEMAS / f"{quote(nombre_hoja, safe='')}.json"
+
+
+def leer_esquema_hoja(nombre_hoja: str) -> list[str] | None:
+    try:
+        return json.loads(ruta_esquema_hoja(nombre_hoja).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def guardar_esquema_hoja(nombre_hoja: str, encabezados: list[str]) -> None:
+    ruta = ruta_esquema_hoja(nombre_hoja)
+    try:
+        DIRECTORIO_ESQUEMAS.mkdir(parents=True, exist_ok=True)
+        temporal = ruta.with_name(f"{ruta.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        temporal.write_text(json.dumps(encabezados, ensure_ascii=False), encoding="utf-8")
+        os.replace(temporal, ruta)
+    except OSError as exc:
+        LOGGER.warning("No se pudo guardar el encabezado de %s: %s", nombre_hoja, exc)
+
+
+def encabezados_hoja(nombre_hoja: str) -> list[str]:
+    """Encabezado actual de la hoja, sin filas (consulta `limit 0`)."""
+    contenido, _ = descargar_hoja(nombre_hoja, "select * limit 0")
+    return list(parsear_csv_hoja(contenido, nombre_hoja).columns)
+
+
+def consulta_reducida(
+    nombre_hoja: str,
+    encabezados: list[str],
+    desde: date | None = None,
+) -> tuple[str, list[str]] | None:
+    """
+    Arma la consulta gviz con las columnas que usa la preparacion y, con
+    `desde`, el filtro por Marca temporal. Devuelve tambien los encabezados
+    que debe traer la respuesta, o None si la consulta no reduce nada.
+    """
+    usadas = COLUMNAS_ORIGEN.get(nombre_hoja)
+    if not usadas:
+        return None
+    posiciones: dict[str, int] = {}
+    for posicion, columna in enumerate(encabezados):
+        posiciones.setdefault(columna, posicion)
+    esquema = resolver_esquema(tuple(encabezados), usadas)
+    seleccion = sorted({posiciones[columna] for grupo in esquema.values() for columna in grupo})
+    marcas = esquema.get(COLUMNA_MARCA_TEMPORAL, ())
+    filtra_fechas = desde is not None and bool(marcas)
+    if not seleccion or (len(seleccion) == len(encabezados) and not filtra_fechas):
+        return None
+
+    consulta = "select " + ", ".join(letra_columna(posicion) for posicion in seleccion)
+    if filtra_fechas:
+        # La fecha de una fila puede estar en cualquiera de las columnas
+        # Marca temporal repetidas: basta con que una cumpla.
+        consulta += " where " + " or ".join(
+            f"{letra_columna(posiciones[marca])} >= datetime '{desde:%Y-%m-%d} 00:00:00'"
+            for marca in marcas
+        )
+    return consulta, [encabezados[posicion] for posicion in seleccion]
+
+
+def encabezados_actuales(nombre_hoja: str) -> list[str] | None:
+    """Lee el encabezado de la hoja y lo guarda; None si no se pudo leer."""
+    try:
+        encabezados = encabezados_hoja(nombre_hoja)
+    except Exception as exc:
+        LOGGER.warning("No se pudo leer el encabezado de %s: %s", nombre_hoja, exc)
+        return None
+    if encabezados:
+        guardar_esquema_hoja(nombre_hoja, encabezados)
+    return encabezados or None
+
+
+def descargar_tabla(
+    nombre_hoja: str,
+    offset: int | None = None,
+    desde: date | None = None,
+) -> pd.DataFrame:
+    """
+    Descarga y parsea la hoja pidiendo solo las columnas que usa la
+    preparacion; `offset` omite las primeras filas y `desde` pide solo las
+    filas con Marca temporal desde esa fecha. La consulta se arma con el
+    ultimo encabezado guardado; el encabezado se vuelve a leer solo si no hay
+    uno guardado o si la respuesta no trae las columnas esperadas (una columna
+    movida o agregada). Si la consulta reducida falla se descarga la hoja
+    completa.
+    """
+    desplazamiento = f" offset {offset}" if offset else ""
+    if CONSULTA_REDUCIDA and nombre_hoja in COLUMNAS_ORIGEN:
+        encabezados, releido = leer_esquema_hoja(nombre_hoja), False
+        while True:
+            if not encabezados and not releido:
+                encabezados, releido = encabezados_actuales(nombre_hoja), True
+            pedido = consulta_reducida(nombre_hoja, encabezados, desde) if encabezados else None
+            if pedido is None:
+                break
+            consulta, esperadas = pedido
+            try:
+                contenido, huella = descargar_hoja(nombre_hoja, consulta + desplazamiento)
+                df = parsear_csv_hoja(contenido, nombre_hoja)
+            except Exception as exc:
+                LOGGER.warning(
+                    "La consulta reducida de %s fallo (%s); se descarga la hoja completa",
+                    nombre_hoja,
+                    exc,
+                )
+                break
+            if list(df.columns) == esperadas:
+                return con_huella(df, huella)
+            if releido:
+                LOGGER.info("El encabezado de %s cambio; se descarga la hoja completa", nombre_hoja)
+                break
+            LOGGER.info("El encabezado de %s cambio; se vuelve a leer", nombre_hoja)
+            encabezados = None
+
+    contenido, huella = descargar_hoja(
+        nombre_hoja, f"select *{desplazamiento}" if offset else None
+    )
+    df = parsear_csv_hoja(contenido, nombre_hoja)
+    # gviz devuelve el encabezado tambien con offset.
+    if CONSULTA_REDUCIDA and nombre_hoja in COLUMNAS_ORIGEN and len(df.columns):
+        guardar_esquema_hoja(nombre_hoja, list(df.columns))
+    return con_huella(df, huella)
+
+
+# -----------------------------------------------------------------------------
+# SNAPSHOTS EN DISCO
+# -----------------------------------------------------------------------------
+def bloqueo_hoja(nombre_hoja: str) -> threading.Lock:
+    with _BLOQUEO_SNAPSHOTS:
+        return _BLOQUEOS_POR_HOJA.setdefault(nombre_hoja, threading.Lock())
+
+
+def huella_contenido(contenido: bytes) -> str:
+    return hashlib.sha256(contenido).hexdigest()[:20]
+
+
+def con_huella(df: pd.DataFrame, huella: str) -> pd.DataFrame:
+    """Marca el DataFrame con la version de los datos de los que proviene."""
+    df.attrs["huella"] = huella
+    return df
+
+
+def huella_tabla(df: pd.DataFrame) -> str:
+    huella = df.attrs.get("huella")
+    if huella:
+        return huella
+    valores = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    return huella_contenido(valores.tobytes() + "|".join(map(str, df.columns)).encode("utf-8"))
+
+
+def ruta_indice_snapshot(nombre_hoja: str) -> Path:
+    return DIRECTORIO_SNAPSHOTS / f"{quote(nombre_hoja, safe='')}.json"
+
+
+def leer_indice_snapshot(nombre_hoja: str) -> dict | None:
+    try:
+        return json.loads(ruta_indice_snapshot(nombre_hoja).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def escribir_indice_snapshot(nombre_hoja: str, indice: dict) -> None:
+    ruta = ruta_indice_snapshot(nombre_hoja)
+    temporal = ruta.with_name(f"{ruta.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    temporal.write_text(json.dumps(indice), encoding="utf-8")
+    os.replace(temporal, ruta)
+
+
+def cargar_snapshot(nombre_hoja: str) -> tuple[pd.DataFrame, dict] | None:
+    """Devuelve el ultimo snapshot guardado de la hoja y su indice, si existe."""
+    indice = leer_indice_snapshot(nombre_hoja)
+    if indice is None:
+        return None
+    try:
+        df = pd.read_parquet(DIRECTORIO_SNAPSHOTS / indice["archivo"])
+    except Exception:  # Snapshot corrupto o borrado: se descarga de nuevo.
+        return None
+    return con_huella(df, indice["huella"]), indice
+
+
+def guardar_snapshot(nombre_hoja: str, huella: str, df: pd.DataFrame) -> None:
+    """Guarda el snapshot en Parquet y apunta el indice de la hoja hacia el."""
+    DIRECTORIO_SNAPSHOTS.mkdir(parents=True, exist_ok=True)
+    prefijo = quote(nombre_hoja, safe="")
+    archivo = f"{prefijo}-{huella}.parquet"
+    ruta = DIRECTORIO_SNAPSHOTS / archivo
+    if not ruta.exists():
+        temporal = ruta.with_name(f"{archivo}.{os.getpid()}.{threading.get_ident()}.tmp")
+        df.to_parquet(temporal, index=False)
+        os.replace(temporal, ruta)
+
+    escribir_indice_snapshot(
+        nombre_hoja,
+        {"huella": huella, "archivo": archivo, "revalidado": time.time()},
+    )
+    for anterior in DIRECTORIO_SNAPSHOTS.glob(f"{prefijo}-*.parquet"):
+        if anterior.name != archivo:
+            anterior.unlink(missing_ok=True)
+
+
+def actualizar_snapshot(nombre_hoja: str) -> pd.DataFrame:
+    """
+    Descarga la hoja y solo vuelve a parsear el CSV si su contenido cambio
+    respecto al snapshot guardado. Un solo proceso descarga cada hoja a la vez;
+    los que esperaban el bloqueo usan el snapshot que dejo.
+    """
+    with bloqueo_compartido(nombre_hoja):
+        snapshot = cargar_snapshot(nombre_hoja)
+        if (
+            snapshot is not None
+            and time.time() - snapshot[1].get("revalidado", 0) < TTL_SNAPSHOT_SEGUNDOS
+        ):
+            return snapshot[0]
+
+        contenido, huella = descargar_hoja(nombre_hoja)
+        if snapshot is not None and snapshot[1].get("huella") == huella:
+            df, indice = snapshot
+            indice["revalidado"] = time.time()
+            try:
+                escribir_indice_snapshot(nombre_hoja, indice)
+            except OSError:
+                pass
+            return df
+
+        df = con_huella(parsear_csv_hoja(contenido, nombre_hoja), huella)
+        try:
+            guardar_snapshot(nombre_hoja, huella, df)
+        except Exception as exc:  # El disco es solo una cache; la app sigue sin el.
+            LOGGER.warning("No se pudo guardar el snapshot de %s: %s", nombre_hoja, exc)
+        return df
+
+
+def revalidar_en_segundo_plano(nombre_hoja: str) -> None:
+    with _BLOQUEO_SNAPSHOTS:
+        if nombre_hoja in _REVALIDACIONES_EN_CURSO:
+            return
+        _REVALIDACIONES_EN_CURSO.add(nombre_hoja)
+
+    def revalidar() -> None:
+        try:
+            actualizar_snapshot(nombre_hoja)
+        except Exception as exc:
+            LOGGER.warning("No se pudo revalidar la hoja %s: %s", nombre_hoja, exc)
+        finally:
+            with _BLOQUEO_SNAPSHOTS:
+                _REVALIDACIONES_EN_CURSO.discard(nombre_hoja)
+
+    threading.Thread(target=revalidar, name=f"revalidar-{nombre_hoja}", daemon=True).start()
+
+
+def invalidar_snapshots() -> None:
+    """Marca todos los snapshots como vencidos para forzar una descarga."""
+    for ruta in DIRECTORIO_SNAPSHOTS.glob("*.json"):
+        nombre_hoja = unquote(ruta.stem)
+        indice = leer_indice_snapshot(nombre_hoja)
+        if indice is not None:
+            indice["revalidado"] = 0
+            escribir_indice_snapshot(nombre_hoja, indice)
+
+    for ruta in DIRECTORIO_INGESTA.glob("*.json"):
+        nombre_hoja = unquote(ruta.stem)
+        estado = leer_estado_ingesta(nombre_hoja)
+        if estado is not None:
+            estado["revalidado"] = 0
+            escribir_estado_ingesta(nombre_hoja, estado)
+
+
+def leer_hoja(nombre_hoja: str, servir_vencido: bool = True) -> pd.DataFrame:
+    """
+    Lee una pestaña publica de Google Sheets como CSV.
+
+    Si hay un snapshot en disco reciente se usa sin consultar Google. Al
+    arrancar el proceso el snapshot se sirve aunque este vencido y se
+    revalida en segundo plano; despues se descarga de forma sincronica.
+    Con `servir_vencido=False` un snapshot vencido nunca se sirve.
+    """
+    snapshot = cargar_snapshot(nombre_hoja)
+    if snapshot is not None:
+        df, indice = snapshot
+        vencido = time.time() - indice.get("revalidado", 0) >= TTL_SNAPSHOT_SEGUNDOS
+        primera_lectura = servir_vencido and nombre_hoja not in _HOJAS_LEIDAS_EN_PROCESO
+        if not vencido or primera_lectura:
+            _HOJAS_LEIDAS_EN_PROCESO.add(nombre_hoja)
+            if vencido:
+                revalidar_en_segundo_plano(nombre_hoja)
+            return df
+
+    _HOJAS_LEIDAS_EN_PROCESO.add(nombre_hoja)
+    return actualizar_snapshot(nombre_hoja)
+
+
+# -----------------------------------------------------------------------------
+# CACHE COMPARTIDA ENTRE PROCESOS
+# -----------------------------------------------------------------------------
+# Las replicas que comparten DIRECTORIO_SNAPSHOTS se coordinan con un archivo
+# de bloqueo por hoja: la que lo obtiene descarga o prepara y las demas esperan
+# y leen lo que dejo. Las tablas preparadas se publican en Arrow IPC sin
+# comprimir; al leerlas el archivo se mapea en memoria y las columnas se usan
+# sin copiarlas, con las paginas compartidas entre procesos.
+def ruta_bloqueo(nombre: str) -> Path:
+    return DIRECTORIO_BLOQUEOS / f"{quote(nombre, safe='')}.lock"
+
+
+@contextlib.contextmanager
+def bloqueo_compartido(nombre: str):
+    """Bloqueo exclusivo de `nombre` entre hilos y, con fcntl, entre procesos."""
+    with bloqueo_hoja(nombre):
+        archivo = None
+        if CACHE_COMPARTIDA and fcntl is not None:
+            try:
+                DIRECTORIO_BLOQUEOS.mkdir(parents=True, exist_ok=True)
+                archivo = open(ruta_bloqueo(nombre), "a+b")
+            except OSError as exc:  # Sin disco queda solo el bloqueo entre hilos.
+                LOGGER.warning("No se pudo abrir el bloqueo de %s: %s", nombre, exc)
+        if archivo is None:
+            yield
+            return
+
+        # Cerrar el archivo libera el bloqueo, incluso si el bloque falla.
+        with archivo:
+            try:
+                fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                LOGGER.info("Esperando a otro proceso que actualiza %s", nombre)
+                fcntl.flock(archivo, fcntl.LOCK_EX)
+            yield
+
+
+def ruta_preparada_compartida(
+    nombre_hoja: str, huella: str, directorio: Path | None = None
+) -> Path:
+    directorio = directorio or DIRECTORIO_COMPARTIDO
+    return directorio / f"{quote(nombre_hoja, safe='')}-{huella}.arrow"
+
+
+def leer_preparada_compartida(
+    nombre_hoja: str, huella: str, directorio: Path | None = None
+) -> pd.DataFrame | None:
+    """Tabla preparada que publico algun proceso para esta version, si existe."""
+    if not CACHE_COMPARTIDA or not huella:
+        return None
+    ruta = ruta_preparada_compartida(nombre_hoja, huella, directorio)
+    try:
+        with pa.memory_map(str(ruta)) as fuente:
+            tabla = pa.ipc.open_file(fuente).read_all()
+    except (OSError, pa.ArrowInvalid):
+        return None
+    df = tabla.to_pandas(split_blocks=True)
+    df.attrs.update(json.loads((tabla.schema.metadata or {}).get(b"attrs", b"{}")))
+    df.attrs.setdefault("huella", huella)
+    return df
+
+
+def guardar_preparada_compartida(
+    nombre_hoja: str,
+    df: pd.DataFrame,
+    directorio: Path | None = None,
+    clave: str | None = None,
+) -> None:
+    """
+    Publica la tabla preparada en Arrow IPC y borra las versiones anteriores.
+    El archivo se identifica por `clave` o, si no se indica, por la huella de `df`.
+    """
+    huella = clave or df.attrs.get("huella")
+    if not CACHE_COMPARTIDA or not huella:
+        return
+    directorio = directorio or DIRECTORIO_COMPARTIDO
+    ruta = ruta_preparada_compartida(nombre_hoja, huella, directorio)
+    try:
+        if not ruta.exists():
+            directorio.mkdir(parents=True, exist_ok=True)
+            tabla = pa.Table.from_pandas(df)
+            # Los attrs (huella y linaje) viajan en los metadatos del esquema.
+            tabla = tabla.replace_schema_metadata(
+                {**(tabla.schema.metadata or {}), b"attrs": json.dumps(df.attrs).encode("utf-8")}
+            )
+            temporal = ruta.with_name(f"{ruta.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with pa.OSFile(str(temporal), "wb") as destino:
+                with pa.ipc.new_file(destino, tabla.schema) as escritor:
+                    escritor.write_table(tabla)
+            os.replace(temporal, ruta)
+        # Los procesos que ya mapearon una version anterior la siguen leyendo.
+        for anterior in directorio.glob(f"{quote(nombre_hoja, safe='')}-*.arrow"):
+            if anterior != ruta:
+                anterior.unlink(missing_ok=True)
+    except Exception as exc:  # La tabla en memoria sigue sirviendo.
+        LOGGER.warning("No se pudo publicar la tabla preparada de %s: %s", nombre_hoja, exc)
+
+
+def preparar_hoja_compartida(nombre_hoja: str, bruto: pd.DataFrame) -> pd.DataFrame:
+    """
+    Prepara la hoja una sola vez por version entre todos los procesos; si otro
+    ya publico la tabla de esta huella se mapea en lugar de prepararla.
+    """
+    huella = huella_tabla(bruto)
+    df = leer_preparada_compartida(nombre_hoja, huella)
+    if df is not None:
+        return df
+    with bloqueo_compartido(f"preparada-{nombre_hoja}"):
+        df = leer_preparada_compartida(nombre_hoja, huella)
+        if df is None:
+            df = con_huella(preparador_hoja(nombre_hoja)(bruto), huella)
+            guardar_preparada_compartida(nombre_hoja, df)
+    return df
+
+
+def compactar_tablas_compartidas(
+    df_barriles: pd.DataFrame, df_latas: pd.DataFrame
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Barriles y movimientos de latas compactados con un diccionario de
+    categorias comun, una sola vez por version del par entre todos los
+    procesos. Las tablas publicadas se mapean en memoria: no se deben
+    modificar en el lugar.
+    """
+    clave = huella_contenido(f"{huella_tabla(df_barriles)}|{huella_tabla(df_latas)}".encode())
+    nombres = (f"compacta-{HOJA_BARRILES}", f"compacta-{HOJA_MOVIMIENTOS_LATAS}")
+
+    def leer_compactas() -> tuple[pd.DataFrame, pd.DataFrame] | None:
+        tablas = tuple(leer_preparada_compartida(nombre, clave) for nombre in nombres)
+        return None if any(tabla is None for tabla in tablas) else tablas
+
+    tablas = leer_compactas()
+    if tablas is not None:
+        return tablas
+    with bloqueo_compartido("compactas"):
+        tablas = leer_compactas()
+        if tablas is None:
+            categorias = diccionario_categorias([df_barriles, df_latas])
+            tablas = tuple(compactar_tabla(df, categorias) for df in (df_barriles, df_latas))
+            for nombre, tabla in zip(nombres, tablas):
+                guardar_preparada_compartida(nombre, tabla, clave=clave)
+    return tablas
+
+
+# -----------------------------------------------------------------------------
+# ORIGENES DE DATOS
+# -----------------------------------------------------------------------------
+# Cada origen es una funcion nombre_hoja -> hoja cruda (texto, con huella).
+# Los espejos locales se leen de disco y, mientras el archivo no cambie, se
+# devuelve la tabla ya leida: no se debe modificar en el lugar.
+_MEMO_ESPEJO: dict[tuple[str, str], tuple[object, pd.DataFrame]] = {}
+_BLOQUEO_MEMO_ESPEJO = threading.Lock()
+
+
+def ruta_espejo_parquet(nombre_hoja: str, directorio: Path | None = None) -> Path:
+    return (directorio or DIRECTORIO_ESPEJO) / f"{quote(nombre_hoja, safe='')}.parquet"
+
+
+def ruta_indice_espejo(nombre_hoja: str, directorio: Path | None = None) -> Path:
+    return (directorio or DIRECTORIO_ESPEJO) / f"{quote(nombre_hoja, safe='')}.json"
+
+
+def ruta_espejo_sqlite(directorio: Path | None = None) -> Path:
+    return (directorio or DIRECTORIO_ESPEJO) / ARCHIVO_ESPEJO_SQLITE
+
+
+def identificador_sqlite(nombre: str) -> str:
+    return '"' + nombre.replace('"', '""') + '"'
+
+
+def tabla_espejo_sqlite(nombre_hoja: str) -> str:
+    return identificador_sqlite(f"hoja_{nombre_hoja}")
+
+
+def espejo_recordado(clave: tuple[str, str], version: object) -> pd.DataFrame | None:
+    with _BLOQUEO_MEMO_ESPEJO:
+        guardado = _MEMO_ESPEJO.get(clave)
+    if guardado is not None and guardado[0] == version:
+        return guardado[1]
+    return None
+
+
+def recordar_espejo(clave: tuple[str, str], version: object, df: pd.DataFrame) -> pd.DataFrame:
+    with _BLOQUEO_MEMO_ESPEJO:
+        _MEMO_ESPEJO[clave] = (version, df)
+    return df
+
+
+def leer_espejo_parquet(nombre_hoja: str, directorio: Path | None = None) -> pd.DataFrame:
+    """Lee la hoja del espejo Parquet; la huella viaja en los atributos del archivo."""
+    ruta = ruta_espejo_parquet(nombre_hoja, directorio)
+    try:
+        estado = ruta.stat()
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"No existe el espejo {ruta}; corre sincronizar_espejo.py"
+        ) from None
+    clave = (str(ruta), nombre_hoja)
+    version = (estado.st_mtime_ns, estado.st_size)
+    df = espejo_recordado(clave, version)
+    if df is not None:
+        return df
+    df = pd.read_parquet(ruta)
+    if not df.attrs.get("huella"):
+        con_huella(df, huella_tabla(df))
+    return recordar_espejo(clave, version, df)
+
+
+def leer_espejo_sqlite(nombre_hoja: str, directorio: Path | None = None) -> pd.DataFrame:
+    """
+    Lee la hoja del espejo SQLite. La huella y las filas se leen en la misma
+    transaccion, asi una sincronizacion en curso nunca deja una mezcla.
+    """
+    ruta = ruta_espejo_sqlite(directorio)
+    if not ruta.exists():
+        raise FileNotFoundError(f"No existe el espejo {ruta}; corre sincronizar_espejo.py")
+    clave = (str(ruta), nombre_hoja)
+    with contextlib.closing(sqlite3.connect(ruta, timeout=30, isolation_level=None)) as conexion:
+        conexion.execute("BEGIN")
+        try:
+            fila = conexion.execute(
+                f"SELECT huella FROM {TABLA_ESTADO_ESPEJO} WHERE hoja = ?", (nombre_hoja,)
+            ).fetchone()
+            if fila is None:
+                raise LookupError(f"La hoja {nombre_hoja} no esta en el espejo {ruta}")
+            df = espejo_recordado(clave, fila[0])
+            if df is None:
+                df = pd.read_sql_query(
+                    f"SELECT * FROM {tabla_espejo_sqlite(nombre_hoja)}",
+                    conexion,
+                    dtype=TIPO_TEXTO,
+                )
+                recordar_espejo(clave, fila[0], con_huella(df, fila[0]))
+        finally:
+            conexion.execute("ROLLBACK")
+    return df
+
+
+def huella_espejo(nombre_hoja: str, origen: str, directorio: Path | None = None) -> str | None:
+    """Huella de la version de la hoja guardada en un espejo, o None si no esta."""
+    if origen == ORIGEN_PARQUET:
+        try:
+            indice = json.loads(
+                ruta_indice_espejo(nombre_hoja, directorio).read_text(encoding="utf-8")
+            )
+        except (OSError, ValueError):
+            return None
+        return indice.get("huella")
+
+    ruta = ruta_espejo_sqlite(directorio)
+    if not ruta.exists():
+        return None
+    try:
+        with contextlib.closing(sqlite3.connect(ruta, timeout=30)) as conexion:
+            fila = conexion.execute(
+                f"SELECT huella FROM {TABLA_ESTADO_ESPEJO} WHERE hoja = ?", (nombre_hoja,)
+            ).fetchone()
+    except sqlite3.Error:
+        return None
+    return fila[0] if fila else None
+
+
+def guardar_espejo_parquet(
+    nombre_hoja: str, df: pd.DataFrame, directorio: Path | None = None
+) -> None:
+    ruta = ruta_espejo_parquet(nombre_hoja, directorio)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    temporal = ruta.with_name(f"{ruta.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    df.to_parquet(temporal, index=False)
+    os.replace(temporal, ruta)
+
+    indice = ruta_indice_espejo(nombre_hoja, directorio)
+    temporal = indice.with_name(f"{indice.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    temporal.write_text(
+        json.dumps({"huella": df.attrs["huella"], "filas": len(df), "sincronizado": time.time()}),
+        encoding="utf-8",
+    )
+    os.replace(temporal, indice)
+
+
+def guardar_espejo_sqlite(
+    nombre_hoja: str, df: pd.DataFrame, directorio: Path | None = None
+) -> None:
+    """
+    Reemplaza la tabla de la hoja en una sola transaccion. Con WAL los
+    lectores siguen viendo la version anterior hasta el commit.
+    """
+    ruta = ruta_espejo_sqlite(directorio)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    tabla = tabla_espejo_sqlite(nombre_hoja)
+    columnas = ", ".join(f"{identificador_sqlite(columna)} TEXT" for columna in df.columns)
+    marcadores = ", ".join("?" * len(df.columns))
+    with contextlib.closing(sqlite3.connect(ruta, timeout=30, isolation_level=None)) as conexion:
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute(
+            f"CREATE TABLE IF NOT EXISTS {TABLA_ESTADO_ESPEJO} ("
+            "hoja TEXT PRIMARY KEY, huella TEXT NOT NULL, "
+            "filas INTEGER NOT NULL, sincronizado REAL NOT NULL)"
+        )
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            conexion.execute(f"DROP TABLE IF EXISTS {tabla}")
+            conexion.execute(f"CREATE TABLE {tabla} ({columnas})")
+            conexion.executemany(
+                f"INSERT INTO {tabla} VALUES ({marcadores})",
+                df.itertuples(index=False, name=None),
+            )
+            conexion.execute(
+                f"INSERT INTO {TABLA_ESTADO_ESPEJO} VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(hoja) DO UPDATE SET huella = excluded.huella, "
+                "filas = excluded.filas, sincronizado = excluded.sincronizado",
+                (nombre_hoja, df.attrs["huella"], len(df), time.time()),
+            )
+        except BaseException:
+            conexion.execute("ROLLBACK")
+            raise
+        conexion.execute("COMMIT")
+
+
+ORIGENES: dict[str, Callable[[str], pd.DataFrame]] = {
+    ORIGEN_GOOGLE: leer_hoja,
+    ORIGEN_PARQUET: leer_espejo_parquet,
+    ORIGEN_SQLITE: leer_espejo_sqlite,
+}
+ESCRITORES_ESPEJO: dict[str, Callable[[str, pd.DataFrame, Path | None], None]] = {
+    ORIGEN_PARQUET: guardar_espejo_parquet,
+    ORIGEN_SQLITE: guardar_espejo_sqlite,
+}
+
+
+def lector_origen(origen: str | None = None) -> Callable[[str], pd.DataFrame]:
+    origen = origen or ORIGEN_DATOS
+    try:
+        return ORIGENES[origen]
+    except KeyError:
+        raise ValueError(
+            f"Origen de datos desconocido: {origen} (opciones: {', '.join(ORIGENES)})"
+        ) from None
+
+
+def leer_hoja_origen(nombre_hoja: str) -> pd.DataFrame:
+    """Lee la hoja cruda del origen elegido con REPORTES_ORIGEN."""
+    return lector_origen()(nombre_hoja)
+
+
+def sincronizar_hoja(
+    nombre_hoja: str, espejos: list[str], directorio: Path | None = None
+) -> list[str]:
+    """
+    Descarga la hoja completa de Google y reescribe los espejos que tengan
+    otra version. Devuelve los espejos actualizados.
+    """
+    with medir_etapa(f"sincronizar {nombre_hoja}") as medicion:
+        contenido, huella = descargar_hoja(nombre_hoja)
+        pendientes = [
+            espejo for espejo in espejos if huella_espejo(nombre_hoja, espejo, directorio) != huella
+        ]
+        if pendientes:
+            df = con_huella(parsear_csv_hoja(contenido, nombre_hoja), huella)
+            if df.columns.empty:
+                raise RuntimeError(f"La hoja {nombre_hoja} llego sin encabezado")
+            for espejo in pendientes:
+                ESCRITORES_ESPEJO[espejo](nombre_hoja, df, directorio)
+            medicion["filas_salida"] = len(df)
+        return pendientes
+
+
+def sincronizar_espejo(
+    nombres_hojas: list[str], espejos: list[str], directorio: Path | None = None
+) -> dict[str, tuple[list[str], str | None]]:
+    """Sincroniza las hojas en paralelo; cada una conserva su propio error."""
+
+    def sincronizar(nombre_hoja: str) -> tuple[list[str], str | None]:
+        try:
+            return sincronizar_hoja(nombre_hoja, espejos, directorio), None
+        except Exception as exc:
+            return [], str(exc)
+
+    with ThreadPoolExecutor(max_workers=max(len(nombres_hojas), 1)) as ejecutor:
+        return dict(zip(nombres_hojas, ejecutor.map(sincronizar, nombres_hojas)))
+
+
+def cargar_hoja_segura(
+    nombre_hoja: str,
+    lector: Callable[[str], pd.DataFrame] = leer_hoja_origen,
+) -> tuple[pd.DataFrame, str | None]:
+    with medir_etapa(f"leer_hoja {nombre_hoja}") as medicion:
+        try:
+            df = lector(nombre_hoja)
+        except Exception as exc:  # La app puede continuar mostrando las otras fuentes.
+            medicion["error"] = True
+            return pd.DataFrame(), str(exc)
+        medicion["filas_salida"] = len(df)
+        return df, None
+
+
+def cargar_hojas_concurrentes(
+    nombres_hojas: list[str],
+    lector: Callable[[str], pd.DataFrame] = leer_hoja_origen,
+    inicializador: Callable[[], None] | None = None,
+) -> dict[str, tuple[pd.DataFrame, str | None]]:
+    """
+    Descarga todas las hojas a la vez. Cada hoja conserva su propia cache y su
+    propio error, de modo que la espera total es la de la hoja mas lenta.
+    `inicializador` corre al arrancar cada hilo del grupo.
+    """
+    with ThreadPoolExecutor(
+        max_workers=max(len(nombres_hojas), 1), initializer=inicializador
+    ) as ejecutor:
+        resultados = ejecutor.map(
+            lambda nombre_hoja: cargar_hoja_segura(nombre_hoja, lector), nombres_hojas
+        )
+        return dict(zip(nombres_hojas, resultados))
+
+
+# -----------------------------------------------------------------------------
+# PREPARACION DE DATOS
+# -----------------------------------------------------------------------------
+@instrumentar
+def preparar_barriles(df_origen: pd.DataFrame) -> pd.DataFrame:
+    columnas_salida = [
+        "Fecha",
+        "Codigo",
+        "Lote",
+        "Estilo",
+        "Estado",
+        "Estado_normalizado",
+        "Cliente",
+        "Responsable",
+        "Observaciones",
+        "Litros",
+    ]
+    if df_origen.empty:
+        return pd.DataFrame(columns=columnas_salida)
+
+    # combinar_grupos ya entrega el texto limpio de cada grupo de columnas.
+    columnas = combinar_grupos(df_origen, list(COLUMNAS_ORIGEN[HOJA_BARRILES]))
+    codigo = limpiar_codigo(columnas["Codigo"])
+    observaciones = columnas["Observaciones"]
+    capacidad = columnas["Capacidad"]
+    estado = columnas["Estado"]
+
+    df = pd.DataFrame(
+        {
+            "Fecha": convertir_fechas(columnas["Marca temporal"]),
+            "Codigo": codigo,
+            "Lote": limpiar_lote(columnas["Lote"]),
+            "Estilo": limpiar_texto(columnas["Estilo"], valor_vacio="Sin definir"),
+            "Estado": estado,
+            "Cliente": limpiar_texto(columnas["Cliente"], valor_vacio="Sin definir"),
+            "Responsable": limpiar_texto(
+                columnas["Responsable"], valor_vacio="Sin definir"
+            ),
+            "Observaciones": observaciones,
+        }
+    )
+
+    df["Estado_normalizado"] = normalizar_claves(df["Estado"])
+    df["Litros"] = calcular_litros_barril(codigo, capacidad, observaciones)
+    df = df[df["Fecha"].notna() & df["Codigo"].ne("")].copy()
+    return df[columnas_salida]
+
+
+@instrumentar
+def preparar_movimientos_latas(df_origen: pd.DataFrame) -> pd.DataFrame:
+    columnas_salida = [
+        "Fecha",
+        "Estilo",
+        "Cantidad",
+        "Lote",
+        "Cliente",
+        "Responsable",
+        "Estado",
+        "Estado_normalizado",
+        "Litros",
+    ]
+    if df_origen.empty:
+        return pd.DataFrame(columns=columnas_salida)
+
+    columnas = combinar_grupos(df_origen, list(COLUMNAS_ORIGEN[HOJA_MOVIMIENTOS_LATAS]))
+    estado = columnas["Estado"]
+    cantidad = convertir_cantidades(columnas["Cantidad"])
+
+    df = pd.DataFrame(
+        {
+            "Fecha": convertir_fechas(columnas["Marca temporal"]),
+            "Estilo": limpiar_texto(columnas["Estilo"], valor_vacio="Sin definir"),
+            "Cantidad": cantidad,
+            "Lote": limpiar_lote(columnas["Lote"]),
+            "Cliente": limpiar_texto(columnas["Cliente"], valor_vacio="Sin definir"),
+            "Responsable": limpiar_texto(
+                columnas["Responsable"], valor_vacio="Sin definir"
+            ),
+            "Estado": estado,
+        }
+    )
+
+    df["Estado_normalizado"] = normalizar_claves(df["Estado"])
+    df["Litros"] = df["Cantidad"].fillna(0) * LITROS_POR_LATA
+    df = df[
+        df["Fecha"].notna()
+        & df["Cantidad"].notna()
+        & df["Cantidad"].gt(0)
+    ].copy()
+    return df[columnas_salida]
+
+
+@instrumentar
+def preparar_inventario_latas(df_origen: pd.DataFrame) -> pd.DataFrame:
+    columnas_salida = [
+        "Estilo",
+        "Lote",
+        "Ingresadas",
+        "Despachadas",
+        "Devoluciones",
+        "Bajas",
+        "Disponible",
+        "Litros",
+    ]
+    if df_origen.empty:
+        return pd.DataFrame(columns=columnas_salida)
+
+    columnas = combinar_grupos(df_origen, list(COLUMNAS_ORIGEN[HOJA_INVENTARIO_LATAS]))
+    ingresadas = convertir_cantidades(columnas["Ingresadas"]).fillna(0)
+    despachadas = convertir_cantidades(columnas["Despachadas"]).fillna(0)
+    devoluciones = convertir_cantidades(columnas["Devoluciones"]).fillna(0)
+    bajas = convertir_cantidades(columnas["Bajas"]).fillna(0)
+    disponible = convertir_cantidades(columnas["Disponible"])
+
+    # Respaldo en caso de que la columna Disponible no exista o este vacia.
+    disponible_calculado = ingresadas - despachadas + devoluciones - bajas
+    disponible = disponible.fillna(disponible_calculado)
+
+    df = pd.DataFrame(
+        {
+            "Estilo": limpiar_texto(columnas["Estilo"], valor_vacio="Sin definir"),
+            "Lote": limpiar_lote(columnas["Lote"]),
+            "Ingresadas": ingresadas,
+            "Despachadas": despachadas,
+            "Devoluciones": devoluciones,
+            "Bajas": bajas,
+            "Disponible": disponible,
+        }
+    )
+    df["Litros"] = df["Disponible"].fillna(0) * LITROS_POR_LATA
+    df = df[df["Disponible"].fillna(0).gt(0)].copy()
+    return df[columnas_salida]
+
+
+def diccionario_categorias(tablas: list[pd.DataFrame]) -> dict[str, pd.CategoricalDtype]:
+    """Categorias compartidas por columna, para que barriles y latas usen los mismos codigos."""
+    categorias: dict[str, pd.CategoricalDtype] = {}
+    for columna in COLUMNAS_CATEGORICAS:
+        valores: set[str] = set()
+        for tabla in tablas:
+            if columna in tabla.columns:
+                valores.update(tabla[columna].dropna().astype(str).unique().tolist())
+        categorias[columna] = pd.CategoricalDtype(sorted(valores))
+    categorias["Tipo"] = TIPO_PRESENTACION
+    return categorias
+
+
+def compactar_tabla(
+    df: pd.DataFrame,
+    categorias: dict[str, pd.CategoricalDtype],
+) -> pd.DataFrame:
+    """
+    Convierte textos repetidos a categorias y reduce los numeros a 32 bits.
+    Las columnas que no cambian se comparten con `df` en lugar de copiarse.
+    """
+    resultado = df.copy(deep=False)
+    for columna, tipo in categorias.items():
+        if columna in resultado.columns:
+            resultado[columna] = resultado[columna].astype(tipo)
+    for columna in COLUMNAS_CONTEO:
+        if columna in resultado.columns:
+            valores = pd.to_numeric(resultado[columna], errors="coerce").astype("float64")
+            entero = valores.notna().all() and bool((valores % 1 == 0).all())
+            resultado[columna] = valores.astype("int32" if entero else "float32")
+    for columna in COLUMNAS_LITROS:
+        if columna in resultado.columns:
+            resultado[columna] = (
+                pd.to_numeric(resultado[columna], errors="coerce").astype("float32")
+            )
+    return resultado
+
+
+def litros_redondeados(serie: pd.Series) -> pd.Series:
+    """
+    Litros en float64 y redondeados a 2 decimales, para sumas y salidas. Las
+    tablas compactas los guardan en float32, que mostraria 465.299988.
+    """
+    return serie.astype("float64").round(2)
+
+
+def con_linaje(df: pd.DataFrame, linaje: list[list]) -> pd.DataFrame:
+    """Marca las versiones [huella, filas] que `df` extiende agregando filas al final."""
+    df.attrs["linaje"] = [list(version) for version in linaje[-LIMITE_LINAJE:]]
+    return df
+
+
+def extiende_version(huella: str, filas: int, df: pd.DataFrame) -> bool:
+    """Indica si `df` es la version `huella` (de `filas` filas) con filas agregadas al final."""
+    return filas <= len(df) and [huella, filas] in df.attrs.get("linaje", [])
+
+
+def estado_para_version(estados: dict[str, dict], df: pd.DataFrame) -> dict | None:
+    """
+    Estado guardado para la version de `df` o, si no esta, para la version mas
+    reciente que `df` extiende. Cualquier otro cambio obliga a recalcular.
+    """
+    estado = estados.get(huella_tabla(df))
+    if estado is not None and estado["filas"] == len(df):
+        return estado
+    for huella, filas in reversed(df.attrs.get("linaje", [])):
+        estado = estados.get(huella)
+        if estado is not None and estado["filas"] == filas <= len(df):
+            return estado
+    return None
+
+
+def recordar_estado_version(estados: dict[str, dict], estado: dict) -> None:
+    estados.pop(estado["huella"], None)
+    estados[estado["huella"]] = estado
+    while len(estados) > VERSIONES_POR_ESTADO:
+        del estados[next(iter(estados))]
+
+
+def ultimo_evento_por_codigo(eventos: pd.DataFrame) -> pd.DataFrame:
+    """Ultimo evento de cada barril, indexado por Codigo; a igual fecha gana la fila posterior."""
+    ultimos = eventos.sort_values("Fecha", kind="stable").drop_duplicates(
+        subset="Codigo", keep="last"
+    )
+    ultimos.index = pd.Index(ultimos["Codigo"].to_numpy(), name=None)
+    return ultimos
+
+
+def actualizar_indice_estado_barriles(
+    indice: dict | None,
+    df_barriles: pd.DataFrame,
+) -> dict:
+    """
+    Extiende el indice de estado con las filas de DatosM posteriores a las ya
+    indexadas. Si la tabla no es la version indexada con filas agregadas al
+    final se reconstruye completo.
+    """
+    filas = len(df_barriles)
+    huella = huella_tabla(df_barriles)
+    if indice is not None and indice["huella"] == huella and indice["filas"] == filas:
+        return indice
+    continua = (
+        indice is not None
+        and list(indice["ultimos"].columns) == list(df_barriles.columns)
+        and extiende_version(indice["huella"], indice["filas"], df_barriles)
+    )
+
+    if continua:
+        previos = indice["ultimos"].astype(df_barriles.dtypes.to_dict())
+        ultimos = ultimo_evento_por_codigo(
+            pd.concat([previos, df_barriles.iloc[indice["filas"]:]])
+        )
+    else:
+        ultimos = ultimo_evento_por_codigo(df_barriles)
+
+    en_cuarto_frio = ultimos[ultimos["Estado_normalizado"].eq(ESTADO_CUARTO_FRIO)]
+    return {
+        "ultimos": ultimos,
+        "en_cuarto_frio": en_cuarto_frio.sort_values("Fecha", ascending=False, kind="stable"),
+        "filas": filas,
+        "huella": huella,
+    }
+
+
+def indice_estado_barriles(df_barriles: pd.DataFrame) -> dict:
+    """Indice de estado de la version de `df_barriles`, extendido desde una previa si se puede."""
+    with _BLOQUEO_INDICE_BARRILES:
+        indice = actualizar_indice_estado_barriles(
+            estado_para_version(_INDICE_ESTADO_BARRILES, df_barriles), df_barriles
+        )
+        recordar_estado_version(_INDICE_ESTADO_BARRILES, indice)
+    return indice
+
+
+def estado_barril(indice: dict, codigo: str) -> pd.Series | None:
+    """Ultimo evento registrado para el barril `codigo`, o None si no existe."""
+    try:
+        return indice["ultimos"].loc[codigo]
+    except KeyError:
+        return None
+
+
+@instrumentar
+def obtener_inventario_barriles_actual(df_barriles: pd.DataFrame) -> pd.DataFrame:
+    if df_barriles.empty:
+        return df_barriles.copy()
+    return indice_estado_barriles(df_barriles)["en_cuarto_frio"].reset_index(drop=True)
+
+
+def inventario_barriles_en_fecha(
+    eventos_barriles: pd.DataFrame,
+    corte: pd.Timestamp,
+) -> pd.DataFrame:
+    """
+    Barriles en cuarto frio antes de `corte`. `eventos_barriles` debe estar
+    ordenado por Fecha; cada Codigo toma su ultimo evento anterior al corte.
+    """
+    if eventos_barriles.empty:
+        return eventos_barriles.copy()
+
+    codigos = eventos_barriles["Codigo"].unique()
+    consulta = pd.DataFrame(
+        {
+            "Corte": pd.Series(corte, index=range(len(codigos))).astype(
+                eventos_barriles["Fecha"].dtype
+            ),
+            "Codigo": codigos,
+        }
+    )
+    estado = pd.merge_asof(
+        consulta,
+        eventos_barriles,
+        left_on="Corte",
+        right_on="Fecha",
+        by="Codigo",
+        allow_exact_matches=False,
+    )
+    en_cuarto_frio = estado[estado["Estado_normalizado"].eq(ESTADO_CUARTO_FRIO)]
+    return (
+        en_cuarto_frio[eventos_barriles.columns]
+        .sort_values("Fecha", ascending=False, kind="stable")
+        .reset_index(drop=True)
+    )
+
+
+def inventario_latas_en_fecha(
+    inventario_latas: pd.DataFrame,
+    eventos_latas: pd.DataFrame,
+    corte: pd.Timestamp,
+) -> pd.DataFrame:
+    """
+    Saldo de latas por estilo y lote antes de `corte`: el inventario actual
+    menos el efecto acumulado de los movimientos de VLatas desde el corte.
+    """
+    columnas = ["Ingresadas", "Despachadas", "Devoluciones", "Bajas", "Disponible"]
+    claves = ["Estilo", "Lote"]
+    actual = pd.DataFrame(
+        {
+            "Estilo": inventario_latas["Estilo"].astype(str),
+            "Lote": inventario_latas["Lote"].astype(str),
+            **{columna: inventario_latas[columna].astype("float64") for columna in columnas},
+        }
+    )
+
+    if eventos_latas.empty:
+        posteriores = eventos_latas
+    else:
+        inicio = eventos_latas["Fecha"].searchsorted(corte, side="left")
+        posteriores = eventos_latas.iloc[inicio:]
+    clase = posteriores["Estado_normalizado"].astype(str).map(CLASES_MOVIMIENTO_LATAS)
+    posteriores = pd.DataFrame(
+        {
+            "Estilo": posteriores["Estilo"].astype(str),
+            "Lote": posteriores["Lote"].astype(str),
+            "Clase": clase,
+            "Cantidad": posteriores["Cantidad"].astype("float64"),
+        }
+    ).dropna(subset=["Clase"])
+    revertir = (
+        posteriores.pivot_table(
+            index=claves, columns="Clase", values="Cantidad", aggfunc="sum", fill_value=0.0
+        )
+        .reindex(columns=list(SIGNO_MOVIMIENTO_LATAS), fill_value=0.0)
+    )
+    revertir["Disponible"] = sum(
+        revertir[columna] * signo for columna, signo in SIGNO_MOVIMIENTO_LATAS.items()
+    )
+
+    saldo = actual.groupby(claves)[columnas].sum()
+    saldo = saldo.reindex(saldo.index.union(revertir.index), fill_value=0.0)
+    saldo = saldo.sub(revertir.reindex(saldo.index, fill_value=0.0)[columnas], fill_value=0.0)
+    saldo = saldo[saldo["Disponible"].gt(0)].reset_index()
+    saldo["Litros"] = saldo["Disponible"] * LITROS_POR_LATA
+    return saldo[claves + columnas + ["Litros"]]
+
+
+def variaciones_barriles(
+    eventos: pd.DataFrame,
+    previos: pd.DataFrame | None = None,
+) -> pd.DataFrame:
+    """
+    Litros que entran (+) y salen (-) de cuarto frio por dia y estilo. Cada
+    evento suma su barril si queda en cuarto frio y resta el estado anterior
+    del mismo Codigo si estaba alli; `previos` trae ese estado para los
+    barriles con historia anterior a `eventos`.
+    """
+    columnas = ["Fecha", "Codigo", "Estilo", "Litros", "Estado_normalizado"]
+    eventos = eventos[columnas].assign(Nuevo=True)
+    if previos is not None and not previos.empty:
+        eventos = pd.concat([previos[columnas].assign(Nuevo=False), eventos], ignore_index=True)
+    eventos = eventos.sort_values("Fecha", kind="stable", ignore_index=True)
+    eventos["Estilo"] = eventos["Estilo"].astype(str)
+    en_frio = eventos["Estado_normalizado"].eq(ESTADO_CUARTO_FRIO)
+    eventos["Litros_frio"] = eventos["Litros"].astype("float64").fillna(0).where(en_frio, 0.0)
+
+    anterior = eventos.groupby("Codigo", sort=False)[["Estilo", "Litros_frio"]].shift(1)
+    nuevos = eventos["Nuevo"]
+    dias = eventos["Fecha"].dt.normalize()
+    entradas = pd.DataFrame(
+        {"Dia": dias, "Estilo": eventos["Estilo"], "Litros": eventos["Litros_frio"]}
+    )[nuevos & en_frio]
+    salidas = pd.DataFrame(
+        {"Dia": dias, "Estilo": anterior["Estilo"], "Litros": -anterior["Litros_frio"]}
+    )[nuevos & anterior["Litros_frio"].fillna(0).ne(0)]
+    return agrupar_variaciones(pd.concat([entradas, salidas], ignore_index=True))
+
+
+def variaciones_latas(eventos: pd.DataFrame) -> pd.DataFrame:
+    """Litros de latas que entran (+) y salen (-) de inventario por dia y estilo."""
+    clase = eventos["Estado_normalizado"].astype(str).map(CLASES_MOVIMIENTO_LATAS)
+    signo = clase.map(SIGNO_MOVIMIENTO_LATAS)
+    variaciones = pd.DataFrame(
+        {
+            "Dia": eventos["Fecha"].dt.normalize(),
+            "Estilo": eventos["Estilo"].astype(str),
+            "Litros": eventos["Litros"].astype("float64") * signo,
+        }
+    )
+    return agrupar_variaciones(variaciones.dropna(subset=["Litros"]))
+
+
+def agrupar_variaciones(variaciones: pd.DataFrame) -> pd.DataFrame:
+    return variaciones.groupby(["Dia", "Estilo"], as_index=False)["Litros"].sum()
+
+
+def actualizar_variaciones(
+    estado: dict | None,
+    eventos: pd.DataFrame,
+    calcular: Callable[..., pd.DataFrame],
+    con_estado_barriles: bool,
+) -> dict:
+    """
+    Extiende las variaciones diarias con las filas nuevas de `eventos`. Se
+    recalcula todo si la tabla no es la version de `estado` con filas
+    agregadas al final o si llegan filas con fecha previa a la ultima procesada.
+    """
+    filas = len(eventos)
+    huella = huella_tabla(eventos)
+    if estado is not None and estado["huella"] == huella and estado["filas"] == filas:
+        return estado
+    nuevas = eventos.iloc[estado["filas"]:] if estado else eventos
+    continua = (
+        estado is not None
+        and extiende_version(estado["huella"], estado["filas"], eventos)
+        and (nuevas.empty or nuevas["Fecha"].min() >= estado["ultima_fecha"])
+    )
+
+    indice = estado["indice"] if continua else None
+    if continua:
+        nuevas_variaciones = calcular(nuevas, indice["ultimos"]) if indice else calcular(nuevas)
+        variaciones = agrupar_variaciones(
+            pd.concat([estado["variaciones"], nuevas_variaciones], ignore_index=True)
+        )
+    else:
+        variaciones = calcular(eventos)
+
+    return {
+        "variaciones": variaciones,
+        "indice": actualizar_indice_estado_barriles(indice, eventos) if con_estado_barriles else None,
+        "filas": filas,
+        "huella": huella,
+        "ultima_fecha": eventos["Fecha"].max() if filas else pd.NaT,
+    }
+
+
+def variaciones_inventario(
+    df_barriles: pd.DataFrame,
+    df_movimientos_latas: pd.DataFrame,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Variaciones diarias de barriles y latas para la version de las tablas dadas."""
+    resultados = []
+    with _BLOQUEO_VARIACIONES:
+        for nombre, eventos, calcular, con_estado in (
+            (HOJA_BARRILES, df_barriles, variaciones_barriles, True),
+            (HOJA_MOVIMIENTOS_LATAS, df_movimientos_latas, variaciones_latas, False),
+        ):
+            estados = _VARIACIONES_INVENTARIO.setdefault(nombre, {})
+            estado = actualizar_variaciones(
+                estado_para_version(estados, eventos), eventos, calcular, con_estado
+            )
+            recordar_estado_version(estados, estado)
+            resultados.append(estado["variaciones"])
+    return resultados[0], resultados[1]
+
+
+def construir_serie_inventario(
+    cambios_barriles: pd.DataFrame,
+    cambios_latas: pd.DataFrame,
+    inventario_latas: pd.DataFrame,
+    hasta: date,
+) -> pd.DataFrame:
+    """
+    Litros en cuarto frio por dia y estilo, acumulando las variaciones sobre
+    una matriz densa dia x estilo. El saldo de latas se ancla al Disponible
+    actual de InventarioLatasTR.
+    """
+    columnas = ["Dia", "Estilo", "Litros_barriles", "Litros_latas", "Litros_totales"]
+    dias_con_datos = pd.concat([cambios_barriles["Dia"], cambios_latas["Dia"]])
+    if dias_con_datos.empty:
+        return pd.DataFrame(columns=columnas)
+
+    dias = pd.date_range(
+        dias_con_datos.min(), max(dias_con_datos.max(), pd.Timestamp(hasta)), freq="D"
+    )
+    actual_latas = (
+        inventario_latas.assign(Estilo=inventario_latas["Estilo"].astype(str))
+        .groupby("Estilo")["Litros"]
+        .sum()
+        .astype("float64")
+    )
+    estilos = sorted(
+        set(cambios_barriles["Estilo"]) | set(cambios_latas["Estilo"]) | set(actual_latas.index)
+    )
+
+    def acumular(variaciones: pd.DataFrame) -> pd.DataFrame:
+        if variaciones.empty:
+            return pd.DataFrame(0.0, index=dias, columns=estilos)
+        matriz = variaciones.pivot_table(
+            index="Dia", columns="Estilo", values="Litros", aggfunc="sum", fill_value=0.0
+        )
+        return matriz.reindex(index=dias, columns=estilos, fill_value=0.0).cumsum()
+
+    barriles = acumular(cambios_barriles)
+    latas = acumular(cambios_latas)
+    latas = latas + (actual_latas.reindex(estilos, fill_value=0.0) - latas.iloc[-1])
+
+    serie = pd.DataFrame(
+        {
+            "Litros_barriles": barriles.stack(),
+            "Litros_latas": latas.stack(),
+        }
+    ).clip(lower=0)
+    serie.index = serie.index.set_names(["Dia", "Estilo"])
+    serie["Litros_totales"] = serie["Litros_barriles"] + serie["Litros_latas"]
+    return serie.reset_index()[columnas]
+
+
+@instrumentar
+def construir_despachos(
+    df_barriles: pd.DataFrame,
+    df_latas: pd.DataFrame,
+) -> pd.DataFrame:
+    columnas = [
+        "Fecha",
+        "Tipo",
+        "Cliente",
+        "Estilo",
+        "Codigo",
+        "Lote",
+        "Barriles",
+        "Latas",
+        "Litros_barriles",
+        "Litros_latas",
+        "Litros_totales",
+        "Responsable",
+        "Observaciones",
+    ]
+    partes: list[pd.DataFrame] = []
+
+    if not df_barriles.empty:
+        barriles = df_barriles[
+            df_barriles["Estado_normalizado"].isin(ESTADOS_DESPACHO)
+        ].copy()
+        if not barriles.empty:
+            barriles["Tipo"] = "Barril"
+            barriles["Barriles"] = 1
+            barriles["Latas"] = 0.0
+            barriles["Litros_barriles"] = barriles["Litros"]
+            barriles["Litros_latas"] = 0.0
+            barriles["Litros_totales"] = barriles["Litros"]
+            partes.append(barriles[columnas])
+
+    if not df_latas.empty:
+        # Estado vacio se considera despacho historico, igual que en el inventario.
+        es_despacho = (
+            df_latas["Estado_normalizado"].isin(ESTADOS_DESPACHO)
+            | df_latas["Estado_normalizado"].eq("")
+        )
+        latas = df_latas[es_despacho].copy()
+        if not latas.empty:
+            latas["Tipo"] = "Lata"
+            latas["Codigo"] = ""
+            latas["Barriles"] = 0
+            latas["Latas"] = latas["Cantidad"]
+            latas["Litros_barriles"] = 0.0
+            latas["Litros_latas"] = latas["Litros"]
+            latas["Litros_totales"] = latas["Litros"]
+            latas["Observaciones"] = ""
+            partes.append(latas[columnas])
+
+    if not partes:
+        return pd.DataFrame(columns=columnas)
+
+    # Si barriles y latas comparten categorias, el concat las conserva.
+    despachos = pd.concat(partes, ignore_index=True).sort_values("Fecha")
+    return compactar_tabla(despachos, {"Tipo": TIPO_PRESENTACION})
+
+
+@instrumentar
+def construir_cubo_despachos(despachos: pd.DataFrame) -> pd.DataFrame:
+    """
+    Agrega los despachos por Dia x Hora x Cliente x Estilo x Tipo. Los
+    graficos y los indicadores de despachos se calculan sobre este cubo, cuyo
+    tamano depende de la actividad distinta y no del numero de filas.
+    """
+    columnas_valor = [
+        "Barriles",
+        "Latas",
+        "Litros_barriles",
+        "Litros_latas",
+        "Litros_totales",
+        "Movimientos",
+    ]
+    if despachos.empty:
+        return pd.DataFrame(columns=COLUMNAS_CUBO + columnas_valor)
+
+    # Los litros se suman ya redondeados en float64, no en float32.
+    datos = despachos.assign(
+        Dia=despachos["Fecha"].dt.floor("D"),
+        Hora=despachos["Fecha"].dt.hour.astype("int8"),
+        **{
+            columna: litros_redondeados(despachos[columna])
+            for columna in COLUMNAS_LITROS
+            if columna in despachos.columns
+        },
+    )
+    cubo = datos.groupby(COLUMNAS_CUBO, as_index=False, observed=True, sort=False).agg(
+        Barriles=("Barriles", "sum"),
+        Latas=("Latas", "sum"),
+        Litros_barriles=("Litros_barriles", "sum"),
+        Litros_latas=("Litros_latas", "sum"),
+        Litros_totales=("Litros_totales", "sum"),
+        Movimientos=("Tipo", "size"),
+    )
+    for columna in COLUMNAS_LITROS:
+        if columna in cubo.columns:
+            cubo[columna] = litros_redondeados(cubo[columna])
+    return cubo.sort_values("Dia", ignore_index=True)
+
+
+# -----------------------------------------------------------------------------
+# INGESTA INCREMENTAL
+# -----------------------------------------------------------------------------
+def preparador_hoja(nombre_hoja: str) -> Callable[[pd.DataFrame], pd.DataFrame]:
+    return {
+        HOJA_BARRILES: preparar_barriles,
+        HOJA_MOVIMIENTOS_LATAS: preparar_movimientos_latas,
+        HOJA_INVENTARIO_LATAS: preparar_inventario_latas,
+    }[nombre_hoja]
+
+
+def ruta_estado_ingesta(nombre_hoja: str) -> Path:
+    return DIRECTORIO_INGESTA / f"{quote(nombre_hoja, safe='')}.json"
+
+
+def ruta_tabla_preparada(nombre_hoja: str, parte: str | None = None) -> Path:
+    prefijo = quote(nombre_hoja, safe="")
+    if parte is None:
+        return DIRECTORIO_INGESTA / f"{prefijo}.parquet"
+    return DIRECTORIO_INGESTA / f"{prefijo}.parte-{parte}.parquet"
+
+
+def escribir_parquet_ingesta(df: pd.DataFrame, ruta: Path) -> None:
+    temporal = ruta.with_name(f"{ruta.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    df.to_parquet(temporal, index=True)
+    os.replace(temporal, ruta)
+
+
+def leer_tabla_ingerida(nombre_hoja: str, estado: dict) -> pd.DataFrame:
+    """Tabla preparada guardada: el archivo compacto seguido de sus partes agregadas."""
+    tablas = [pd.read_parquet(ruta_tabla_preparada(nombre_hoja))]
+    for parte in estado.get("partes", []):
+        tablas.append(pd.read_parquet(ruta_tabla_preparada(nombre_hoja, parte)))
+    tabla = pd.concat(tablas) if len(tablas) > 1 else tablas[0]
+    return con_linaje(con_huella(tabla, estado.get("huella", "")), estado.get("linaje", []))
+
+
+def leer_estado_ingesta(nombre_hoja: str) -> dict | None:
+    try:
+        return json.loads(ruta_estado_ingesta(nombre_hoja).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def escribir_estado_ingesta(nombre_hoja: str, estado: dict) -> None:
+    ruta = ruta_estado_ingesta(nombre_hoja)
+    temporal = ruta.with_name(f"{ruta.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    temporal.write_text(json.dumps(estado), encoding="utf-8")
+    os.replace(temporal, ruta)
+
+
+def firma_fila(fila: pd.Series) -> str:
+    return huella_contenido(json.dumps([str(valor) for valor in fila.tolist()]).encode("utf-8"))
+
+
+def guardar_ingesta(
+    nombre_hoja: str,
+    tabla: pd.DataFrame,
+    bruto: pd.DataFrame,
+    filas_crudas: int,
+    estado_previo: dict | None,
+    agregadas: pd.DataFrame | None = None,
+) -> None:
+    """
+    Guarda el punto hasta donde se ha ingerido la hoja. Sin estado previo se
+    escribe la tabla completa; despues solo se escriben las filas `agregadas`
+    como una parte nueva, y nada si no llego ninguna.
+    """
+    DIRECTORIO_INGESTA.mkdir(parents=True, exist_ok=True)
+    partes = list(estado_previo.get("partes", [])) if estado_previo else []
+    compactar = estado_previo is None or len(partes) >= LIMITE_PARTES_INGESTA
+    if compactar:
+        escribir_parquet_ingesta(tabla, ruta_tabla_preparada(nombre_hoja))
+        partes = []
+        prefijo = quote(nombre_hoja, safe="")
+        for sobrante in DIRECTORIO_INGESTA.glob(f"{prefijo}.parte-*.parquet"):
+            sobrante.unlink(missing_ok=True)
+    elif agregadas is not None and not agregadas.empty:
+        parte = tabla.attrs["huella"]
+        escribir_parquet_ingesta(agregadas, ruta_tabla_preparada(nombre_hoja, parte))
+        partes.append(parte)
+
+    ahora = time.time()
+    completa = estado_previo is None
+    escribir_estado_ingesta(
+        nombre_hoja,
+        {
+            "filas_crudas": filas_crudas,
+            "columnas": list(bruto.columns),
+            "ultima_fila": firma_fila(bruto.iloc[-1]) if not bruto.empty else "",
+            "huella": tabla.attrs["huella"],
+            "linaje": tabla.attrs.get("linaje", []),
+            "partes": partes,
+            "completa": ahora if completa else estado_previo["completa"],
+            "revalidado": ahora,
+        },
+    )
+    guardar_preparada_compartida(nombre_hoja, tabla)
+
+
+def huella_ingesta(huella_previa: str, bruto: pd.DataFrame, filas_crudas: int) -> str:
+    """Version de una tabla extendida: encadena la previa con las filas agregadas."""
+    ultima = firma_fila(bruto.iloc[-1]) if not bruto.empty else ""
+    return huella_contenido(f"{huella_previa}|{filas_crudas}|{ultima}".encode("utf-8"))
+
+
+def reingerir_hoja_completa(
+    nombre_hoja: str,
+    preparar: Callable[[pd.DataFrame], pd.DataFrame],
+) -> pd.DataFrame:
+    # La huella de la descarga completa cambia con cualquier fila editada.
+    bruto = descargar_tabla(nombre_hoja)
+    tabla = con_linaje(con_huella(preparar(bruto), huella_tabla(bruto)), [])
+    try:
+        guardar_ingesta(nombre_hoja, tabla, bruto, len(bruto), None)
+    except Exception as exc:  # Sin disco la app sigue, pero sin ingesta incremental.
+        LOGGER.warning("No se pudo guardar la ingesta de %s: %s", nombre_hoja, exc)
+    return tabla
+
+
+def ingerir_hoja_incremental(
+    nombre_hoja: str,
+    preparar: Callable[[pd.DataFrame], pd.DataFrame],
+) -> pd.DataFrame:
+    """
+    Agrega a la tabla preparada local solo las filas nuevas de la hoja.
+
+    Se piden las filas desde la ultima ya ingerida (con `offset` de gviz) y se
+    verifica que esa fila no haya cambiado. Si el encabezado o esa fila no
+    coinciden, o si paso el plazo de reingesta, se reingiere la hoja completa.
+    """
+    with bloqueo_compartido(nombre_hoja):
+        estado = leer_estado_ingesta(nombre_hoja)
+        tabla = None
+        if estado is not None:
+            tabla = leer_preparada_compartida(nombre_hoja, estado.get("huella", ""))
+        if estado is not None and tabla is None:
+            try:
+                tabla = leer_tabla_ingerida(nombre_hoja, estado)
+            except Exception:
+                tabla = None
+        if tabla is not None:
+            con_linaje(tabla, estado.get("linaje", []))
+
+        ahora = time.time()
+        if (
+            tabla is None
+            or estado["filas_crudas"] == 0
+            or ahora - estado["completa"] >= REINGESTA_COMPLETA_SEGUNDOS
+        ):
+            return reingerir_hoja_completa(nombre_hoja, preparar)
+        if ahora - estado["revalidado"] < TTL_SNAPSHOT_SEGUNDOS:
+            return tabla
+
+        filas = estado["filas_crudas"]
+        try:
+            nuevas = descargar_tabla(nombre_hoja, offset=filas - 1)
+        except Exception as exc:
+            LOGGER.warning("Fallo la consulta incremental de %s: %s", nombre_hoja, exc)
+            return reingerir_hoja_completa(nombre_hoja, preparar)
+
+        if (
+            list(nuevas.columns) != estado["columnas"]
+            or nuevas.empty
+            or firma_fila(nuevas.iloc[0]) != estado["ultima_fila"]
+        ):
+            return reingerir_hoja_completa(nombre_hoja, preparar)
+
+        # La primera fila es la ultima ya ingerida; el resto son filas nuevas.
+        nuevas.index = pd.RangeIndex(filas - 1, filas - 1 + len(nuevas))
+        filas_crudas = filas - 1 + len(nuevas)
+        agregadas = None
+        if len(nuevas) > 1:
+            linaje = tabla.attrs.get("linaje", []) + [[tabla.attrs["huella"], len(tabla)]]
+            agregadas = preparar(nuevas.iloc[1:])
+            tabla = con_huella(
+                pd.concat([tabla, agregadas]),
+                huella_ingesta(tabla.attrs["huella"], nuevas, filas_crudas),
+            )
+            con_linaje(tabla, linaje)
+        try:
+            guardar_ingesta(nombre_hoja, tabla, nuevas, filas_crudas, estado, agregadas)
+        except Exception as exc:
+            LOGGER.warning("No se pudo guardar la ingesta de %s: %s", nombre_hoja, exc)
+        return tabla
+
+
+def usa_ingesta_incremental(nombre_hoja: str) -> bool:
+    """La ingesta incremental solo aplica al leer de Google Sheets."""
+    return (
+        ORIGEN_DATOS == ORIGEN_GOOGLE
+        and INGESTA_INCREMENTAL
+        and nombre_hoja in HOJAS_INCREMENTALES
+    )
+
+
+def leer_hoja_preparada(
+    nombre_hoja: str,
+    servir_vencido: bool = True,
+    desde: date | None = None,
+) -> pd.DataFrame:
+    """
+    Devuelve la hoja ya limpia, usando la ingesta incremental cuando aplica.
+    Con `desde` se piden a Google solo las filas desde esa fecha, sin pasar por
+    snapshots ni ingesta; si la consulta reducida no aplica llegan todas. Los
+    espejos locales se leen completos.
+    """
+    preparar = preparador_hoja(nombre_hoja)
+    if ORIGEN_DATOS != ORIGEN_GOOGLE:
+        return preparar_hoja_compartida(nombre_hoja, leer_hoja_origen(nombre_hoja))
+    if desde is not None:
+        bruto = descargar_tabla(nombre_hoja, desde=desde)
+        return con_huella(preparar(bruto), huella_tabla(bruto))
+    if usa_ingesta_incremental(nombre_hoja):
+        return ingerir_hoja_incremental(nombre_hoja, preparar)
+    return preparar_hoja_compartida(nombre_hoja, leer_hoja(nombre_hoja, servir_vencido))
+
+
+# -----------------------------------------------------------------------------
+# ACTUALIZACION EN SEGUNDO PLANO
+# -----------------------------------------------------------------------------
+# Las hojas vigentes del proceso se reemplazan de una vez cuando termina cada
+# relectura; si falla, se sigue sirviendo la version anterior. Las sesiones
+# piden actualizaciones con `solicitar_actualizacion` y no esperan el resultado.
+_BLOQUEO_ACTUALIZACION = threading.Lock()
+_EVENTO_ACTUALIZACION = threading.Event()
+_HOJAS_VIGENTES: dict[str, tuple[float, pd.DataFrame]] = {}
+_ESTADO_ACTUALIZACION: dict = {
+    "hilo": None,
+    "solicitadas": 0,
+    "completadas": 0,
+    "errores": {},
+    "ultima": None,
+}
+
+
+def publicar_hoja_vigente(nombre_hoja: str, df: pd.DataFrame) -> None:
+    with _BLOQUEO_ACTUALIZACION:
+        _HOJAS_VIGENTES[nombre_hoja] = (time.time(), df)
+
+
+def actualizador_activo() -> bool:
+    with _BLOQUEO_ACTUALIZACION:
+        hilo = _ESTADO_ACTUALIZACION["hilo"]
+    return hilo is not None and hilo.is_alive() and INTERVALO_ACTUALIZACION_SEGUNDOS > 0
+
+
+def hoja_vigente(nombre_hoja: str) -> pd.DataFrame:
+    """
+    Ultima version buena de la hoja preparada. Solo la primera lectura del
+    proceso, o una vencida cuando no hay actualizador, pasa por la lectura
+    normal de snapshots e ingesta; si esa lectura falla se sirve la anterior.
+    """
+    with _BLOQUEO_ACTUALIZACION:
+        guardada = _HOJAS_VIGENTES.get(nombre_hoja)
+    if guardada is not None:
+        leida, df = guardada
+        if actualizador_activo() or time.time() - leida < TTL_SNAPSHOT_SEGUNDOS:
+            return df
+
+    try:
+        df = leer_hoja_preparada(nombre_hoja)
+    except Exception as exc:
+        if guardada is None:
+            raise
+        LOGGER.warning("No se pudo releer %s; se sirve la anterior: %s", nombre_hoja, exc)
+        df = guardada[1]
+    publicar_hoja_vigente(nombre_hoja, df)
+    return df
+
+
+def actualizar_hojas_vigentes(nombres_hojas: list[str]) -> dict[str, str | None]:
+    """Relee las hojas vencidas y reemplaza las vigentes; devuelve el error de cada una."""
+    hojas = cargar_hojas_concurrentes(
+        nombres_hojas, lector=functools.partial(leer_hoja_preparada, servir_vencido=False)
+    )
+    errores = {}
+    for nombre_hoja, (df, error) in hojas.items():
+        if error:
+            LOGGER.warning("No se pudo actualizar %s; se conserva la anterior: %s", nombre_hoja, error)
+        else:
+            publicar_hoja_vigente(nombre_hoja, df)
+        errores[nombre_hoja] = error
+    with _BLOQUEO_ACTUALIZACION:
+        _ESTADO_ACTUALIZACION["errores"].update(errores)
+        _ESTADO_ACTUALIZACION["ultima"] = time.time()
+    return errores
+
+
+def bucle_actualizacion(nombres_hojas: list[str], intervalo: float) -> None:
+    """Relee las hojas cada `intervalo` segundos o antes si alguien lo solicita."""
+    while True:
+        with _BLOQUEO_ACTUALIZACION:
+            objetivo = _ESTADO_ACTUALIZACION["solicitadas"]
+        actualizar_hojas_vigentes(nombres_hojas)
+        with _BLOQUEO_ACTUALIZACION:
+            _ESTADO_ACTUALIZACION["completadas"] = objetivo
+            # Sin intervalo el hilo termina cuando no quedan solicitudes nuevas.
+            if intervalo <= 0 and _ESTADO_ACTUALIZACION["solicitadas"] == objetivo:
+                _ESTADO_ACTUALIZACION["hilo"] = None
+                return
+        if intervalo > 0:
+            _EVENTO_ACTUALIZACION.wait(intervalo)
+            _EVENTO_ACTUALIZACION.clear()
+
+
+def iniciar_actualizador(nombres_hojas: list[str]) -> None:
+    """Arranca el hilo periodico del proceso, salvo que el intervalo sea 0."""
+    if INTERVALO_ACTUALIZACION_SEGUNDOS > 0:
+        arrancar_hilo_actualizacion(nombres_hojas, INTERVALO_ACTUALIZACION_SEGUNDOS)
+
+
+def arrancar_hilo_actualizacion(nombres_hojas: list[str], intervalo: float) -> None:
+    with _BLOQUEO_ACTUALIZACION:
+        hilo = _ESTADO_ACTUALIZACION["hilo"]
+        if hilo is not None and hilo.is_alive():
+            return
+        hilo = threading.Thread(
+            target=bucle_actualizacion,
+            args=(list(nombres_hojas), intervalo),
+            name="actualizar-hojas",
+            daemon=True,
+        )
+        _ESTADO_ACTUALIZACION["hilo"] = hilo
+    hilo.start()
+
+
+def solicitar_actualizacion(nombres_hojas: list[str]) -> int:
+    """
+    Marca los snapshots como vencidos y pide una relectura sin esperarla.
+    Devuelve el numero de solicitud para `actualizacion_terminada`.
+    """
+    invalidar_snapshots()
+    with _BLOQUEO_ACTUALIZACION:
+        _ESTADO_ACTUALIZACION["solicitadas"] += 1
+        solicitud = _ESTADO_ACTUALIZACION["solicitadas"]
+        hilo = _ESTADO_ACTUALIZACION["hilo"]
+    if hilo is None or not hilo.is_alive():
+        arrancar_hilo_actualizacion(nombres_hojas, intervalo=0)
+    _EVENTO_ACTUALIZACION.set()
+    return solicitud
+
+
+def actualizacion_terminada(solicitud: int) -> bool:
+    with _BLOQUEO_ACTUALIZACION:
+        return _ESTADO_ACTUALIZACION["completadas"] >= solicitud
+
+
+def errores_actualizacion() -> dict[str, str]:
+    """Hojas cuya ultima relectura fallo y que siguen con la version anterior."""
+    with _BLOQUEO_ACTUALIZACION:
+        return {nombre: error for nombre, error in _ESTADO_ACTUALIZACION["errores"].items() if error}
+
+
+# -----------------------------------------------------------------------------
+# RESUMENES
+# -----------------------------------------------------------------------------
+def hoy_bogota() -> date:
+    try:
+        return datetime.now(ZoneInfo("America/Bogota")).date()
+    except Exception:
+        return datetime.now().date()
+
+
+def normalizar_tipos_resumen(df: pd.DataFrame) -> pd.DataFrame:
+    resultado = df.copy()
+    for columna in ["Barriles", "Latas", "Movimientos"]:
+        if columna in resultado.columns:
+            resultado[columna] = resultado[columna].fillna(0).round().astype(int)
+    for columna in ["Litros barriles", "Litros latas", "Litros totales", "Litros"]:
+        if columna in resultado.columns:
+            resultado[columna] = litros_redondeados(resultado[columna].fillna(0))
+    return resultado
+
+
+def construir_resumen_inventario(
+    inventario_barriles: pd.DataFrame,
+    inventario_latas: pd.DataFrame,
+    umbral_alerta: float,
+) -> pd.DataFrame:
+    if inventario_barriles.empty:
+        resumen_barriles = pd.DataFrame(columns=["Estilo", "Barriles", "Litros barriles"])
+    else:
+        resumen_barriles = (
+            inventario_barriles.groupby("Estilo", as_index=False, observed=True)
+            .agg(Barriles=("Codigo", "count"), **{"Litros barriles": ("Litros", "sum")})
+        )
+
+    if inventario_latas.empty:
+        resumen_latas = pd.DataFrame(columns=["Estilo", "Latas", "Litros latas"])
+    else:
+        resumen_latas = (
+            inventario_latas.groupby("Estilo", as_index=False, observed=True)
+            .agg(Latas=("Disponible", "sum"), **{"Litros latas": ("Litros", "sum")})
+        )
+
+    resumen = pd.merge(resumen_barriles, resumen_latas, on="Estilo", how="outer").fillna(0)
+    if resumen.empty:
+        return resumen
+
+    resumen["Litros totales"] = resumen["Litros barriles"] + resumen["Litros latas"]
+    resumen["Estado inventario"] = resumen["Litros totales"].apply(
+        lambda valor: "\u26A0\uFE0F Bajo" if valor < umbral_alerta else "\u2705 Adecuado"
+    )
+    resumen = normalizar_tipos_resumen(resumen)
+    return resumen.sort_values("Litros totales", ascending=False)
+
+
+def construir_resumen_despachos(cubo: pd.DataFrame) -> pd.DataFrame:
+    """Litros, unidades y movimientos despachados por cliente y estilo."""
+    resumen = (
+        cubo.groupby(["Cliente", "Estilo"], as_index=False, observed=True)
+        .agg(
+            Barriles=("Barriles", "sum"),
+            Latas=("Latas", "sum"),
+            Movimientos=("Movimientos", "sum"),
+            **{
+                "Litros barriles": ("Litros_barriles", "sum"),
+                "Litros latas": ("Litros_latas", "sum"),
+                "Litros totales": ("Litros_totales", "sum"),
+            },
+        )
+        .sort_values("Litros totales", ascending=False)
+    )
+    return normalizar_tipos_resumen(resumen)
+
+
+# -----------------------------------------------------------------------------
+# ALMACEN DE DESPACHOS
+# -----------------------------------------------------------------------------
+# Los despachos se guardan en SQLite una vez por version de los datos; el
+# tablero pide con SQL solo los agregados filtrados, las opciones de los filtros y el
+# detalle del periodo, en vez de mantener la historia completa en memoria.
+COLUMNAS_DESPACHOS = [
+    "Fecha",
+    "Tipo",
+    "Cliente",
+    "Estilo",
+    "Codigo",
+    "Lote",
+    "Barriles",
+    "Latas",
+    "Litros_barriles",
+    "Litros_latas",
+    "Litros_totales",
+    "Responsable",
+    "Observaciones",
+]
+COLUMNAS_NUMERICAS_DESPACHOS = {
+    "Barriles": "INTEGER",
+    "Latas": "REAL",
+    "Litros_barriles": "REAL",
+    "Litros_latas": "REAL",
+    "Litros_totales": "REAL",
+}
+FORMATO_FECHA_ALMACEN = "%Y-%m-%d %H:%M:%S"
+# Agregados que piden los graficos de despachos: columnas del cubo por las que
+# se agrupa y columnas que se suman. Movimientos cuenta las filas.
+VALORES_DESPACHOS = [
+    "Barriles",
+    "Latas",
+    "Litros_barriles",
+    "Litros_latas",
+    "Litros_totales",
+    "Movimientos",
+]
+AGREGADOS_DESPACHOS = {
+    "cliente_estilo": (["Cliente", "Estilo", "Tipo"], VALORES_DESPACHOS),
+    "dia": (["Dia", "Estilo", "Tipo"], ["Litros_totales"]),
+    "hora": (["Dia", "Hora"], ["Litros_totales"]),
+}
+EXPRESIONES_ALMACEN = {
+    "Dia": "substr(Fecha, 1, 10)",
+    "Hora": "CAST(substr(Fecha, 12, 2) AS INTEGER)",
+}
+
+
+def conectar_almacen(ruta: Path | None = None) -> sqlite3.Connection:
+    return sqlite3.connect(ruta or RUTA_ALMACEN_DESPACHOS, timeout=30, isolation_level=None)
+
+
+def version_almacen_despachos(ruta: Path | None = None) -> str | None:
+    ruta = ruta or RUTA_ALMACEN_DESPACHOS
+    if not ruta.exists():
+        return None
+    try:
+        with contextlib.closing(conectar_almacen(ruta)) as conexion:
+            fila = conexion.execute(
+                "SELECT valor FROM almacen_estado WHERE clave = 'version'"
+            ).fetchone()
+    except sqlite3.Error:
+        return None
+    return fila[0] if fila else None
+
+
+def formato_almacen_despachos() -> str:
+    """Definicion de las columnas de la tabla despachos; si cambia se reconstruye."""
+    return ", ".join(
+        f"{columna} {COLUMNAS_NUMERICAS_DESPACHOS.get(columna, 'TEXT')}"
+        for columna in COLUMNAS_DESPACHOS
+    )
+
+
+def filas_almacen_despachos(despachos: pd.DataFrame) -> pd.DataFrame:
+    """Despachos como valores de Python para insertarlos en SQLite (nulos como None)."""
+    datos = despachos[COLUMNAS_DESPACHOS].astype(
+        {columna: "object" for columna in COLUMNAS_DESPACHOS}
+    )
+    datos["Fecha"] = despachos["Fecha"].dt.strftime(FORMATO_FECHA_ALMACEN).astype("object")
+    for columna in COLUMNAS_LITROS:
+        if columna in datos.columns:
+            datos[columna] = litros_redondeados(despachos[columna]).astype("object")
+    return datos.where(despachos[COLUMNAS_DESPACHOS].notna().to_numpy(), None)
+
+
+def continua_fuente_almacen(fuente: list | None, df: pd.DataFrame) -> bool:
+    """Indica si `df` es la version [huella, filas] guardada, tal cual o con filas agregadas."""
+    if fuente is None:
+        return False
+    huella, filas = fuente
+    return (huella == huella_tabla(df) and filas == len(df)) or extiende_version(
+        huella, filas, df
+    )
+
+
+def guardar_almacen_despachos(
+    df_barriles: pd.DataFrame,
+    df_latas: pd.DataFrame,
+    ruta: Path | None = None,
+) -> str:
+    """
+    Lleva el almacen a la version de `df_barriles` y `df_latas` y devuelve esa
+    version. Si cada tabla es la version guardada con filas agregadas al final
+    (segun el linaje de la ingesta) solo se insertan los despachos de esas
+    filas; si cambio el formato de la tabla o una fila anterior se reconstruye.
+    La escritura es una sola transaccion: los lectores ven la version anterior
+    hasta el commit y otro proceso con la misma version no la repite.
+    """
+    ruta = ruta or RUTA_ALMACEN_DESPACHOS
+    version = f"{huella_tabla(df_barriles)}|{huella_tabla(df_latas)}"
+    if version_almacen_despachos(ruta) == version:
+        return version
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    formato = formato_almacen_despachos()
+    tablas = {"barriles": df_barriles, "latas": df_latas}
+
+    with medir_etapa(
+        "guardar_almacen_despachos", len(df_barriles) + len(df_latas)
+    ) as medicion, contextlib.closing(conectar_almacen(ruta)) as conexion:
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute(
+            "CREATE TABLE IF NOT EXISTS almacen_estado (clave TEXT PRIMARY KEY, valor TEXT)"
+        )
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            estado = dict(conexion.execute("SELECT clave, valor FROM almacen_estado"))
+            if estado.get("version") == version:
+                conexion.execute("ROLLBACK")
+                return version
+            fuentes = json.loads(estado.get("fuentes") or "{}")
+            continua = estado.get("formato") == formato and all(
+                continua_fuente_almacen(fuentes.get(nombre), df) for nombre, df in tablas.items()
+            )
+            if continua:
+                despachos = construir_despachos(
+                    *(df.iloc[fuentes[nombre][1]:] for nombre, df in tablas.items())
+                )
+            else:
+                despachos = construir_despachos(df_barriles, df_latas)
+                conexion.execute("DROP TABLE IF EXISTS despachos")
+                conexion.execute(f"CREATE TABLE despachos ({formato})")
+            if not despachos.empty:
+                conexion.executemany(
+                    f"INSERT INTO despachos VALUES ({', '.join('?' * len(COLUMNAS_DESPACHOS))})",
+                    filas_almacen_despachos(despachos).itertuples(index=False, name=None),
+                )
+            conexion.execute("CREATE INDEX IF NOT EXISTS despachos_fecha ON despachos (Fecha)")
+            conexion.execute(
+                "CREATE INDEX IF NOT EXISTS despachos_cliente ON despachos (Cliente, Fecha)"
+            )
+            conexion.execute(
+                "CREATE INDEX IF NOT EXISTS despachos_estilo ON despachos (Estilo, Fecha)"
+            )
+            conexion.executemany(
+                "INSERT OR REPLACE INTO almacen_estado VALUES (?, ?)",
+                [
+                    ("version", version),
+                    ("formato", formato),
+                    (
+                        "fuentes",
+                        json.dumps(
+                            {nombre: [huella_tabla(df), len(df)] for nombre, df in tablas.items()}
+                        ),
+                    ),
+                ],
+            )
+        except BaseException:
+            conexion.execute("ROLLBACK")
+            raise
+        conexion.execute("COMMIT")
+        medicion["filas_salida"] = len(despachos)
+        medicion["incremental"] = continua
+    return version
+
+
+def condiciones_despachos(
+    fecha_inicio: date,
+    fecha_fin: date,
+    clientes: list[str],
+    estilos: list[str],
+    presentacion: str,
+) -> tuple[str, list]:
+    """Clausula WHERE y parametros equivalentes a filtrar_despachos en el tablero."""
+    condiciones = ["Fecha >= ?", "Fecha < ?"]
+    parametros: list = [
+        fecha_inicio.isoformat(),
+        (fecha_fin + pd.Timedelta(days=1)).isoformat(),
+    ]
+    for columna, valores in (("Cliente", clientes), ("Estilo", estilos)):
+        if valores:
+            condiciones.append(f"{columna} IN ({', '.join('?' * len(valores))})")
+            parametros.extend(str(valor) for valor in valores)
+    if presentacion != "Todas":
+        condiciones.append("Tipo = ?")
+        parametros.append(presentacion)
+    return " AND ".join(condiciones), parametros
+
+
+def tipos_resultado_almacen(df: pd.DataFrame) -> pd.DataFrame:
+    """Deja el resultado de SQL con los mismos tipos compactos que las tablas en memoria."""
+    categorias = {
+        columna: "category" for columna in COLUMNAS_CATEGORICAS if columna in df.columns
+    }
+    resultado = compactar_tabla(df, {**categorias, "Tipo": TIPO_PRESENTACION})
+    for columna in ("Codigo", "Observaciones"):
+        if columna in resultado.columns:
+            resultado[columna] = resultado[columna].astype("string")
+    # Los litros que devuelve SQL ya son sumas o salidas: quedan en float64.
+    for columna in COLUMNAS_LITROS:
+        if columna in resultado.columns:
+            resultado[columna] = litros_redondeados(df[columna])
+    return resultado
+
+
+def opciones_filtros_despachos(despachos: pd.DataFrame) -> dict | None:
+    """Rango de fechas, clientes y estilos disponibles para los filtros."""
+    if despachos.empty:
+        return None
+    return {
+        "minimo": despachos["Fecha"].min().date(),
+        "maximo": despachos["Fecha"].max().date(),
+        "clientes": sorted(despachos["Cliente"].dropna().astype(str).unique().tolist()),
+        "estilos": sorted(despachos["Estilo"].dropna().astype(str).unique().tolist()),
+    }
+
+
+def opciones_almacen_despachos(ruta: Path | None = None) -> dict | None:
+    """Lo mismo que opciones_filtros_despachos, leido del almacen."""
+    with contextlib.closing(conectar_almacen(ruta)) as conexion:
+        minimo, maximo = conexion.execute(
+            "SELECT min(Fecha), max(Fecha) FROM despachos"
+        ).fetchone()
+        if minimo is None:
+            return None
+        opciones = {
+            "minimo": datetime.strptime(minimo, FORMATO_FECHA_ALMACEN).date(),
+            "maximo": datetime.strptime(maximo, FORMATO_FECHA_ALMACEN).date(),
+        }
+        for clave, columna in (("clientes", "Cliente"), ("estilos", "Estilo")):
+            opciones[clave] = [
+                valor
+                for (valor,) in conexion.execute(
+                    f"SELECT DISTINCT {columna} FROM despachos "
+                    f"WHERE {columna} IS NOT NULL ORDER BY {columna}"
+                )
+            ]
+    return opciones
+
+
+def agregado_sql(valor: str) -> str:
+    """Expresion SQL de un valor de AGREGADOS_DESPACHOS; los litros con 2 decimales."""
+    if valor == "Movimientos":
+        return "count(*) AS Movimientos"
+    if valor in COLUMNAS_LITROS:
+        return f"round(sum({valor}), 2) AS {valor}"
+    return f"sum({valor}) AS {valor}"
+
+
+def consultar_agregados_despachos(
+    criterios: tuple[date, date, list[str], list[str], str],
+    ruta: Path | None = None,
+) -> dict[str, pd.DataFrame]:
+    """
+    Agregados de los despachos filtrados, calculados en SQL. Cada uno tiene
+    las columnas del cubo que agrupa (ver AGREGADOS_DESPACHOS), asi los
+    graficos los reciben en lugar del cubo completo.
+    """
+    donde, parametros = condiciones_despachos(*criterios)
+    agregados = {}
+    with medir_etapa("consultar_agregados_despachos") as medicion, contextlib.closing(
+        conectar_almacen(ruta)
+    ) as conexion:
+        for nombre, (claves, valores) in AGREGADOS_DESPACHOS.items():
+            seleccion = ", ".join(
+                [f"{EXPRESIONES_ALMACEN.get(clave, clave)} AS {clave}" for clave in claves]
+                + [agregado_sql(valor) for valor in valores]
+            )
+            agregado = pd.read_sql_query(
+                f"SELECT {seleccion} FROM despachos WHERE {donde} "
+                f"GROUP BY {', '.join(claves)} ORDER BY {', '.join(claves)}",
+                conexion,
+                params=parametros,
+            )
+            if "Dia" in agregado.columns:
+                agregado["Dia"] = pd.to_datetime(agregado["Dia"], format="%Y-%m-%d").astype(
+                    "datetime64[ns]"
+                )
+            if "Hora" in agregado.columns:
+                agregado["Hora"] = agregado["Hora"].astype("int8")
+            agregados[nombre] = tipos_resultado_almacen(agregado)
+        medicion["filas_salida"] = sum(len(agregado) for agregado in agregados.values())
+    return agregados
+
+
+def consultar_despachos(
+    criterios: tuple[date, date, list[str], list[str], str],
+    ruta: Path | None = None,
+) -> pd.DataFrame:
+    """Filas de despacho que cumplen los filtros, ordenadas por fecha."""
+    donde, parametros = condiciones_despachos(*criterios)
+    with medir_etapa("consultar_despachos") as medicion, contextlib.closing(
+        conectar_almacen(ruta)
+    ) as conexion:
+        despachos = pd.read_sql_query(
+            f"SELECT * FROM despachos WHERE {donde} ORDER BY Fecha", conexion, params=parametros
+        )
+        despachos["Fecha"] = pd.to_datetime(
+            despachos["Fecha"], format=FORMATO_FECHA_ALMACEN
+        ).astype("datetime64[ns]")
+        despachos = tipos_resultado_almacen(despachos)
+        medicion["filas_salida"] = len(despachos)
+    return despachos
+
+
+def contar_barriles_sin_litros(
+    criterios: tuple[date, date, list[str], list[str], str],
+    ruta: Path | None = None,
+) -> int:
+    """Despachos de barril filtrados cuya capacidad no pudo determinarse."""
+    donde, parametros = condiciones_despachos(*criterios)
+    with contextlib.closing(conectar_almacen(ruta)) as conexion:
+        (cantidad,) = conexion.execute(
+            f"SELECT count(*) FROM despachos WHERE {donde} "
+            "AND Tipo = 'Barril' AND Litros_totales <= 0",
+            parametros,
+        ).fetchone()
+    return int(cantidad)
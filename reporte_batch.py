@@ -0,0 +1,174 @@
+"""
+Reportes programados de inventario y despachos, sin Streamlit.
+
+Lee las hojas con los mismos snapshots e ingesta incremental del tablero y
+escribe los resumenes en Parquet, CSV y/o JSON. Pensado para cron:
+
+    python reporte_batch.py --salida reportes --formatos csv,json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+import pandas as pd
+
+from procesamiento import (
+    HOJA_BARRILES,
+    HOJA_INVENTARIO_LATAS,
+    HOJA_MOVIMIENTOS_LATAS,
+    UMBRAL_ALERTA_PREDETERMINADO,
+    cargar_hojas_concurrentes,
+    construir_cubo_despachos,
+    construir_despachos,
+    construir_resumen_despachos,
+    construir_resumen_inventario,
+    huella_tabla,
+    hoy_bogota,
+    leer_hoja_preparada,
+    obtener_inventario_barriles_actual,
+)
+
+LOGGER = logging.getLogger("reporte_batch")
+FORMATOS = ("parquet", "csv", "json")
+
+
+def escribir_tabla(df: pd.DataFrame, destino: Path, formatos: list[str]) -> list[Path]:
+    """Escribe `df` en cada formato; cada archivo se reemplaza de forma atomica."""
+    escritos = []
+    for formato in formatos:
+        ruta = destino.with_suffix(f".{formato}")
+        temporal = ruta.with_name(f".{ruta.name}.{os.getpid()}.tmp")
+        if formato == "parquet":
+            df.to_parquet(temporal, index=False)
+        elif formato == "csv":
+            df.to_csv(temporal, index=False, encoding="utf-8-sig")
+        else:
+            df.to_json(
+                temporal, orient="records", date_format="iso", force_ascii=False, indent=1
+            )
+        os.replace(temporal, ruta)
+        escritos.append(ruta)
+    return escritos
+
+
+def generar_reportes(
+    salida: Path,
+    formatos: list[str],
+    umbral_alerta: float,
+    desde: date | None,
+    hasta: date | None,
+) -> dict:
+    """Ejecuta lectura, preparacion y resumenes; devuelve el manifiesto escrito."""
+    nombres_hojas = [HOJA_BARRILES, HOJA_MOVIMIENTOS_LATAS, HOJA_INVENTARIO_LATAS]
+
+    def lector(nombre_hoja: str) -> pd.DataFrame:
+        # VLatas solo alimenta los despachos: bastan las filas del periodo.
+        desde_hoja = desde if nombre_hoja == HOJA_MOVIMIENTOS_LATAS else None
+        # Un proceso de cron termina enseguida: no sirve snapshots vencidos.
+        return leer_hoja_preparada(nombre_hoja, servir_vencido=False, desde=desde_hoja)
+
+    hojas = cargar_hojas_concurrentes(nombres_hojas, lector=lector)
+    errores = {nombre: error for nombre, (_, error) in hojas.items() if error}
+    if errores:
+        raise RuntimeError(
+            "No se pudieron cargar las hojas: "
+            + "; ".join(f"{nombre}: {error}" for nombre, error in errores.items())
+        )
+
+    df_barriles = hojas[HOJA_BARRILES][0]
+    df_movimientos_latas = hojas[HOJA_MOVIMIENTOS_LATAS][0]
+    df_inventario_latas = hojas[HOJA_INVENTARIO_LATAS][0]
+
+    inventario_barriles = obtener_inventario_barriles_actual(df_barriles)
+    despachos = construir_despachos(df_barriles, df_movimientos_latas)
+    if desde is not None:
+        despachos = despachos[despachos["Fecha"].ge(pd.Timestamp(desde))]
+    if hasta is not None:
+        despachos = despachos[despachos["Fecha"].lt(pd.Timestamp(hasta) + pd.Timedelta(days=1))]
+    cubo = construir_cubo_despachos(despachos)
+
+    tablas = {
+        "inventario_por_estilo": construir_resumen_inventario(
+            inventario_barriles, df_inventario_latas, umbral_alerta
+        ),
+        "barriles_en_cuarto_frio": inventario_barriles,
+        "latas_disponibles": df_inventario_latas,
+        "despachos_por_cliente_estilo": construir_resumen_despachos(cubo),
+        "despachos_diarios": cubo,
+    }
+
+    salida.mkdir(parents=True, exist_ok=True)
+    archivos = {}
+    for nombre, tabla in tablas.items():
+        rutas = escribir_tabla(tabla, salida / nombre, formatos)
+        archivos[nombre] = {"filas": len(tabla), "archivos": [ruta.name for ruta in rutas]}
+
+    manifiesto = {
+        "generado": datetime.now().isoformat(timespec="seconds"),
+        "fecha_reporte": hoy_bogota().isoformat(),
+        "periodo_despachos": {
+            "desde": desde.isoformat() if desde else None,
+            "hasta": hasta.isoformat() if hasta else None,
+        },
+        "umbral_alerta": umbral_alerta,
+        "versiones": {nombre: huella_tabla(hojas[nombre][0]) for nombre in nombres_hojas},
+        "tablas": archivos,
+    }
+    (salida / "manifiesto.json").write_text(
+        json.dumps(manifiesto, ensure_ascii=False, indent=1), encoding="utf-8"
+    )
+    return manifiesto
+
+
+def leer_argumentos(argumentos: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--salida", type=Path, default=Path("reportes"))
+    parser.add_argument(
+        "--formatos",
+        default=",".join(FORMATOS),
+        help="Lista separada por comas: parquet, csv, json.",
+    )
+    parser.add_argument("--umbral", type=float, default=UMBRAL_ALERTA_PREDETERMINADO)
+    parser.add_argument("--desde", type=date.fromisoformat, help="Fecha inicial AAAA-MM-DD.")
+    parser.add_argument("--hasta", type=date.fromisoformat, help="Fecha final AAAA-MM-DD.")
+    opciones = parser.parse_args(argumentos)
+
+    opciones.formatos = [
+        formato.strip() for formato in opciones.formatos.split(",") if formato.strip()
+    ]
+    desconocidos = sorted(set(opciones.formatos) - set(FORMATOS))
+    if desconocidos or not opciones.formatos:
+        parser.error(f"Formatos no soportados: {', '.join(desconocidos) or '(ninguno)'}")
+    return opciones
+
+
+def main(argumentos: list[str] | None = None) -> int:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    opciones = leer_argumentos(argumentos)
+    inicio = time.perf_counter()
+    try:
+        manifiesto = generar_reportes(
+            opciones.salida, opciones.formatos, opciones.umbral, opciones.desde, opciones.hasta
+        )
+    except Exception as exc:
+        LOGGER.error("No se generaron los reportes: %s", exc)
+        return 1
+
+    LOGGER.info(
+        "Reportes escritos en %s (%d tablas) en %.1f s",
+        opciones.salida,
+        len(manifiesto["tablas"]),
+        time.perf_counter() - inicio,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Mantiene al dia el espejo local de las hojas de Google Sheets.
+
+Descarga las hojas completas y reescribe el espejo Parquet y/o SQLite solo
+cuando su contenido cambio. El tablero y los reportes leen del espejo con
+REPORTES_ORIGEN=parquet o REPORTES_ORIGEN=sqlite. Pensado para cron o como
+proceso aparte:
+
+    python sincronizar_espejo.py --espejos parquet,sqlite
+    python sincronizar_espejo.py --cada 60
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+from procesamiento import (
+    DIRECTORIO_ESPEJO,
+    ESCRITORES_ESPEJO,
+    HOJA_BARRILES,
+    HOJA_INVENTARIO_LATAS,
+    HOJA_MOVIMIENTOS_LATAS,
+    sincronizar_espejo,
+)
+
+LOGGER = logging.getLogger("sincronizar_espejo")
+
+
+def sincronizar_una_vez(espejos: list[str], directorio: Path) -> bool:
+    """Sincroniza todas las hojas; devuelve False si alguna fallo."""
+    nombres_hojas = [HOJA_BARRILES, HOJA_MOVIMIENTOS_LATAS, HOJA_INVENTARIO_LATAS]
+    inicio = time.perf_counter()
+    resultados = sincronizar_espejo(nombres_hojas, espejos, directorio)
+    for nombre_hoja, (actualizados, error) in resultados.items():
+        if error:
+            LOGGER.error("No se pudo sincronizar %s: %s", nombre_hoja, error)
+        elif actualizados:
+            LOGGER.info("%s actualizada en %s", nombre_hoja, ", ".join(actualizados))
+        else:
+            LOGGER.info("%s sin cambios", nombre_hoja)
+    LOGGER.info("Sincronizacion terminada en %.1f s", time.perf_counter() - inicio)
+    return not any(error for _, error in resultados.values())
+
+
+def leer_argumentos(argumentos: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--espejos",
+        default=",".join(ESCRITORES_ESPEJO),
+        help="Lista separada por comas: parquet, sqlite.",
+    )
+    parser.add_argument("--directorio", type=Path, default=DIRECTORIO_ESPEJO)
+    parser.add_argument(
+        "--cada",
+        type=float,
+        default=0,
+        help="Segundos entre sincronizaciones; 0 sincroniza una sola vez.",
+    )
+    opciones = parser.parse_args(argumentos)
+
+    opciones.espejos = [
+        espejo.strip() for espejo in opciones.espejos.split(",") if espejo.strip()
+    ]
+    desconocidos = sorted(set(opciones.espejos) - set(ESCRITORES_ESPEJO))
+    if desconocidos or not opciones.espejos:
+        parser.error(f"Espejos no soportados: {', '.join(desconocidos) or '(ninguno)'}")
+    return opciones
+
+
+def main(argumentos: list[str] | None = None) -> int:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    logging.getLogger("procesamiento.rendimiento").setLevel(logging.WARNING)
+    opciones = leer_argumentos(argumentos)
+    if opciones.cada <= 0:
+        return 0 if sincronizar_una_vez(opciones.espejos, opciones.directorio) else 1
+
+    # En modo continuo un fallo no detiene el proceso: se reintenta en la siguiente vuelta.
+    while True:
+        inicio = time.monotonic()
+        sincronizar_una_vez(opciones.espejos, opciones.directorio)
+        time.sleep(max(opciones.cada - (time.monotonic() - inicio), 0))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import os
+import re
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# La cache en disco de procesamiento se fija al importarlo: se apunta a un
+# directorio temporal antes de que cualquier prueba lo importe.
+os.environ.setdefault("REPORTES_CACHE_DIR", tempfile.mkdtemp(prefix="reportes-pruebas-"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture(autouse=True)
+def reiniciar_estados_del_proceso():
+    """Cada prueba usa sus propias huellas: se olvidan los estados por version."""
+    import procesamiento
+
+    procesamiento._INDICE_ESTADO_BARRILES.clear()
+    procesamiento._VARIACIONES_INVENTARIO.clear()
+    yield
+
+
+# ---- SERVIDOR GVIZ LOCAL ----
+def posicion_letra(letras: str) -> int:
+    posicion = 0
+    for letra in letras:
+        posicion = posicion * 26 + ord(letra) - ord("A") + 1
+    return posicion - 1
+
+
+def responder_consulta(hoja: pd.DataFrame, consulta: str) -> pd.DataFrame:
+    """Subconjunto del lenguaje gviz que usa procesamiento: select, where, limit, offset."""
+    filtro = re.search(r" where (.+?)(?= limit| offset|$)", consulta)
+    if filtro:
+        cumple = np.zeros(len(hoja), dtype=bool)
+        for letra, fecha in re.findall(r"([A-Z]+) >= datetime '([^']+)'", filtro.group(1)):
+            fechas = pd.to_datetime(
+                hoja.iloc[:, posicion_letra(letra)],
+                dayfirst=True,
+                format="mixed",
+                errors="coerce",
+            )
+            cumple |= fechas.ge(pd.Timestamp(fecha)).to_numpy()
+        hoja = hoja[cumple]
+    seleccion = re.search(r"select (.+?)(?= where| limit| offset|$)", consulta)
+    if seleccion and seleccion.group(1).strip() != "*":
+        letras = [letra.strip() for letra in seleccion.group(1).split(",")]
+        hoja = hoja.iloc[:, [posicion_letra(letra) for letra in letras]]
+    limite = re.search(r"limit (\d+)", consulta)
+    if limite:
+        hoja = hoja.iloc[: int(limite.group(1))]
+    desplazamiento = re.search(r"offset (\d+)", consulta)
+    if desplazamiento:
+        hoja = hoja.iloc[int(desplazamiento.group(1)):]
+    return hoja
+
+
+class ServidorGviz:
+    """
+    Servidor HTTP local que responde /gviz/tq como Google Sheets publicado.
+    Las primeras `fallas` solicitudes responden 503, igual que las consultas
+    que contienen algun texto de `rechazadas`.
+    """
+
+    def __init__(self) -> None:
+        self.hojas: dict[str, pd.DataFrame] = {}
+        self.consultas: list[tuple[str, str]] = []
+        self.fallas = 0
+        self.rechazadas: list[str] = []
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                parametros = parse_qs(urlsplit(self.path).query)
+                nombre_hoja = parametros["sheet"][0]
+                consulta = parametros.get("tq", [""])[0]
+                servidor.consultas.append((nombre_hoja, consulta))
+                if servidor.fallas > 0:
+                    servidor.fallas -= 1
+                    falla = True
+                else:
+                    falla = any(texto in consulta for texto in servidor.rechazadas)
+                if falla:
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                cuerpo = (
+                    responder_consulta(servidor.hojas[nombre_hoja], consulta)
+                    .to_csv(index=False)
+                    .encode("utf-8")
+                )
+                self.send_response(200)
+                self.send_header("Content-Type", "text/csv")
+                self.send_header("Content-Length", str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+        self.http = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+        self.url = f"http://127.0.0.1:{self.http.server_address[1]}"
+        threading.Thread(target=self.http.serve_forever, daemon=True).start()
+
+    def consultas_de(self, nombre_hoja: str) -> list[str]:
+        return [consulta for hoja, consulta in self.consultas if hoja == nombre_hoja]
+
+
+@pytest.fixture
+def gviz(monkeypatch, tmp_path):
+    """Servidor gviz local y cache en disco vacia para la prueba."""
+    import procesamiento
+
+    servidor = ServidorGviz()
+    monkeypatch.setattr(procesamiento, "SHEET_BASE_URL", servidor.url)
+    monkeypatch.setattr(procesamiento, "DIRECTORIO_SNAPSHOTS", tmp_path)
+    monkeypatch.setattr(procesamiento, "DIRECTORIO_INGESTA", tmp_path / "ingesta")
+    monkeypatch.setattr(procesamiento, "DIRECTORIO_ESQUEMAS", tmp_path / "esquemas")
+    monkeypatch.setattr(procesamiento, "DIRECTORIO_COMPARTIDO", tmp_path / "preparadas")
+    monkeypatch.setattr(procesamiento, "DIRECTORIO_BLOQUEOS", tmp_path / "bloqueos")
+    yield servidor
+    servidor.http.shutdown()
+    servidor.http.server_close()
+
+
+def hoja_barriles(filas: int, inicio: int = 0) -> pd.DataFrame:
+    """DatosM de prueba con una columna que la preparacion no usa."""
+    posiciones = range(inicio, inicio + filas)
+    return pd.DataFrame(
+        {
+            "Marca temporal": [
+                f"{1 + posicion % 28:02d}/0{1 + posicion // 28 % 9}/2024 10:{posicion % 60:02d}:00"
+                for posicion in posiciones
+            ],
+            "Codigo": [f"{2000 + posicion % 40}" for posicion in posiciones],
+            "Lote": "L1",
+            "Sin usar": "x",
+            "Estilo": ["IPA" if posicion % 2 else "Golden" for posicion in posiciones],
+            "Estado": ["En cuarto frio" if posicion % 3 else "Despachado" for posicion in posiciones],
+            "Cliente": ["" if posicion % 3 else "Tienda" for posicion in posiciones],
+            "Responsable": "Ana",
+            "Observaciones": "",
+            "Capacidad": "20",
+        }
+    )
+
+
+def movimientos_latas(filas: int, inicio: int = 0) -> pd.DataFrame:
+    """Movimientos de latas ya preparados, todos despachos."""
+    posiciones = range(inicio, inicio + filas)
+    return pd.DataFrame(
+        {
+            "Fecha": pd.to_datetime([f"2024-02-{1 + posicion % 28:02d}" for posicion in posiciones]),
+            "Estilo": "IPA",
+            "Cantidad": 24.0,
+            "Lote": "L2",
+            "Cliente": "Tienda",
+            "Responsable": "Ana",
+            "Estado": "Despachado",
+            "Estado_normalizado": "despachado",
+            "Litros": 24 * 0.330,
+        }
+    )
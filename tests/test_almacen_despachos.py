@@ -0,0 +1,106 @@
+import sqlite3
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import procesamiento
+from conftest import hoja_barriles, movimientos_latas
+from procesamiento import (
+    con_huella,
+    con_linaje,
+    consultar_despachos,
+    guardar_almacen_despachos,
+    preparar_barriles,
+)
+
+
+def version_barriles(filas: int, huella: str, linaje: list | None = None) -> pd.DataFrame:
+    return con_linaje(con_huella(preparar_barriles(hoja_barriles(filas)), huella), linaje or [])
+
+
+def contenido_almacen(ruta) -> pd.DataFrame:
+    despachos = consultar_despachos(
+        (date(2000, 1, 1), date(2100, 1, 1), [], [], "Todas"), ruta
+    )
+    return despachos.sort_values(["Fecha", "Tipo", "Codigo"], ignore_index=True)[
+        ["Fecha", "Tipo", "Codigo", "Cliente", "Litros_totales"]
+    ].astype({"Tipo": "object", "Codigo": "object", "Cliente": "object"})
+
+
+def contenido_esperado(df_barriles, df_latas) -> pd.DataFrame:
+    despachos = procesamiento.construir_despachos(df_barriles, df_latas)
+    despachos["Codigo"] = despachos["Codigo"].astype("object")
+    return despachos.sort_values(["Fecha", "Tipo", "Codigo"], ignore_index=True)[
+        ["Fecha", "Tipo", "Codigo", "Cliente", "Litros_totales"]
+    ].astype({"Tipo": "object", "Codigo": "object", "Cliente": "object"})
+
+
+@pytest.fixture
+def filas_construidas(monkeypatch):
+    """Filas de barriles y latas que recibe construir_despachos en cada llamada."""
+    llamadas = []
+    original = procesamiento.construir_despachos
+
+    def construir(df_barriles, df_latas):
+        llamadas.append((len(df_barriles), len(df_latas)))
+        return original(df_barriles, df_latas)
+
+    monkeypatch.setattr(procesamiento, "construir_despachos", construir)
+    return llamadas
+
+
+def test_filas_agregadas_solo_insertan_los_despachos_nuevos(tmp_path, filas_construidas):
+    ruta = tmp_path / "despachos.sqlite"
+    latas = con_huella(movimientos_latas(10), "l1")
+    barriles = version_barriles(60, "b1")
+    guardar_almacen_despachos(barriles, latas, ruta)
+
+    barriles_v2 = version_barriles(75, "b2", [["b1", len(barriles)]])
+    latas_v2 = con_linaje(con_huella(movimientos_latas(13), "l2"), [["l1", 10]])
+    assert guardar_almacen_despachos(barriles_v2, latas_v2, ruta) == "b2|l2"
+
+    assert filas_construidas[-1] == (len(barriles_v2) - len(barriles), 3)
+    pd.testing.assert_frame_equal(
+        contenido_almacen(ruta), contenido_esperado(barriles_v2, latas_v2), check_dtype=False
+    )
+    with sqlite3.connect(ruta) as conexion:
+        indices = {
+            nombre
+            for (nombre,) in conexion.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        }
+    assert {"despachos_fecha", "despachos_cliente", "despachos_estilo"} <= indices
+
+
+def test_fila_anterior_editada_reconstruye(tmp_path, filas_construidas):
+    ruta = tmp_path / "despachos.sqlite"
+    latas = con_huella(movimientos_latas(10), "l1")
+    guardar_almacen_despachos(version_barriles(60, "b1"), latas, ruta)
+
+    # Misma cantidad de filas, otra version sin linaje: se reconstruye completo.
+    editada = preparar_barriles(hoja_barriles(60))
+    editada.loc[editada.index[0], "Cliente"] = "Otro cliente"
+    editada = con_huella(editada, "b2")
+    guardar_almacen_despachos(editada, latas, ruta)
+
+    assert filas_construidas[-1] == (len(editada), 10)
+    pd.testing.assert_frame_equal(
+        contenido_almacen(ruta), contenido_esperado(editada, latas), check_dtype=False
+    )
+
+
+def test_formato_distinto_reconstruye(tmp_path, filas_construidas):
+    ruta = tmp_path / "despachos.sqlite"
+    latas = con_huella(movimientos_latas(10), "l1")
+    barriles = version_barriles(60, "b1")
+    guardar_almacen_despachos(barriles, latas, ruta)
+    with sqlite3.connect(ruta) as conexion:
+        conexion.execute("UPDATE almacen_estado SET valor = 'otro' WHERE clave = 'formato'")
+
+    barriles_v2 = version_barriles(75, "b2", [["b1", len(barriles)]])
+    guardar_almacen_despachos(barriles_v2, latas, ruta)
+
+    assert filas_construidas[-1] == (len(barriles_v2), 10)
+    pd.testing.assert_frame_equal(
+        contenido_almacen(ruta), contenido_esperado(barriles_v2, latas), check_dtype=False
+    )
@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+
+import procesamiento
+from conftest import hoja_barriles, movimientos_latas
+from procesamiento import compactar_tablas_compartidas, con_huella, preparar_barriles
+
+
+@pytest.fixture
+def cache_compartida(monkeypatch, tmp_path):
+    monkeypatch.setattr(procesamiento, "CACHE_COMPARTIDA", True)
+    monkeypatch.setattr(procesamiento, "DIRECTORIO_COMPARTIDO", tmp_path / "preparadas")
+    monkeypatch.setattr(procesamiento, "DIRECTORIO_BLOQUEOS", tmp_path / "bloqueos")
+    return tmp_path / "preparadas"
+
+
+def test_tablas_compactas_se_publican_una_vez(cache_compartida, monkeypatch):
+    barriles = con_huella(preparar_barriles(hoja_barriles(50)), "b1")
+    latas = con_huella(movimientos_latas(10), "l1")
+    compactas = compactar_tablas_compartidas(barriles, latas)
+    assert len(list(cache_compartida.glob("compacta-*.arrow"))) == 2
+
+    # Otro proceso (u otra sesion) mapea lo publicado sin volver a compactar.
+    def no_compactar(*args):
+        raise AssertionError("se volvio a compactar")
+
+    monkeypatch.setattr(procesamiento, "compactar_tabla", no_compactar)
+    publicadas = compactar_tablas_compartidas(barriles, latas)
+    for publicada, compacta in zip(publicadas, compactas):
+        pd.testing.assert_frame_equal(publicada, compacta)
+        assert publicada.attrs["huella"] == compacta.attrs["huella"]
+    # Barriles y latas siguen compartiendo el diccionario de categorias.
+    assert publicadas[0]["Cliente"].dtype == publicadas[1]["Cliente"].dtype
+
+
+def test_compactar_no_modifica_la_tabla_original():
+    barriles = con_huella(preparar_barriles(hoja_barriles(20)), "b1")
+    antes = barriles.copy()
+    compactas = procesamiento.compactar_tabla(
+        barriles, procesamiento.diccionario_categorias([barriles])
+    )
+    assert compactas["Cliente"].dtype == "category"
+    pd.testing.assert_frame_equal(barriles, antes)
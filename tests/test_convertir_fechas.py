@@ -0,0 +1,59 @@
+import pandas as pd
+
+import procesamiento
+from procesamiento import convertir_fechas, preparar_barriles
+
+
+def olvidar_memo() -> None:
+    with procesamiento._BLOQUEO_MEMO_LIMPIEZA:
+        procesamiento._MEMO_LIMPIEZA.clear()
+
+
+FECHAS_MEZCLADAS = {
+    "13/01/2022": pd.Timestamp("2022-01-13"),
+    "13/01/2022 10:24": pd.Timestamp("2022-01-13 10:24"),
+    "2022-01-14 10:24:28": pd.Timestamp("2022-01-14 10:24:28"),
+    "2022-01-15": pd.Timestamp("2022-01-15"),
+    "16/01/2022 8:05:09": pd.Timestamp("2022-01-16 08:05:09"),
+    "2022/01/17 07:30": pd.Timestamp("2022-01-17 07:30"),
+    "44578": pd.Timestamp("2022-01-17"),
+}
+
+
+def test_formatos_mezclados_no_se_pierden():
+    olvidar_memo()
+    # El formato dominante es dia/mes/anio; los demas quedan como restantes.
+    dominantes = [f"{dia:02d}/02/2022 09:00:00" for dia in range(1, 29)] * 10
+    valores = dominantes + list(FECHAS_MEZCLADAS)
+    resultado = convertir_fechas(pd.Series(valores))
+
+    assert resultado.notna().all()
+    obtenidas = dict(zip(valores[len(dominantes):], resultado.iloc[len(dominantes):]))
+    assert obtenidas == FECHAS_MEZCLADAS
+
+
+def test_resultado_no_depende_del_orden_ni_del_lote():
+    olvidar_memo()
+    valores = list(FECHAS_MEZCLADAS)
+    directo = convertir_fechas(pd.Series(valores)).tolist()
+    olvidar_memo()
+    inverso = convertir_fechas(pd.Series(valores[::-1])).tolist()[::-1]
+    olvidar_memo()
+    por_partes = [convertir_fechas(pd.Series([valor])).iloc[0] for valor in valores]
+    assert directo == inverso == por_partes == list(FECHAS_MEZCLADAS.values())
+
+
+def test_preparar_barriles_conserva_filas_con_fechas_mezcladas():
+    olvidar_memo()
+    marcas = ["13/01/2022 10:24:28", "2022-01-13 10:24:28", "14/01/2022", "2022-01-15"] * 50
+    bruto = pd.DataFrame(
+        {
+            "Marca temporal": marcas,
+            "Codigo": [f"{2000 + posicion}" for posicion in range(len(marcas))],
+            "Estilo": "IPA",
+            "Estado": "En cuarto frio",
+            "Cliente": "",
+            "Litros": "20",
+        }
+    ).astype(procesamiento.TIPO_TEXTO)
+    assert len(preparar_barriles(bruto)) == len(marcas)
@@ -0,0 +1,94 @@
+import io
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import procesamiento
+from conftest import hoja_barriles
+from procesamiento import HOJA_BARRILES, descargar_hoja, descargar_tabla, leer_hoja_preparada
+
+
+@pytest.fixture
+def hoja(gviz, monkeypatch):
+    monkeypatch.setattr(procesamiento, "CONSULTA_REDUCIDA", True)
+    gviz.hojas[HOJA_BARRILES] = hoja_barriles(100)
+    return gviz
+
+
+def test_descarga_pide_solo_las_columnas_usadas(hoja):
+    df = descargar_tabla(HOJA_BARRILES)
+
+    assert hoja.consultas_de(HOJA_BARRILES) == [
+        "select * limit 0",
+        "select A, B, C, E, F, G, H, I, J",
+    ]
+    completa = hoja.hojas[HOJA_BARRILES].drop(columns="Sin usar")
+    assert list(df.columns) == list(completa.columns)
+    assert df["Codigo"].tolist() == completa["Codigo"].tolist()
+
+    # Las descargas siguientes usan el encabezado guardado: una sola solicitud.
+    hoja.consultas.clear()
+    descargar_tabla(HOJA_BARRILES)
+    assert hoja.consultas_de(HOJA_BARRILES) == ["select A, B, C, E, F, G, H, I, J"]
+
+
+def test_offset_continua_con_el_encabezado_guardado(hoja):
+    descargar_tabla(HOJA_BARRILES)
+    hoja.consultas.clear()
+
+    df = descargar_tabla(HOJA_BARRILES, offset=90)
+    assert hoja.consultas_de(HOJA_BARRILES) == ["select A, B, C, E, F, G, H, I, J offset 90"]
+    assert df["Codigo"].tolist() == hoja.hojas[HOJA_BARRILES]["Codigo"].iloc[90:].tolist()
+
+
+def test_columna_movida_relee_el_encabezado(hoja):
+    descargar_tabla(HOJA_BARRILES)
+    hoja.consultas.clear()
+    # La columna sin usar pasa al principio: las letras guardadas ya no coinciden.
+    original = hoja.hojas[HOJA_BARRILES]
+    hoja.hojas[HOJA_BARRILES] = original[["Sin usar", *original.columns.drop("Sin usar")]]
+
+    df = descargar_tabla(HOJA_BARRILES, offset=90)
+    assert hoja.consultas_de(HOJA_BARRILES) == [
+        "select A, B, C, E, F, G, H, I, J offset 90",
+        "select * limit 0",
+        "select B, C, D, E, F, G, H, I, J offset 90",
+    ]
+    assert list(df.columns) == list(original.columns.drop("Sin usar"))
+    assert df["Codigo"].tolist() == original["Codigo"].iloc[90:].tolist()
+
+
+def test_consulta_reducida_fallida_descarga_la_hoja_completa(hoja, monkeypatch):
+    monkeypatch.setattr(procesamiento, "ESPERA_BASE_REINTENTO", 0.0)
+    hoja.rechazadas = [" where "]
+
+    df = descargar_tabla(HOJA_BARRILES, desde=date(2024, 1, 5))
+    consultas = hoja.consultas_de(HOJA_BARRILES)
+    assert consultas[-1] == ""
+    assert all(" where " in consulta for consulta in consultas[1:-1])
+    assert list(df.columns) == list(hoja.hojas[HOJA_BARRILES].columns)
+    assert len(df) == 100
+
+
+def test_desde_considera_todas_las_marcas_temporales(hoja):
+    # La fecha de la primera fila solo esta en la segunda columna Marca temporal.
+    datos = hoja_barriles(10)
+    datos.insert(len(datos.columns), "Marca temporal", "", allow_duplicates=True)
+    datos.iloc[0, 0] = ""
+    datos.iloc[0, -1] = "20/01/2024 10:00:00"
+    hoja.hojas[HOJA_BARRILES] = datos
+
+    df = leer_hoja_preparada(HOJA_BARRILES, desde=date(2024, 1, 5))
+    assert " or " in hoja.consultas_de(HOJA_BARRILES)[-1]
+    assert len(df) == 7
+    assert pd.Timestamp("2024-01-20 10:00:00") in set(df["Fecha"])
+
+
+def test_fallas_transitorias_se_reintentan(hoja, monkeypatch):
+    monkeypatch.setattr(procesamiento, "ESPERA_BASE_REINTENTO", 0.0)
+    hoja.fallas = 2
+
+    contenido, _ = descargar_hoja(HOJA_BARRILES)
+    assert len(hoja.consultas_de(HOJA_BARRILES)) == 3
+    assert len(pd.read_csv(io.BytesIO(bytes(contenido)))) == 100
@@ -0,0 +1,65 @@
+import pandas as pd
+
+import procesamiento
+from procesamiento import con_huella, con_linaje, obtener_inventario_barriles_actual
+
+
+def eventos_barriles(filas: list[tuple[str, str, str]]) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "Fecha": pd.to_datetime([fecha for fecha, _, _ in filas]),
+            "Codigo": [codigo for _, codigo, _ in filas],
+            "Estilo": "IPA",
+            "Litros": 20.0,
+            "Estado_normalizado": [estado for _, _, estado in filas],
+        }
+    )
+
+
+def codigos_en_frio(df: pd.DataFrame) -> list[str]:
+    return obtener_inventario_barriles_actual(df)["Codigo"].tolist()
+
+
+FRIO = procesamiento.ESTADO_CUARTO_FRIO
+BASE = [
+    ("2024-01-01", "2001", FRIO),
+    ("2024-01-02", "3001", FRIO),
+    ("2024-01-03", "5801", FRIO),
+]
+
+
+def test_editar_fila_anterior_reconstruye_el_indice():
+    original = con_huella(eventos_barriles(BASE), "v1")
+    assert codigos_en_frio(original) == ["5801", "3001", "2001"]
+
+    # Mismo numero de filas y misma ultima fila: solo cambia una fila anterior.
+    editada = eventos_barriles(BASE)
+    editada.loc[0, "Estado_normalizado"] = "despachado"
+    assert codigos_en_frio(con_huella(editada, "v2")) == ["5801", "3001"]
+
+
+def test_editar_fila_anterior_sin_huella_reconstruye_el_indice():
+    assert codigos_en_frio(eventos_barriles(BASE)) == ["5801", "3001", "2001"]
+    editada = eventos_barriles(BASE)
+    editada.loc[1, "Estado_normalizado"] = "despachado"
+    assert codigos_en_frio(editada) == ["5801", "2001"]
+
+
+def test_filas_agregadas_extienden_el_indice():
+    original = con_huella(eventos_barriles(BASE), "v1")
+    codigos_en_frio(original)
+
+    extendida = eventos_barriles(BASE + [("2024-01-04", "2001", "despachado")])
+    con_linaje(con_huella(extendida, "v2"), [["v1", len(original)]])
+    assert codigos_en_frio(extendida) == ["5801", "3001"]
+    assert procesamiento._INDICE_ESTADO_BARRILES["v2"]["filas"] == 4
+
+
+def test_linaje_que_no_coincide_no_extiende():
+    codigos_en_frio(con_huella(eventos_barriles(BASE), "v1"))
+
+    # Declara extender v1 con otro numero de filas: no es un agregado verificado.
+    editada = eventos_barriles(BASE + [("2024-01-04", "9001", FRIO)])
+    editada.loc[0, "Estado_normalizado"] = "despachado"
+    con_linaje(con_huella(editada, "v3"), [["v1", 2]])
+    assert codigos_en_frio(editada) == ["9001", "5801", "3001"]
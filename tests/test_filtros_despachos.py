@@ -0,0 +1,73 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from procesamiento import TIPO_PRESENTACION, compactar_tabla, diccionario_categorias
+from Rep import construir_indice_filtros, filtrar_despachos
+
+
+def despachos_desordenados() -> pd.DataFrame:
+    """Despachos fuera de orden, con filas en los bordes de los dias."""
+    fechas = [
+        "2024-01-04 23:59:59",
+        "2024-01-01 23:59:59",
+        "2024-01-02 00:00:00",
+        "2024-01-05 00:00:00",
+        "2024-01-03 12:00:00",
+        "2024-01-02 00:00:00",
+        "2024-01-04 00:00:00",
+        "2024-01-03 08:30:00",
+    ]
+    despachos = pd.DataFrame(
+        {
+            "Fecha": pd.to_datetime(fechas),
+            "Tipo": ["Barril", "Lata", "Barril", "Lata", "Lata", "Barril", "Barril", "Lata"],
+            "Cliente": ["A", "B", "C", "A", "B", "A", "C", "B"],
+            "Estilo": ["IPA", "Stout", "IPA", "Golden", "IPA", "Stout", "Golden", "IPA"],
+            "Litros_totales": [20.0, 7.92, 30.0, 3.96, 1.98, 20.0, 50.0, 7.92],
+        }
+    )
+    return compactar_tabla(
+        despachos, {**diccionario_categorias([despachos]), "Tipo": TIPO_PRESENTACION}
+    )
+
+
+def filtrar_con_mascara(df, fecha_inicio, fecha_fin, clientes, estilos, presentacion):
+    mascara = df["Fecha"].ge(pd.Timestamp(fecha_inicio)) & df["Fecha"].lt(
+        pd.Timestamp(fecha_fin) + pd.Timedelta(days=1)
+    )
+    if clientes:
+        mascara &= df["Cliente"].astype(str).isin(clientes)
+    if estilos:
+        mascara &= df["Estilo"].astype(str).isin(estilos)
+    if presentacion != "Todas":
+        mascara &= df["Tipo"].astype(str).eq(presentacion)
+    return df[mascara].sort_values("Fecha", kind="stable")
+
+
+@pytest.mark.parametrize(
+    "criterios",
+    [
+        # Bordes de dia: entra 02 00:00 y 04 23:59:59, quedan fuera 01 23:59:59 y 05 00:00.
+        (date(2024, 1, 2), date(2024, 1, 4), [], [], "Todas"),
+        (date(2024, 1, 1), date(2024, 1, 5), ["A", "B"], ["IPA", "Stout"], "Todas"),
+        (date(2024, 1, 1), date(2024, 1, 5), ["A", "B"], ["IPA", "Stout"], "Barril"),
+        (date(2024, 1, 3), date(2024, 1, 3), ["B"], [], "Lata"),
+        # Valores que no estan en el indice.
+        (date(2024, 1, 1), date(2024, 1, 5), ["A", "Z"], [], "Todas"),
+        (date(2024, 1, 1), date(2024, 1, 5), ["Z"], ["IPA"], "Todas"),
+        # Selecciones vacias: sin filtros, o un rango sin filas.
+        (date(2024, 1, 1), date(2024, 1, 5), [], [], "Todas"),
+        (date(2023, 6, 1), date(2023, 6, 30), [], [], "Todas"),
+        (date(2024, 1, 4), date(2024, 1, 2), [], [], "Todas"),
+    ],
+)
+def test_indice_filtra_igual_que_una_mascara(criterios):
+    despachos = despachos_desordenados()
+    indice = construir_indice_filtros(despachos)
+
+    pd.testing.assert_frame_equal(
+        filtrar_despachos(despachos, indice, *criterios),
+        filtrar_con_mascara(despachos, *criterios),
+    )
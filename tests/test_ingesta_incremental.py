@@ -0,0 +1,81 @@
+import pandas as pd
+import pytest
+
+import procesamiento
+from conftest import hoja_barriles
+from procesamiento import HOJA_BARRILES, leer_hoja_preparada, preparar_barriles
+
+
+@pytest.fixture
+def ingesta(gviz, monkeypatch):
+    """Ingesta de DatosM contra el servidor local, siempre vencida y sin Arrow."""
+    monkeypatch.setattr(procesamiento, "TTL_SNAPSHOT_SEGUNDOS", 0)
+    monkeypatch.setattr(procesamiento, "CACHE_COMPARTIDA", False)
+    gviz.hojas[HOJA_BARRILES] = hoja_barriles(100)
+    return gviz
+
+
+def archivos_ingesta() -> dict[str, int]:
+    return {
+        ruta.name: ruta.stat().st_mtime_ns
+        for ruta in procesamiento.DIRECTORIO_INGESTA.glob("*.parquet")
+    }
+
+
+def preparada_completa(gviz) -> pd.DataFrame:
+    return preparar_barriles(
+        procesamiento.descargar_tabla(HOJA_BARRILES).reset_index(drop=True)
+    )
+
+
+def test_sin_filas_nuevas_no_reescribe_la_tabla(ingesta):
+    leer_hoja_preparada(HOJA_BARRILES)
+    antes = archivos_ingesta()
+    assert list(antes) == ["DatosM.parquet"]
+
+    tabla = leer_hoja_preparada(HOJA_BARRILES)
+    assert archivos_ingesta() == antes
+    assert len(tabla) == 100
+
+
+def test_filas_nuevas_se_guardan_como_parte(ingesta):
+    leer_hoja_preparada(HOJA_BARRILES)
+    base = archivos_ingesta()["DatosM.parquet"]
+
+    ingesta.hojas[HOJA_BARRILES] = pd.concat(
+        [hoja_barriles(100), hoja_barriles(7, inicio=100)], ignore_index=True
+    )
+    tabla = leer_hoja_preparada(HOJA_BARRILES)
+    archivos = archivos_ingesta()
+    assert archivos["DatosM.parquet"] == base
+    assert len(archivos) == 2
+    assert len(tabla) == 107
+
+    # Lo guardado (base mas partes) es lo mismo que preparar la hoja completa.
+    procesamiento._HOJAS_LEIDAS_EN_PROCESO.clear()
+    guardada = procesamiento.leer_tabla_ingerida(
+        HOJA_BARRILES, procesamiento.leer_estado_ingesta(HOJA_BARRILES)
+    )
+    pd.testing.assert_frame_equal(guardada, tabla)
+    pd.testing.assert_frame_equal(
+        guardada.reset_index(drop=True), preparada_completa(ingesta).reset_index(drop=True)
+    )
+
+
+def test_las_partes_se_compactan(ingesta, monkeypatch):
+    monkeypatch.setattr(procesamiento, "LIMITE_PARTES_INGESTA", 2)
+    leer_hoja_preparada(HOJA_BARRILES)
+    filas = 100
+    for _ in range(3):
+        ingesta.hojas[HOJA_BARRILES] = pd.concat(
+            [ingesta.hojas[HOJA_BARRILES], hoja_barriles(5, inicio=filas)], ignore_index=True
+        )
+        filas += 5
+        tabla = leer_hoja_preparada(HOJA_BARRILES)
+
+    # Tercera agregada: habia 2 partes, se compacta y no queda ninguna parte.
+    assert list(archivos_ingesta()) == ["DatosM.parquet"]
+    assert procesamiento.leer_estado_ingesta(HOJA_BARRILES)["partes"] == []
+    pd.testing.assert_frame_equal(
+        tabla.reset_index(drop=True), preparada_completa(ingesta).reset_index(drop=True)
+    )
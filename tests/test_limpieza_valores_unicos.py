@@ -0,0 +1,31 @@
+import pandas as pd
+
+import procesamiento
+from procesamiento import limpiar_texto, normalizar_claves
+
+
+def valores_en_memo(limpiador) -> set:
+    return {
+        valor
+        for clave, memo in procesamiento._MEMO_LIMPIEZA.items()
+        if clave[0] == limpiador.__name__
+        for valor in memo
+    }
+
+
+def test_columna_casi_sin_repetidos_no_pasa_por_el_memo():
+    serie = pd.Series([f"  Observacion {numero} " for numero in range(5_000)])
+    limpias = limpiar_texto(serie)
+    assert limpias.iloc[0] == "Observacion 0"
+    assert not valores_en_memo(limpiar_texto) & set(serie)
+
+
+def test_memo_lleno_descarta_los_valores_mas_antiguos(monkeypatch):
+    monkeypatch.setattr(procesamiento, "LIMITE_MEMO_LIMPIEZA", 3)
+    monkeypatch.setitem(procesamiento._MEMO_LIMPIEZA, ("normalizar_claves", (), ()), {})
+
+    assert normalizar_claves(pd.Series(["En Ruta", "Vacio"] * 10)).iloc[0] == "en ruta"
+    # "En Ruta" ya estaba en el memo y se descarta al agregar dos valores nuevos.
+    claves = normalizar_claves(pd.Series(["En Ruta", "Despachado", "Lleno"] * 10))
+    assert claves.tolist()[:3] == ["en ruta", "despachado", "lleno"]
+    assert valores_en_memo(normalizar_claves) == {"Vacio", "Despachado", "Lleno"}
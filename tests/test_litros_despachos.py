@@ -0,0 +1,74 @@
+from datetime import date
+
+import pandas as pd
+
+from procesamiento import (
+    compactar_tabla,
+    con_huella,
+    construir_cubo_despachos,
+    construir_despachos,
+    construir_resumen_despachos,
+    consultar_agregados_despachos,
+    consultar_despachos,
+    diccionario_categorias,
+    guardar_almacen_despachos,
+)
+from reporte_batch import escribir_tabla
+
+CRITERIOS = (date(2024, 1, 1), date(2024, 1, 31), [], [], "Todas")
+
+
+def despachos_compactos() -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Tres barriles de 155.1 L: en float32 cada uno es 155.100006."""
+    barriles = pd.DataFrame(
+        {
+            "Fecha": pd.to_datetime(["2024-01-02 10:00", "2024-01-02 11:00", "2024-01-03 09:00"]),
+            "Codigo": ["2001", "2002", "2003"],
+            "Estilo": "IPA",
+            "Lote": "L1",
+            "Cliente": "Tienda",
+            "Responsable": "Ana",
+            "Observaciones": "",
+            "Estado_normalizado": "despachado",
+            "Litros": 155.1,
+        }
+    )
+    latas = pd.DataFrame(
+        columns=[
+            "Fecha",
+            "Estilo",
+            "Cantidad",
+            "Lote",
+            "Cliente",
+            "Responsable",
+            "Estado_normalizado",
+            "Litros",
+        ]
+    )
+    categorias = diccionario_categorias([barriles])
+    barriles = con_huella(compactar_tabla(barriles, categorias), "b1")
+    assert barriles["Litros"].dtype == "float32"
+    return barriles, con_huella(latas, "l1")
+
+
+def test_resumen_y_exportacion_sin_ruido_de_float32(tmp_path):
+    cubo = construir_cubo_despachos(construir_despachos(*despachos_compactos()))
+    resumen = construir_resumen_despachos(cubo)
+
+    assert resumen["Litros totales"].dtype == "float64"
+    assert resumen["Litros totales"].tolist() == [465.3]
+    assert cubo["Litros_totales"].tolist() == [155.1, 155.1, 155.1]
+
+    escribir_tabla(resumen, tmp_path / "resumen", ["json", "csv"])
+    assert '"Litros totales":465.3' in (tmp_path / "resumen.json").read_text(encoding="utf-8")
+    assert ",465.3" in (tmp_path / "resumen.csv").read_text(encoding="utf-8-sig")
+
+
+def test_almacen_devuelve_litros_redondeados(tmp_path):
+    ruta = tmp_path / "despachos.sqlite"
+    guardar_almacen_despachos(*despachos_compactos(), ruta)
+
+    agregados = consultar_agregados_despachos(CRITERIOS, ruta)
+    assert agregados["cliente_estilo"]["Litros_totales"].tolist() == [465.3]
+    detalle = consultar_despachos(CRITERIOS, ruta)
+    assert detalle["Litros_totales"].tolist() == [155.1, 155.1, 155.1]
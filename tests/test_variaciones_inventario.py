@@ -0,0 +1,96 @@
+from datetime import date
+
+import pandas as pd
+
+import procesamiento
+from procesamiento import (
+    con_huella,
+    con_linaje,
+    construir_serie_inventario,
+    variaciones_barriles,
+    variaciones_inventario,
+    variaciones_latas,
+)
+
+FRIO = procesamiento.ESTADO_CUARTO_FRIO
+
+
+def eventos_barriles(filas: list[tuple[str, str, str]]) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "Fecha": pd.to_datetime([fecha for fecha, _, _ in filas]),
+            "Codigo": [codigo for _, codigo, _ in filas],
+            "Estilo": "IPA",
+            "Litros": 20.0,
+            "Estado_normalizado": [estado for _, _, estado in filas],
+        }
+    )
+
+
+def movimientos_latas() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "Fecha": pd.to_datetime(["2024-01-01", "2024-01-03"]),
+            "Estilo": "IPA",
+            "Litros": [33.0, 3.3],
+            "Estado_normalizado": ["ingreso", "despachado"],
+        }
+    )
+
+
+INVENTARIO_LATAS = pd.DataFrame({"Estilo": ["IPA"], "Litros": [29.7]})
+BASE = [
+    ("2024-01-01", "2001", FRIO),
+    ("2024-01-02", "3001", FRIO),
+    ("2024-01-03", "5801", FRIO),
+    ("2024-01-04", "3001", "despachado"),
+]
+
+
+def serie(barriles: pd.DataFrame, latas: pd.DataFrame) -> pd.DataFrame:
+    cambios_barriles, cambios_latas = variaciones_inventario(barriles, latas)
+    return construir_serie_inventario(
+        cambios_barriles, cambios_latas, INVENTARIO_LATAS, date(2024, 1, 6)
+    )
+
+
+def serie_desde_cero(barriles: pd.DataFrame, latas: pd.DataFrame) -> pd.DataFrame:
+    return construir_serie_inventario(
+        variaciones_barriles(barriles), variaciones_latas(latas), INVENTARIO_LATAS, date(2024, 1, 6)
+    )
+
+
+def test_editar_fila_no_final_recalcula_la_serie():
+    latas = con_huella(movimientos_latas(), "latas-v1")
+    serie(con_huella(eventos_barriles(BASE), "v1"), latas)
+
+    # Mismo numero de filas y misma ultima fila; cambia el estado de la primera.
+    editada = eventos_barriles(BASE)
+    editada.loc[0, "Estado_normalizado"] = "despachado"
+    con_huella(editada, "v2")
+    pd.testing.assert_frame_equal(serie(editada, latas), serie_desde_cero(editada, latas))
+    resultado = serie(editada, latas)
+    litros_finales = resultado.loc[resultado["Dia"].eq("2024-01-06"), "Litros_barriles"]
+    assert litros_finales.tolist() == [20.0]
+
+
+def test_reingesta_sin_linaje_descarta_las_variaciones_previas():
+    latas = con_huella(movimientos_latas(), "latas-v1")
+    serie(con_huella(eventos_barriles(BASE), "v1"), latas)
+
+    editada = eventos_barriles(BASE + [("2024-01-05", "7001", FRIO)])
+    editada.loc[1, "Estado_normalizado"] = "despachado"
+    con_linaje(con_huella(editada, "v2"), [])
+    pd.testing.assert_frame_equal(serie(editada, latas), serie_desde_cero(editada, latas))
+
+
+def test_filas_agregadas_extienden_las_variaciones():
+    latas = con_huella(movimientos_latas(), "latas-v1")
+    original = con_huella(eventos_barriles(BASE), "v1")
+    serie(original, latas)
+
+    extendida = eventos_barriles(BASE + [("2024-01-05", "7001", FRIO)])
+    con_linaje(con_huella(extendida, "v2"), [["v1", len(original)]])
+    pd.testing.assert_frame_equal(serie(extendida, latas), serie_desde_cero(extendida, latas))
+    estado = procesamiento._VARIACIONES_INVENTARIO[procesamiento.HOJA_BARRILES]["v2"]
+    assert estado["filas"] == 5